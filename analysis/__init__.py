@@ -0,0 +1,9 @@
+from .readout import assignment_fidelity, discriminate_blobs, Discrimination
+from .fitting import (
+    fit_cosine,
+    fit_lorentzian,
+    fit_complex_lorentzian,
+    fit_exponential,
+    least_squares,
+    FitResult,
+)
@@ -0,0 +1,597 @@
+"""
+Batched least-squares fitting.
+
+Every fit takes a shared 1D ``x`` and ``y`` with the points on the last axis
+and any number of leading axes (one trace per qubit or per row of a 2D
+sweep). All traces are fitted together: models and their analytic Jacobians
+are evaluated on the whole stack, and each Levenberg-Marquardt step solves
+one small normal-equation system per trace in a single ``np.linalg.solve``.
+Traces converge independently, so a bad row does not slow the others down.
+"""
+
+from dataclasses import dataclass
+from typing import Callable, Optional, Sequence
+
+import numpy as np
+
+
+@dataclass
+class FitResult:
+    """Fitted parameters and quality metrics (arrays with the batch shape).
+
+    ``params[..., i]`` and ``errors[..., i]`` (one standard error) belong to
+    ``names[i]``; use ``result["frequency"]`` to get one parameter by name.
+    """
+
+    names: Sequence[str]
+    params: np.ndarray
+    errors: np.ndarray
+    r_squared: np.ndarray
+    rmse: np.ndarray
+    success: np.ndarray
+    iterations: int
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.params[..., self.names.index(name)]
+
+    def error(self, name: str) -> np.ndarray:
+        return self.errors[..., self.names.index(name)]
+
+    def row(self, index) -> "FitResult":
+        """The fit of one trace (or a sub-stack) of the batch."""
+        return FitResult(
+            self.names,
+            self.params[index],
+            self.errors[index],
+            self.r_squared[index],
+            self.rmse[index],
+            self.success[index],
+            self.iterations,
+        )
+
+
+def least_squares(
+    model: Callable,
+    jacobian: Callable,
+    x: np.ndarray,
+    y: np.ndarray,
+    p0: np.ndarray,
+    names: Sequence[str],
+    max_iterations: int = 100,
+    tolerance: float = 1e-10,
+) -> FitResult:
+    """Levenberg-Marquardt fit of ``model`` to every trace of ``y`` at once.
+
+    Args:
+        model: ``model(x, p)`` with ``p`` of shape ``(n, n_params)`` returns
+            ``(n, len(x))``.
+        jacobian: ``jacobian(x, p)`` returns ``(n, len(x), n_params)``.
+        p0: initial parameters, shape ``(..., n_params)`` matching ``y``.
+        tolerance: relative decrease of the residual below which a trace
+            counts as converged.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    batch = y.shape[:-1]
+    n_points = y.shape[-1]
+    n_params = len(names)
+
+    y = y.reshape(-1, n_points)
+    p = np.array(p0, dtype=float).reshape(-1, n_params)
+    damping = np.full(len(p), 1e-3)
+    active = np.ones(len(p), dtype=bool)
+    eye = np.eye(n_params)
+
+    cost = np.sum((y - model(x, p)) ** 2, axis=-1)
+    iteration = 0
+    for iteration in range(1, max_iterations + 1):
+        rows = np.flatnonzero(active)
+        if rows.size == 0:
+            break
+
+        residual = y[rows] - model(x, p[rows])
+        J = jacobian(x, p[rows])
+        Jt = J.swapaxes(-1, -2)
+        JtJ = Jt @ J
+        Jtr = (Jt @ residual[..., None])[..., 0]
+
+        scale = np.maximum(np.einsum("bpp->bp", JtJ), 1e-12)
+        A = JtJ + damping[rows, None, None] * scale[:, :, None] * eye
+        step = np.linalg.solve(A, Jtr[..., None])[..., 0]
+
+        trial = p[rows] + step
+        trial_cost = np.sum((y[rows] - model(x, trial)) ** 2, axis=-1)
+
+        better = np.isfinite(trial_cost) & (trial_cost <= cost[rows])
+        accepted = rows[better]
+        converged = better & (
+            cost[rows] - trial_cost <= tolerance * np.maximum(cost[rows], 1e-300)
+        )
+
+        p[accepted] = trial[better]
+        cost[accepted] = trial_cost[better]
+        damping[accepted] = np.maximum(damping[accepted] / 10, 1e-12)
+        damping[rows[~better]] *= 10
+
+        active[rows[converged]] = False
+        # Stuck rows: the step no longer changes anything at any damping.
+        active[rows[damping[rows] > 1e12]] = False
+
+    # Quality of fit and parameter uncertainties from the final Jacobian.
+    J = jacobian(x, p)
+    JtJ = J.swapaxes(-1, -2) @ J
+    dof = max(n_points - n_params, 1)
+    variance = cost / dof
+    covariance = np.linalg.pinv(JtJ) * variance[:, None, None]
+    errors = np.sqrt(np.abs(np.einsum("bpp->bp", covariance)))
+
+    total = np.sum((y - y.mean(axis=-1, keepdims=True)) ** 2, axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r_squared = np.where(total > 0, 1 - cost / total, 1.0)
+    success = (
+        ~active & np.all(np.isfinite(p), axis=-1) & np.all(np.isfinite(errors), axis=-1)
+    )
+
+    return FitResult(
+        names=tuple(names),
+        params=p.reshape(*batch, n_params),
+        errors=errors.reshape(*batch, n_params),
+        r_squared=r_squared.reshape(batch),
+        rmse=np.sqrt(cost / n_points).reshape(batch),
+        success=success.reshape(batch),
+        iterations=iteration,
+    )
+
+
+# --------------------
+# COSINE
+# --------------------
+COSINE = ("amplitude", "frequency", "phase", "offset")
+
+
+def cosine(x, amplitude, frequency, phase, offset):
+    """``amplitude * cos(2 pi frequency x + phase) + offset``."""
+    return amplitude * np.cos(2 * np.pi * frequency * x + phase) + offset
+
+
+def _cosine_model(x, p):
+    a, f, phi, c = (p[:, i, None] for i in range(4))
+    return a * np.cos(2 * np.pi * f * x + phi) + c
+
+
+def _cosine_jacobian(x, p):
+    a, f, phi = (p[:, i, None] for i in range(3))
+    theta = 2 * np.pi * f * x + phi
+    cos, sin = np.cos(theta), np.sin(theta)
+    J = np.empty(theta.shape + (4,))
+    J[..., 0] = cos
+    J[..., 1] = -a * sin * 2 * np.pi * x
+    J[..., 2] = -a * sin
+    J[..., 3] = 1.0
+    return J
+
+
+def _linear_cosine(x, y, frequency):
+    """Best amplitude, phase and offset for fixed frequencies, with the residual.
+
+    ``y`` is ``(n, len(x))`` and ``frequency`` is ``(n, k)``: ``k`` candidate
+    frequencies per trace, each solved as a 3-parameter linear least squares.
+    """
+    theta = 2 * np.pi * frequency[..., None] * x
+    cos, sin = np.cos(theta), np.sin(theta)
+    y = y[:, None]
+
+    # Normal equations of the basis (cos, sin, 1), summed directly.
+    Sc, Ss, Scc, Sss, Scs = (
+        np.sum(v, axis=-1) for v in (cos, sin, cos * cos, sin * sin, cos * sin)
+    )
+    n = np.full_like(Sc, len(x))
+    BtB = np.stack(
+        [
+            np.stack([Scc, Scs, Sc], axis=-1),
+            np.stack([Scs, Sss, Ss], axis=-1),
+            np.stack([Sc, Ss, n], axis=-1),
+        ],
+        axis=-2,
+    ) + 1e-12 * np.eye(3)
+    Bty = np.stack(
+        [np.sum(cos * y, -1), np.sum(sin * y, -1), np.broadcast_to(np.sum(y, -1), Sc.shape)],
+        axis=-1,
+    )
+    coef = np.linalg.solve(BtB, Bty[..., None])[..., 0]
+    fitted = coef[..., 0, None] * cos + coef[..., 1, None] * sin + coef[..., 2, None]
+    residual = np.sum((fitted - y) ** 2, axis=-1)
+
+    amplitude = np.hypot(coef[..., 0], coef[..., 1])
+    phase = np.arctan2(-coef[..., 1], coef[..., 0])
+    return amplitude, phase, coef[..., 2], residual
+
+
+def cosine_seed(x, y, frequency: Optional[float] = None) -> np.ndarray:
+    """Initial cosine parameters for every trace of ``y`` (shape ``(..., 4)``).
+
+    The frequency comes from the peak of the zero-padded FFT of each trace
+    (``x`` must be evenly spaced), or from ``frequency`` when given. Traces
+    shorter than a period have no FFT peak, so a few sub-period frequencies
+    are tried as well. For every candidate, amplitude, phase and offset
+    follow from a linear least-squares projection; the candidate with the
+    smallest residual wins.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    batch = y.shape[:-1]
+    y = y.reshape(-1, y.shape[-1])
+    n_points = len(x)
+    span = x[-1] - x[0]
+
+    if frequency is not None:
+        candidates = np.full((len(y), 1), float(frequency))
+    else:
+        n_fft = 1 << int(np.ceil(np.log2(8 * n_points)))
+        spectrum = np.abs(np.fft.rfft(y - y.mean(axis=-1, keepdims=True), n_fft))
+        peak = 1 + np.argmax(spectrum[:, 1:], axis=-1)
+        peak_frequency = peak / (n_fft * (x[1] - x[0]))
+        candidates = np.concatenate(
+            [
+                peak_frequency[:, None],
+                np.broadcast_to(np.array([0.25, 0.5]) / span, (len(y), 2)),
+            ],
+            axis=-1,
+        )
+
+    amplitude, phase, offset, residual = _linear_cosine(x, y, candidates)
+    best = np.argmin(residual, axis=-1)[:, None]
+    pick = lambda a: np.take_along_axis(a, best, axis=-1)[:, 0]
+    seed = np.stack(
+        [pick(amplitude), pick(candidates), pick(phase), pick(offset)], axis=-1
+    )
+    return seed.reshape(*batch, 4)
+
+
+def fit_cosine(
+    x, y, frequency: Optional[float] = None, max_iterations: int = 100
+) -> FitResult:
+    """Fit ``amplitude * cos(2 pi frequency x + phase) + offset`` to every trace.
+
+    The amplitude is returned positive and the phase wrapped to ``(-pi, pi]``.
+    """
+    fit = least_squares(
+        _cosine_model,
+        _cosine_jacobian,
+        x,
+        y,
+        cosine_seed(x, y, frequency),
+        COSINE,
+        max_iterations,
+    )
+
+    # Canonical form: positive amplitude and frequency.
+    p = fit.params
+    flip = p[..., 0] < 0
+    p[..., 2] += np.pi * flip
+    p[..., 0] = np.abs(p[..., 0])
+    negative = p[..., 1] < 0
+    p[..., 1] = np.abs(p[..., 1])
+    p[..., 2] = np.where(negative, -p[..., 2], p[..., 2])
+    p[..., 2] = np.angle(np.exp(1j * p[..., 2]))
+    return fit
+
+
+# --------------------
+# LORENTZIAN
+# --------------------
+LORENTZIAN = ("amplitude", "center", "fwhm", "offset")
+COMPLEX_LORENTZIAN = (
+    "center",
+    "fwhm",
+    "background_re",
+    "background_im",
+    "amplitude_re",
+    "amplitude_im",
+)
+
+
+def lorentzian(x, amplitude, center, fwhm, offset):
+    """``amplitude / (1 + (2 (x - center) / fwhm)^2) + offset``."""
+    return amplitude / (1 + (2 * (x - center) / fwhm) ** 2) + offset
+
+
+def complex_lorentzian(x, center, fwhm, background, amplitude):
+    """``background + amplitude / (1 + 2i (x - center) / fwhm)``: a circle in IQ."""
+    return background + amplitude / (1 + 2j * (x - center) / fwhm)
+
+
+def _normalize(x):
+    """``x`` mapped to about ``[-1, 1]`` (fits in Hz are badly conditioned)."""
+    x = np.asarray(x, dtype=float)
+    mid = 0.5 * (x.max() + x.min())
+    scale = 0.5 * (x.max() - x.min()) or 1.0
+    return (x - mid) / scale, mid, scale
+
+
+def _lorentzian_model(x, p):
+    a, x0, w, c = (p[:, i, None] for i in range(4))
+    return a / (1 + (2 * (x - x0) / w) ** 2) + c
+
+
+def _lorentzian_jacobian(x, p):
+    a, x0, w = (p[:, i, None] for i in range(3))
+    u = 2 * (x - x0) / w
+    denominator = 1 + u**2
+    J = np.empty(u.shape + (4,))
+    J[..., 0] = 1 / denominator
+    J[..., 1] = 4 * a * u / (w * denominator**2)
+    J[..., 2] = 2 * a * u**2 / (w * denominator**2)
+    J[..., 3] = 1.0
+    return J
+
+
+def _peak_seed(x, y):
+    """Seed from the largest excursion from the median and its half width."""
+    offset = np.median(y, axis=-1)
+    excursion = y - offset[:, None]
+    peak = np.argmax(np.abs(excursion), axis=-1)
+    amplitude = np.take_along_axis(excursion, peak[:, None], axis=-1)[:, 0]
+    above = np.abs(excursion) >= 0.5 * np.abs(amplitude)[:, None]
+    spacing = np.abs(np.diff(x)).mean()
+    fwhm = np.maximum(above.sum(axis=-1), 2) * spacing
+    return np.stack([amplitude, x[peak], fwhm, offset], axis=-1)
+
+
+def _algebraic_seed(x, y):
+    """Seed from a linear least-squares fit of the linearized Lorentzian.
+
+    ``(y - c) ((x - x0)^2 + g^2) = A g^2`` rearranges to
+    ``y x^2 = c x^2 - 2 c x0 x + k + 2 x0 x y - (x0^2 + g^2) y``,
+    which is linear in its five coefficients.
+    """
+    basis = np.stack(
+        np.broadcast_arrays(x**2, x, np.ones_like(x), x * y, y), axis=-1
+    )
+    Bt = basis.swapaxes(-1, -2)
+    coef = np.linalg.solve(
+        Bt @ basis + 1e-12 * np.eye(5), Bt @ (y * x**2)[..., None]
+    )[..., 0]
+    offset = coef[:, 0]
+    center = coef[:, 3] / 2
+    gamma2 = -coef[:, 4] - center**2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        amplitude = (coef[:, 2] - offset * (center**2 + gamma2)) / gamma2
+        fwhm = 2 * np.sqrt(gamma2)
+    return np.stack([amplitude, center, fwhm, offset], axis=-1)
+
+
+def lorentzian_seed(x, y) -> np.ndarray:
+    """Initial Lorentzian parameters for every trace (normalized ``x``).
+
+    Both the algebraic (linear least squares) seed and the peak seed are
+    evaluated, and the one closer to the data is kept.
+    """
+    seeds = [_algebraic_seed(x, y), _peak_seed(x, y)]
+    costs = []
+    for seed in seeds:
+        with np.errstate(all="ignore"):
+            cost = np.sum((y - _lorentzian_model(x, seed)) ** 2, axis=-1)
+        valid = np.all(np.isfinite(seed), axis=-1) & (seed[:, 2] > 0)
+        costs.append(np.where(valid & np.isfinite(cost), cost, np.inf))
+    return np.where((costs[0] <= costs[1])[:, None], seeds[0], seeds[1])
+
+
+def fit_lorentzian(x, y, max_iterations: int = 100) -> FitResult:
+    """Fit a Lorentzian peak or dip (``amplitude < 0``) to every trace of ``y``.
+
+    Parameters and errors are returned in the units of ``x``; ``fwhm`` is the
+    full width at half maximum.
+    """
+    y = np.asarray(y, dtype=float)
+    batch = y.shape[:-1]
+    u, mid, scale = _normalize(x)
+    rows = y.reshape(-1, y.shape[-1])
+
+    fit = least_squares(
+        _lorentzian_model,
+        _lorentzian_jacobian,
+        u,
+        rows,
+        lorentzian_seed(u, rows),
+        LORENTZIAN,
+        max_iterations,
+    )
+
+    p, e = fit.params, fit.errors
+    p[:, 2] = np.abs(p[:, 2])
+    p[:, 1] = mid + scale * p[:, 1]
+    p[:, 2] *= scale
+    e[:, 1:3] *= scale
+    return FitResult(
+        fit.names,
+        p.reshape(*batch, 4),
+        e.reshape(*batch, 4),
+        fit.r_squared.reshape(batch),
+        fit.rmse.reshape(batch),
+        fit.success.reshape(batch),
+        fit.iterations,
+    )
+
+
+def _complex_lorentzian_model(x, p):
+    x0, w, bg_re, bg_im, a_re, a_im = (p[:, i, None] for i in range(6))
+    z = (bg_re + 1j * bg_im) + (a_re + 1j * a_im) / (1 + 2j * (x - x0) / w)
+    return np.concatenate([z.real, z.imag], axis=-1)
+
+
+def _complex_lorentzian_jacobian(x, p):
+    x0, w, _, _, a_re, a_im = (p[:, i, None] for i in range(6))
+    u = 2 * (x - x0) / w
+    response = 1 / (1 + 1j * u)
+    dz = np.empty(u.shape + (6,), dtype=complex)
+    dz[..., 0] = 2j * (a_re + 1j * a_im) * response**2 / w
+    dz[..., 1] = 1j * (a_re + 1j * a_im) * u * response**2 / w
+    dz[..., 2] = 1.0
+    dz[..., 3] = 1j
+    dz[..., 4] = response
+    dz[..., 5] = 1j * response
+    return np.concatenate([dz.real, dz.imag], axis=-2)
+
+
+def complex_lorentzian_seed(x, z) -> np.ndarray:
+    """Seed from a complex linear least-squares fit (normalized ``x``).
+
+    ``(z - b)(w + 2i (x - x0)) = A w`` rearranges to
+    ``z x = d1 z + d2 + b x`` with ``d1 = x0 + i w / 2``, which is linear in
+    the complex unknowns ``d1``, ``d2`` and ``b``.
+    """
+    basis = np.stack(np.broadcast_arrays(z, np.ones_like(z), x + 0j), axis=-1)
+    Bh = basis.conj().swapaxes(-1, -2)
+    d1, d2, background = np.moveaxis(
+        np.linalg.solve(Bh @ basis + 1e-12 * np.eye(3), Bh @ (z * x)[..., None])[
+            ..., 0
+        ],
+        -1,
+        0,
+    )
+    center = d1.real
+    fwhm = 2 * d1.imag
+    with np.errstate(divide="ignore", invalid="ignore"):
+        amplitude = (2j * d2 - background * (fwhm - 2j * center)) / fwhm
+
+    # Fall back to the largest excursion from the background if degenerate.
+    peak = np.argmax(np.abs(z - np.median(z.real, -1)[:, None]), axis=-1)
+    bad = ~np.isfinite(amplitude) | ~(fwhm > 0)
+    center = np.where(bad, x[peak], center)
+    fwhm = np.where(bad, 0.2, fwhm)
+    background = np.where(bad, np.mean(z, axis=-1), background)
+    amplitude = np.where(
+        bad, np.take_along_axis(z, peak[:, None], -1)[:, 0] - background, amplitude
+    )
+    return np.stack(
+        [
+            center,
+            fwhm,
+            background.real,
+            background.imag,
+            amplitude.real,
+            amplitude.imag,
+        ],
+        axis=-1,
+    )
+
+
+def fit_complex_lorentzian(x, z, max_iterations: int = 100) -> FitResult:
+    """Fit ``background + amplitude / (1 + 2i (x - center) / fwhm)`` to IQ traces.
+
+    The resonance traces a circle in the IQ plane; fitting I and Q together
+    uses the phase as well as the magnitude and pins the center more tightly
+    than a fit of ``|z|``. The cable delay must have been removed from ``z``.
+    """
+    z = np.asarray(z, dtype=complex)
+    batch = z.shape[:-1]
+    u, mid, scale = _normalize(x)
+    rows = z.reshape(-1, z.shape[-1])
+
+    fit = least_squares(
+        _complex_lorentzian_model,
+        _complex_lorentzian_jacobian,
+        u,
+        np.concatenate([rows.real, rows.imag], axis=-1),
+        complex_lorentzian_seed(u, rows),
+        COMPLEX_LORENTZIAN,
+        max_iterations,
+    )
+
+    p, e = fit.params, fit.errors
+    p[:, 1] = np.abs(p[:, 1])
+    p[:, 0] = mid + scale * p[:, 0]
+    p[:, 1] *= scale
+    e[:, 0:2] *= scale
+    return FitResult(
+        fit.names,
+        p.reshape(*batch, 6),
+        e.reshape(*batch, 6),
+        fit.r_squared.reshape(batch),
+        fit.rmse.reshape(batch),
+        fit.success.reshape(batch),
+        fit.iterations,
+    )
+
+
+# --------------------
+# EXPONENTIAL
+# --------------------
+EXPONENTIAL = ("amplitude", "decay", "offset")
+
+
+def exponential(x, amplitude, decay, offset):
+    """``amplitude * exp(-x / decay) + offset``."""
+    return amplitude * np.exp(-x / decay) + offset
+
+
+def _exponential_model(x, p):
+    a, tau, c = (p[:, i, None] for i in range(3))
+    return a * np.exp(-x / tau) + c
+
+
+def _exponential_jacobian(x, p):
+    a, tau = (p[:, i, None] for i in range(2))
+    e = np.exp(-x / tau) * np.ones_like(a)
+    J = np.empty(e.shape + (3,))
+    J[..., 0] = e
+    J[..., 1] = a * e * x / tau**2
+    J[..., 2] = 1.0
+    return J
+
+
+def exponential_seed(x, y) -> np.ndarray:
+    """Initial parameters from the tail (offset) and the area under the decay.
+
+    For a decay sampled past a few time constants, the area between the
+    trace and its offset is ``amplitude * decay`` at the first point.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    tail = max(len(x) // 10, 1)
+    offset = y[..., -tail:].mean(axis=-1)
+    start = y[..., 0] - offset
+    above = y - offset[..., None]
+    area = np.sum(0.5 * (above[..., 1:] + above[..., :-1]) * np.diff(x), axis=-1)
+    span = np.ptp(x) or 1.0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        decay = np.clip(np.abs(area / start), span / 100, 10 * span)
+    decay = np.where(np.isfinite(decay), decay, span / 3)
+    amplitude = start * np.exp(x[0] / decay)
+    return np.stack([amplitude, decay, offset], axis=-1)
+
+
+def fit_exponential(x, y, max_iterations: int = 100) -> FitResult:
+    """Fit an exponential decay (or rise, ``amplitude < 0``) to every trace.
+
+    ``decay`` and its error are returned in the units of ``x``.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    batch = y.shape[:-1]
+    scale = np.max(np.abs(x)) or 1.0
+    rows = y.reshape(-1, y.shape[-1])
+
+    fit = least_squares(
+        _exponential_model,
+        _exponential_jacobian,
+        x / scale,
+        rows,
+        exponential_seed(x / scale, rows),
+        EXPONENTIAL,
+        max_iterations,
+    )
+
+    p, e = fit.params, fit.errors
+    p[:, 1] *= scale
+    e[:, 1] *= scale
+    return FitResult(
+        fit.names,
+        p.reshape(*batch, 3),
+        e.reshape(*batch, 3),
+        fit.r_squared.reshape(batch),
+        fit.rmse.reshape(batch),
+        fit.success.reshape(batch),
+        fit.iterations,
+    )
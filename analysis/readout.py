@@ -0,0 +1,193 @@
+"""
+Vectorized single-shot readout analysis.
+
+All functions accept arrays whose last axis holds the single shots and any
+number of leading axes (e.g. one row per readout amplitude or per integration
+length). Rotations and confusion matrices are computed for the whole batch at
+once; the optimal threshold is searched row by row (see ``_best_threshold``).
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+
+
+METHODS = ("mean", "lda", "pca")
+
+
+@dataclass
+class Discrimination:
+    """Result of a two-state discrimination (arrays with the batch shape).
+
+    ``confusion[..., i, j]`` is the probability of measuring ``j`` when ``i``
+    was prepared, with 0 = ground and 1 = excited, i.e. ``[[gg, ge], [eg, ee]]``.
+    """
+
+    angle: np.ndarray
+    threshold: np.ndarray
+    fidelity: np.ndarray
+    confusion: np.ndarray
+    method: str = "mean"
+
+    @property
+    def gg(self):
+        return self.confusion[..., 0, 0]
+
+    @property
+    def ge(self):
+        return self.confusion[..., 0, 1]
+
+    @property
+    def eg(self):
+        return self.confusion[..., 1, 0]
+
+    @property
+    def ee(self):
+        return self.confusion[..., 1, 1]
+
+    def rotate(self, I, Q):
+        """``(I, Q)`` in the rotated frame where the states separate along ``I``."""
+        z = (np.asarray(I) + 1j * np.asarray(Q)) * np.exp(1j * np.asarray(self.angle))[
+            ..., None
+        ]
+        return z.real, z.imag
+
+
+def _axis(zg, ze, method: str):
+    """Complex unit-free direction along which the two blobs are separated."""
+    separation = ze.mean(axis=-1) - zg.mean(axis=-1)
+    if method == "mean":
+        return separation
+
+    if method == "lda":
+        # Fisher direction: pooled within-class covariance^-1 @ separation.
+        dg = zg - zg.mean(axis=-1, keepdims=True)
+        de = ze - ze.mean(axis=-1, keepdims=True)
+        a = (dg.real**2).mean(-1) + (de.real**2).mean(-1)
+        b = (dg.real * dg.imag).mean(-1) + (de.real * de.imag).mean(-1)
+        c = (dg.imag**2).mean(-1) + (de.imag**2).mean(-1)
+        dI, dQ = separation.real, separation.imag
+        return (c * dI - b * dQ) + 1j * (a * dQ - b * dI)
+
+    if method == "pca":
+        # Principal axis of the combined cloud, oriented from ground to excited.
+        z = np.concatenate([zg, ze], axis=-1)
+        d = z - z.mean(axis=-1, keepdims=True)
+        a = (d.real**2).mean(-1)
+        b = (d.real * d.imag).mean(-1)
+        c = (d.imag**2).mean(-1)
+        axis = np.exp(0.5j * np.arctan2(2 * b, a - c))
+        return np.where((axis.conj() * separation).real < 0, -axis, axis)
+
+    raise ValueError(f"Unknown discrimination method '{method}', use one of {METHODS}")
+
+
+def _row_threshold(g, e, bins: int):
+    """Threshold of one row: histogram search, then a scan of the nearby shots."""
+    n_g, n_e = len(g), len(e)
+    lo = min(g.min(), e.min())
+    hi = max(g.max(), e.max())
+    if hi <= lo:
+        return lo, 50.0
+    width = (hi - lo) / bins
+
+    def histogram(x):
+        index = np.minimum(((x - lo) / width).astype(np.intp), bins - 1)
+        return np.cumsum(np.bincount(index, minlength=bins))
+
+    ground_below = histogram(g)
+    excited_below = histogram(e)
+    k = int(np.argmax(ground_below / n_g - excited_below / n_e))
+
+    # Exact scan over the shots of the bins around the coarse optimum.
+    first = max(k - 1, 0)
+    last = min(k + 1, bins - 1)
+    a = lo + first * width
+    b = lo + (last + 1) * width
+    g0 = ground_below[first - 1] if first > 0 else 0
+    e0 = excited_below[first - 1] if first > 0 else 0
+    g_local = g[(g >= a) & (g < b)] if last < bins - 1 else g[g >= a]
+    e_local = e[(e >= a) & (e < b)] if last < bins - 1 else e[e >= a]
+
+    values = np.concatenate([g_local, e_local])
+    order = np.argsort(values, kind="stable")
+    sorted_values = values[order]
+    is_ground = order < len(g_local)
+
+    # Candidate thresholds: the window start, then just above each local shot.
+    ground = g0 + np.concatenate([[0], np.cumsum(is_ground)])
+    excited = e0 + np.concatenate([[0], np.cumsum(~is_ground)])
+    score = 0.5 * (ground / n_g + 1 - excited / n_e)
+    best = int(np.argmax(score))
+
+    if best == 0:
+        threshold = a
+    elif best < len(sorted_values):
+        threshold = 0.5 * (sorted_values[best - 1] + sorted_values[best])
+    else:
+        threshold = sorted_values[-1]
+    return threshold, 100 * score[best]
+
+
+def _best_threshold(g, e, bins: int = 4096):
+    """Near-optimal threshold between two 1D distributions for every row.
+
+    Rows are handled one at a time. In each, a cumulative histogram of
+    ``bins`` bins locates the optimum in O(n), and only the shots of the bin
+    it falls in and its two neighbours are sorted to place the threshold
+    between shots. The cost stays linear even for millions of shots.
+
+    The result is not always the exact optimum of a full sort. When the
+    histogram picks a bin next to the true one, the threshold can end one
+    shot short of it. That costs half of one shot's share of fidelity: at
+    most 0.025 percentage points on rows of 2000 shots per state.
+    """
+    batch = g.shape[:-1]
+    g_rows = g.reshape(-1, g.shape[-1])
+    e_rows = e.reshape(-1, e.shape[-1])
+
+    threshold = np.empty(len(g_rows))
+    fidelity = np.empty(len(g_rows))
+    for i, (g_row, e_row) in enumerate(zip(g_rows, e_rows)):
+        threshold[i], fidelity[i] = _row_threshold(g_row, e_row, bins)
+    return threshold.reshape(batch), fidelity.reshape(batch)
+
+
+def discriminate_blobs(Ig, Qg, Ie, Qe, method: str = "lda") -> Discrimination:
+    """Rotation, optimal threshold and confusion matrix of a batch of IQ blobs.
+
+    ``method`` selects the rotation: ``"mean"`` aligns the axis with the
+    difference of the blob centres (as ``two_state_discriminator`` does),
+    ``"lda"`` uses Fisher's linear discriminant, which accounts for elongated
+    or unequal blobs, and ``"pca"`` uses the principal axis of all shots.
+    """
+    zg = np.asarray(Ig) + 1j * np.asarray(Qg)
+    ze = np.asarray(Ie) + 1j * np.asarray(Qe)
+
+    angle = np.mod(-np.angle(_axis(zg, ze, method)), 2 * np.pi)
+    rotation = np.exp(1j * angle)[..., None]
+    g = (zg * rotation).real
+    e = (ze * rotation).real
+
+    threshold, fidelity = _best_threshold(g, e)
+
+    ge = (g > np.asarray(threshold)[..., None]).mean(axis=-1)
+    ee = (e > np.asarray(threshold)[..., None]).mean(axis=-1)
+    confusion = np.stack(
+        [np.stack([1 - ge, ge], axis=-1), np.stack([1 - ee, ee], axis=-1)], axis=-2
+    )
+    return Discrimination(angle, threshold, fidelity, confusion, method)
+
+
+def assignment_fidelity(Ig, Qg, Ie, Qe):
+    """Optimal two-state discrimination of every row of a batch of IQ blobs.
+
+    Follows the conventions of ``qualang_tools``' ``two_state_discriminator``:
+    the IQ plane is rotated by ``angle`` so the blobs separate along ``I``, the
+    excited state lies above ``threshold`` and ``fidelity`` is in percent.
+
+    Returns:
+        angle, threshold, fidelity: arrays with the leading shape of the inputs.
+    """
+    result = discriminate_blobs(Ig, Qg, Ie, Qe, method="mean")
+    return result.angle, result.threshold, result.fidelity
@@ -0,0 +1,401 @@
+"""
+Host-pipeline benchmark of every calibration experiment, run offline.
+
+Each experiment in ``experiments/calibrations`` and ``experiments/academic``
+runs against the offline transmon model (``options.offline``) at several sweep
+sizes and shot counts. The per-phase times of ``BaseExperiment.timer`` are
+recorded: config generation, ``define_program`` (program construction),
+compile, execute, fetch (result reshaping), analysis and saving. Plotting and
+parameter updates are off. Results are saved to a temporary result store.
+
+Every run appends one JSON line per case to ``HISTORY_PATH``, keyed by the git
+commit of the tree. ``--compare [REF]`` then checks the run against the
+newest record of ``REF`` (default: the previous commit in the history) and
+exits with status 1 when a phase got slower than ``--tolerance`` times its
+baseline, so a regression is caught before it reaches the lab.
+
+Run with ``python -m benchmarks.calibrations [--quick] [--repeat N]
+[--compare [REF]] [--tolerance X] [--no-record]``.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from qpu.config import save_dir
+from experiments.core.profiling import profile_log
+from experiments.core.result_store import result_store
+
+HISTORY_PATH = save_dir / "benchmarks" / "calibrations.jsonl"
+
+PHASES = (
+    "config",
+    "define_program",
+    "compile",
+    "execute",
+    "fetch",
+    "analyze_results",
+    "save_results",
+)
+
+QUBIT = "q10"
+
+
+# --------------------
+# CASES
+# --------------------
+@dataclass
+class Case:
+    name: str
+    build: Callable  # (points, n_avg) -> experiment
+    points: Tuple[int, ...]
+    shots: Tuple[int, ...]
+
+
+def _options(cls, n_avg: int, **overrides):
+    options = cls()
+    options.n_avg = n_avg
+    options.offline = True
+    options.plot = False
+    options.save = True
+    options.update_args = False
+    for name, value in overrides.items():
+        setattr(options, name, value)
+    return options
+
+
+def _detunings(span: float, points: int) -> np.ndarray:
+    """``points`` integer detunings (Hz) over about ``span``, as QUA loops need."""
+    step = int(span / points)
+    return (np.arange(points) - points // 2) * step
+
+
+def _iq_blobs(points, n_avg):
+    from experiments.calibrations.iq_blobs import IQBlobsExperiment, IQBlobsOptions
+
+    return IQBlobsExperiment(QUBIT, _options(IQBlobsOptions, n_avg))
+
+
+def _resonator_spectroscopy(raw_shots: bool):
+    def build(points, n_avg):
+        from experiments.calibrations.resonator_spectroscopy import (
+            ResonatorSpecOptions,
+            ResonatorSpectroscopyExperiment,
+        )
+
+        options = _options(ResonatorSpecOptions, n_avg, raw_shots=raw_shots)
+        return ResonatorSpectroscopyExperiment(
+            QUBIT, options, frequencies=_detunings(10e6, points)
+        )
+
+    return build
+
+
+def _qubit_spectroscopy(points, n_avg):
+    from experiments.calibrations.qubit_spectroscopy import (
+        QubitSpecOptions,
+        QubitSpectroscopyExperiment,
+    )
+
+    return QubitSpectroscopyExperiment(
+        QUBIT, _detunings(6e6, points), _options(QubitSpecOptions, n_avg)
+    )
+
+
+def _power_rabi(points, n_avg):
+    from experiments.calibrations.rabi_amplitude import (
+        OptionsPowerRabi,
+        PowerRabiExperiment,
+    )
+
+    return PowerRabiExperiment(
+        QUBIT, _options(OptionsPowerRabi, n_avg), np.linspace(0, 1.5, points)
+    )
+
+
+def _fine_rabi(points, n_avg):
+    from experiments.calibrations.fine_rabi import OptionsPowerRabi, PowerRabiExperiment
+
+    return PowerRabiExperiment(QUBIT, _options(OptionsPowerRabi, n_avg), reps=points)
+
+
+def _thermalization(points, n_avg):
+    from experiments.calibrations.thermalization import (
+        OptionsThermalization,
+        ThermalizationExperiment,
+        default_waits,
+    )
+
+    return ThermalizationExperiment(
+        QUBIT,
+        _options(OptionsThermalization, n_avg),
+        waits=default_waits(45e3, points),
+    )
+
+
+def _t1_spectroscopy_2d(points, n_avg):
+    from experiments.academic.echo import (
+        OptionsT1Spectroscopy2D,
+        T1Spectroscopy2DExperiment,
+    )
+
+    return T1Spectroscopy2DExperiment(
+        QUBIT,
+        detunings=_detunings(10e6, points),
+        amplitudes=np.linspace(0.1, 1, 10),
+        options=_options(OptionsT1Spectroscopy2D, n_avg),
+    )
+
+
+CASES = [
+    Case("iq_blobs", _iq_blobs, (1,), (2000, 20000, 100000)),
+    Case(
+        "resonator_spectroscopy",
+        _resonator_spectroscopy(raw_shots=False),
+        (100, 1000, 5000),
+        (200,),
+    ),
+    Case(
+        "resonator_spectroscopy_raw",
+        _resonator_spectroscopy(raw_shots=True),
+        (100, 500),
+        (200, 2000),
+    ),
+    Case("qubit_spectroscopy", _qubit_spectroscopy, (100, 1000, 5000), (200,)),
+    Case("power_rabi", _power_rabi, (50, 200, 1000), (100,)),
+    Case("fine_rabi", _fine_rabi, (10, 40, 160), (100,)),
+    Case("thermalization", _thermalization, (41, 201), (200,)),
+    Case("t1_spectroscopy_2d", _t1_spectroscopy_2d, (51, 201), (100,)),
+]
+
+
+def quick(case: Case) -> Case:
+    """The smallest size and shot count only."""
+    return Case(case.name, case.build, case.points[:1], case.shots[:1])
+
+
+# --------------------
+# RUNNING
+# --------------------
+@dataclass
+class Record:
+    commit: str
+    dirty: bool
+    date: str
+    case: str
+    points: int
+    n_avg: int
+    stages: Dict[str, float]  # median seconds per phase over the repeats
+    program_bytes: int
+    fetched_bytes: int
+    repeat: int = 1
+
+    @property
+    def key(self) -> Tuple[str, int, int]:
+        return self.case, self.points, self.n_avg
+
+
+def _git(*args) -> str:
+    return subprocess.run(
+        ["git", *args],
+        cwd=Path(__file__).parent,
+        capture_output=True,
+        text=True,
+    ).stdout.strip()
+
+
+def git_revision() -> Tuple[str, bool]:
+    """Short hash of HEAD and whether tracked files have uncommitted changes."""
+    commit = _git("rev-parse", "--short", "HEAD") or "unknown"
+    dirty = bool(_git("status", "--porcelain", "--untracked-files=no"))
+    return commit, dirty
+
+
+def _run(case: Case, points: int, n_avg: int):
+    # Experiments print progress and save paths; keep the table readable.
+    with contextlib.redirect_stdout(io.StringIO()):
+        experiment = case.build(points, n_avg)
+        experiment.run()
+    return experiment
+
+
+def run_case(case: Case, points: int, n_avg: int, repeat: int, revision) -> Record:
+    runs = [_run(case, points, n_avg) for _ in range(repeat)]
+
+    stages = {
+        phase: float(np.median([e.timer.totals().get(phase, 0.0) for e in runs]))
+        for phase in PHASES
+    }
+    profile = runs[-1].profile
+    commit, dirty = revision
+    return Record(
+        commit=commit,
+        dirty=dirty,
+        date=time.strftime("%Y-%m-%dT%H:%M:%S"),
+        case=case.name,
+        points=points,
+        n_avg=n_avg,
+        stages=stages,
+        program_bytes=profile.program_bytes,
+        fetched_bytes=profile.fetched_bytes,
+        repeat=repeat,
+    )
+
+
+def run(cases: List[Case] = CASES, repeat: int = 3) -> List[Record]:
+    """Benchmark every case at every size, with the result store in a temp dir."""
+    revision = git_revision()
+    store_root, log_path = result_store.root, profile_log.path
+
+    records = []
+    with tempfile.TemporaryDirectory() as tmp:
+        result_store.root, profile_log.path = Path(tmp), None
+        try:
+            for case in cases:
+                # Untimed: first-use imports and caches would skew the first size.
+                _run(case, case.points[0], case.shots[0])
+                for points in case.points:
+                    for n_avg in case.shots:
+                        records.append(run_case(case, points, n_avg, repeat, revision))
+        finally:
+            result_store.root, profile_log.path = store_root, log_path
+    return records
+
+
+# --------------------
+# HISTORY
+# --------------------
+def append_history(records: List[Record], path: Path = HISTORY_PATH):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a") as f:
+        for record in records:
+            f.write(json.dumps(asdict(record)) + "\n")
+
+
+def load_history(path: Path = HISTORY_PATH) -> List[Record]:
+    if not path.exists():
+        return []
+    with open(path) as f:
+        return [Record(**json.loads(line)) for line in f if line.strip()]
+
+
+def baseline(
+    history: List[Record], commit: str, ref: Optional[str] = None
+) -> Dict[tuple, Record]:
+    """Newest record per case of ``ref`` (default: newest commit other than ``commit``)."""
+    if ref is None:
+        older = [r.commit for r in history if r.commit != commit]
+        if not older:
+            return {}
+        ref = older[-1]
+    else:
+        ref = _git("rev-parse", "--short", ref) or ref
+
+    return {r.key: r for r in history if r.commit == ref}
+
+
+@dataclass
+class Regression:
+    key: tuple
+    phase: str
+    before: float
+    after: float
+
+    @property
+    def ratio(self) -> float:
+        return self.after / self.before
+
+
+def compare(
+    records: List[Record],
+    reference: Dict[tuple, Record],
+    tolerance: float = 1.5,
+    floor: float = 1e-3,
+) -> List[Regression]:
+    """Phases more than ``tolerance`` times slower than the reference.
+
+    Phases under ``floor`` seconds in both runs are ignored as timer noise.
+    """
+    regressions = []
+    for record in records:
+        ref = reference.get(record.key)
+        if ref is None:
+            continue
+        for phase, after in record.stages.items():
+            before = ref.stages.get(phase)
+            if before is None or max(before, after) < floor:
+                continue
+            if after > tolerance * max(before, floor):
+                regressions.append(Regression(record.key, phase, before, after))
+    return regressions
+
+
+def table(records: List[Record], reference: Dict[tuple, Record] = None) -> str:
+    """Phase durations (ms); with a reference, the ratio to it in brackets."""
+    reference = reference or {}
+    header = f"{'case':<28} {'points':>6} {'n_avg':>7}" + "".join(
+        f" {p[:14]:>14}" for p in PHASES
+    )
+    lines = [header + f" {'fetched':>10}"]
+    for record in records:
+        ref = reference.get(record.key)
+        line = f"{record.case[:28]:<28} {record.points:>6} {record.n_avg:>7}"
+        for phase in PHASES:
+            cell = f"{record.stages[phase] * 1e3:.1f}"
+            if ref is not None and ref.stages.get(phase):
+                cell += f" ({record.stages[phase] / ref.stages[phase]:.1f}x)"
+            line += f" {cell:>14}"
+        lines.append(line + f" {record.fetched_bytes:>10}")
+    return "\n".join(lines)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--quick", action="store_true", help="smallest sizes only")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--case", action="append", help="run only these cases")
+    parser.add_argument("--compare", nargs="?", const="", metavar="REF")
+    parser.add_argument("--tolerance", type=float, default=1.5)
+    parser.add_argument("--history", type=Path, default=HISTORY_PATH)
+    parser.add_argument("--no-record", action="store_true")
+    args = parser.parse_args(argv)
+
+    cases = [c for c in CASES if not args.case or c.name in args.case]
+    if args.quick:
+        cases = [quick(c) for c in cases]
+
+    records = run(cases, repeat=args.repeat)
+
+    reference = {}
+    if args.compare is not None:
+        commit = records[0].commit if records else None
+        reference = baseline(load_history(args.history), commit, args.compare or None)
+        if not reference:
+            print("No baseline in the history to compare with.")
+
+    print(table(records, reference))
+    if not args.no_record:
+        append_history(records, args.history)
+
+    regressions = compare(records, reference, args.tolerance)
+    for r in regressions:
+        case, points, n_avg = r.key
+        print(
+            f"REGRESSION {case} (points={points}, n_avg={n_avg}) {r.phase}: "
+            f"{r.before * 1e3:.1f} ms -> {r.after * 1e3:.1f} ms ({r.ratio:.1f}x)"
+        )
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
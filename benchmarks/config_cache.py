@@ -0,0 +1,42 @@
+"""
+Host-side setup cost of ``generate_config`` with and without the config cache.
+
+Emulates a sweep that constructs an experiment per point while the parameter
+set only changes every ``points_per_value`` points.
+
+Run with ``python -m benchmarks.config_cache``.
+"""
+
+import time
+
+from params import QPUConfig
+from qpu.config_cache import ConfigCache
+from qpu.transmon import create_machine
+
+
+def run(n_points: int = 50, points_per_value: int = 10):
+    params = QPUConfig()
+    cache = ConfigCache()
+    readout = params.qubits["q10"].gates.readout_pulse
+
+    uncached = cached = 0.0
+    for i in range(n_points):
+        readout.amplitude = 0.05 + 0.01 * (i // points_per_value)
+        machine = create_machine(params)
+
+        start = time.perf_counter()
+        machine.generate_config()
+        uncached += time.perf_counter() - start
+
+        start = time.perf_counter()
+        cache.get(params, machine)
+        cached += time.perf_counter() - start
+
+    return uncached, cached, cache.stats
+
+
+if __name__ == "__main__":
+    uncached, cached, stats = run()
+    print(f"generate_config:  {uncached * 1e3:.1f} ms")
+    print(f"config_cache.get: {cached * 1e3:.1f} ms")
+    print(f"hits / misses:    {stats.hits} / {stats.misses}")
@@ -0,0 +1,49 @@
+"""
+Two-state discrimination of large IQ-blob datasets.
+
+Compares ``analysis.readout.discriminate_blobs`` (histogram threshold
+search refined on the nearby shots) with ``qualang_tools``' ``two_state_discriminator`` (Nelder-Mead over
+the threshold) on synthetic blobs.
+
+Run with ``python -m benchmarks.discriminator``.
+"""
+
+import time
+
+import numpy as np
+from qualang_tools.analysis.discriminator import two_state_discriminator
+
+from analysis.readout import METHODS, discriminate_blobs
+
+
+def blobs(n_shots: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    Ig, Qg = rng.normal(0.0, 1.0, (2, n_shots))
+    Ie, Qe = rng.normal(0.0, 1.0, (2, n_shots))
+    Ie += 2.0
+    Qe += 1.0
+    return Ig, Qg, Ie, Qe
+
+
+def _timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def run(n_shots: int = 1_000_000):
+    data = blobs(n_shots)
+    rows = {}
+    for method in METHODS:
+        elapsed, result = _timed(discriminate_blobs, *data, method=method)
+        rows[f"discriminate_blobs ({method})"] = (elapsed, float(result.fidelity))
+    elapsed, result = _timed(two_state_discriminator, *data, b_print=False, b_plot=False)
+    rows["two_state_discriminator"] = (elapsed, float(result[2]))
+    return rows
+
+
+if __name__ == "__main__":
+    n_shots = 1_000_000
+    print(f"{n_shots:.0e} shots per state")
+    for name, (elapsed, fidelity) in run(n_shots).items():
+        print(f"{name:<30} {elapsed * 1e3:8.0f} ms   fidelity {fidelity:.2f}%")
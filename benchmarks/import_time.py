@@ -0,0 +1,48 @@
+"""
+Import cost of ``experiments`` and whether importing reads parameter files.
+
+Each measurement runs in a fresh interpreter. An audit hook records every
+file opened under ``params/data`` while ``import experiments`` executes; with
+lazy parameter loading that list must be empty.
+
+Run with ``python -m benchmarks.import_time``.
+"""
+
+import json
+import subprocess
+import sys
+
+from params.loader import BASE_DIR
+
+
+_PROBE = """
+import json, sys, time
+opened = []
+def hook(event, args):
+    if event == "open" and isinstance(args[0], str) and args[0].startswith({data_dir!r}):
+        opened.append(args[0])
+sys.addaudithook(hook)
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"elapsed": elapsed, "opened": opened}}))
+"""
+
+
+def run(module: str = "experiments", repeats: int = 3):
+    code = _PROBE.format(data_dir=str(BASE_DIR / "data"), module=module)
+    samples = []
+    for _ in range(repeats):
+        out = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, check=True
+        ).stdout
+        samples.append(json.loads(out.strip().splitlines()[-1]))
+    return min(s["elapsed"] for s in samples), samples[-1]["opened"]
+
+
+if __name__ == "__main__":
+    elapsed, opened = run()
+    print(f"import experiments: {elapsed * 1e3:.0f} ms")
+    print(f"parameter files read at import: {len(opened)}")
+    for path in opened:
+        print(f"  {path}")
@@ -0,0 +1,52 @@
+"""
+Per-access cost of ``Params`` lookups: path walking vs compiled accessors.
+
+The baseline splits the path and walks the nested dicts on every call, which
+is what ``Params.get`` did before accessors were compiled and cached.
+
+Run with ``python -m benchmarks.params_access``.
+"""
+
+import timeit
+
+from params.loader import Params, CALIBRATIONS_PATH
+
+
+PATHS = [
+    "q10/resonator/threshold",
+    "q10/resonator/rotation_angle",
+    "q10/qubit/qubit_ge_freq",
+    "q10/gates/square_gate/amplitude",
+]
+
+
+def _walk_get(data, path):
+    cur = data
+    for k in path.split("/"):
+        cur = cur[k]
+    return cur
+
+
+def run(number: int = 200_000):
+    params = Params(CALIBRATIONS_PATH, autosave=False)
+    path = PATHS[0]
+    accessor = params.accessor(path)
+
+    timings = {
+        "split + walk": timeit.timeit(lambda: _walk_get(params.data, path), number=number),
+        "Params.get": timeit.timeit(lambda: params.get(path), number=number),
+        "accessor.get": timeit.timeit(accessor.get, number=number),
+        "walk loop (per path)": timeit.timeit(
+            lambda: [_walk_get(params.data, p) for p in PATHS],
+            number=number // len(PATHS),
+        ),
+        "get_many (per path)": timeit.timeit(
+            lambda: params.get_many(PATHS), number=number // len(PATHS)
+        ),
+    }
+    return {name: t / number * 1e9 for name, t in timings.items()}
+
+
+if __name__ == "__main__":
+    for name, ns in run().items():
+        print(f"{name:<20} {ns:6.0f} ns/access")
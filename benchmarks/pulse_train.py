@@ -0,0 +1,95 @@
+"""
+Program size and build time of the fine Rabi program versus ``reps``.
+
+Compares the QUA ``for_`` pulse train used by ``fine_rabi`` with the former
+Python unrolling (a ``play`` per pulse and an initialization/measurement
+block per rep). Size is the serialized QUA program, which is what the QOP
+server has to compile. With ``--compile`` the programs are also compiled on
+the configured QOP server.
+
+Run with ``python -m benchmarks.pulse_train [--compile]``.
+"""
+
+import sys
+import time
+
+from qm.qua import *
+
+from experiments.calibrations.fine_rabi import OptionsPowerRabi, PowerRabiExperiment
+from macros.reset import qubit_initialization
+
+
+def unrolled_program(experiment):
+    """The fine Rabi program as it was built before the pulse train."""
+    qubit = experiment.qubit
+    with program() as prog:
+        n = declare(int)
+        I = declare(fixed)
+        Q = declare(fixed)
+        I_st = declare_stream()
+        Q_st = declare_stream()
+
+        with for_(n, 0, n < experiment.options.n_avg, n + 1):
+            for i in range(experiment.reps):
+                qubit_initialization(qubit, experiment.options)
+                for _ in range(i):
+                    qubit.xy.play("X180", amplitude_scale=0.5)
+                qubit.xy.align()
+                qubit.resonator.measure("readout", qua_vars=(I, Q))
+                save(I, I_st)
+                save(Q, Q_st)
+
+        with stream_processing():
+            I_st.buffer(experiment.reps).average().save("I")
+            Q_st.buffer(experiment.reps).average().save("Q")
+    return prog
+
+
+def looped_program(experiment):
+    experiment.define_program()
+    return experiment.program
+
+
+def _measure(build, experiment, qm=None):
+    start = time.perf_counter()
+    prog = build(experiment)
+    size = prog.qua_program.ByteSize()
+    built = time.perf_counter() - start
+
+    compiled = None
+    if qm is not None:
+        start = time.perf_counter()
+        qm.compile(prog)
+        compiled = time.perf_counter() - start
+    return built, size, compiled
+
+
+def run(reps_list=(5, 10, 20, 40, 80), compile_on_server: bool = False):
+    experiment = PowerRabiExperiment("q10", OptionsPowerRabi())
+    qm = experiment.open_qm() if compile_on_server else None
+
+    rows = []
+    for reps in reps_list:
+        experiment.reps = reps
+        rows.append(
+            (
+                reps,
+                _measure(unrolled_program, experiment, qm),
+                _measure(looped_program, experiment, qm),
+            )
+        )
+    return rows
+
+
+if __name__ == "__main__":
+    compile_on_server = "--compile" in sys.argv
+    header = f"{'reps':>5} {'unrolled':>24} {'pulse train':>24}"
+    print(header)
+    print(f"{'':>5} {'bytes':>10} {'build [ms]':>13} {'bytes':>10} {'build [ms]':>13}")
+    for reps, unrolled, looped in run(compile_on_server=compile_on_server):
+        line = f"{reps:>5}"
+        for built, size, compiled in (unrolled, looped):
+            line += f" {size:>10} {built * 1e3:>13.1f}"
+            if compiled is not None:
+                line += f" (compile {compiled:.2f} s)"
+        print(line)
@@ -0,0 +1,52 @@
+"""
+Connection reuse benchmark for the QuantumMachinesManager pool.
+
+Emulates the access pattern of ``ScanAmplitude`` (one experiment object per
+sweep point) against ``LocalQuantumMachinesManager`` and compares a fresh
+manager per experiment with borrowing from a ``QMMPool``.
+
+Run with ``python -m benchmarks.qmm_pool``.
+"""
+
+import time
+from functools import partial
+
+from qpu.offline import LocalQuantumMachinesManager
+from qpu.qmm_pool import QMMPool
+
+
+def run_naive(n_experiments: int, connect_latency: float) -> float:
+    start = time.perf_counter()
+    for _ in range(n_experiments):
+        LocalQuantumMachinesManager(
+            host="offline", port=0, connect_latency=connect_latency
+        )
+    return time.perf_counter() - start
+
+
+def run_pooled(n_experiments: int, connect_latency: float):
+    factory = partial(LocalQuantumMachinesManager, connect_latency=connect_latency)
+    pool = QMMPool(factory=factory)
+
+    start = time.perf_counter()
+    for _ in range(n_experiments):
+        pool.get(host="offline", port=0)
+    elapsed = time.perf_counter() - start
+
+    pool.shutdown()
+    return elapsed, pool.stats
+
+
+if __name__ == "__main__":
+    n_experiments = 100  # 10 x 10 readout scan
+    connect_latency = 0.05
+
+    naive = run_naive(n_experiments, connect_latency)
+    pooled, stats = run_pooled(n_experiments, connect_latency)
+
+    print(f"experiments:          {n_experiments}")
+    print(f"naive connect time:   {naive:.3f} s")
+    print(f"pooled connect time:  {pooled:.3f} s")
+    print(f"pool connects:        {stats.connects}")
+    print(f"pool reuse rate:      {stats.reuse_rate:.1%}")
+    print(f"mean connect latency: {stats.mean_connect_time * 1e3:.1f} ms")
@@ -6,14 +6,17 @@ from qualang_tools.results import fetching_tool, progress_counter
 from qualang_tools.loops import from_array
 
 from experiments.core.base_experiment import BaseExperiment
+from experiments.core.early_stopping import contrast_snr, from_options
+from experiments.core.multiplexing import qubit_streams
 from utils import Options, u
 from params import QPUConfig
 
 from experiments.academic import echo_utils
+from qpu.config_cache import config_cache
 import numpy as np
 
 from macros.discrimination import discriminate
-from macros.reset import qubit_initialization
+from macros.reset import ActiveReset, metric_streams, qubit_initialization
 
 
 # ----------------------------------------------------------------------
@@ -34,7 +37,7 @@ class T1Spectroscopy2DExperiment(BaseExperiment):
         detunings: np.ndarray,
         amplitudes: np.ndarray,
         options: OptionsT1Spectroscopy2D = OptionsT1Spectroscopy2D(),
-        params: QPUConfig = QPUConfig(),
+        params: QPUConfig = None,
     ):
         super().__init__(qubit, options, params)
 
@@ -47,16 +50,21 @@ class T1Spectroscopy2DExperiment(BaseExperiment):
         self.detunings = detunings
         self.frequencies = LO - (f0 + self.detunings)
 
-        self.qubit.xy.operations["lorentzian"] = echo_utils.LorentzianPulse(
+        lorentzian = echo_utils.LorentzianPulse(
             amplitude=0.1,
             length=10 * u.us,
             tau=1 * u.us,
             axis_angle=0,
             subtracted=False,
         )
+        self.qubit.xy.operations["lorentzian"] = lorentzian
 
         self.machine.qubits[self.qubit.name] = self.qubit
-        self.config = self.machine.generate_config()
+        self.config = config_cache.get(
+            self.params,
+            self.machine,
+            extra_operations={f"{self.qubit.xy.name}.lorentzian": lorentzian},
+        )
 
     # ------------------------------------------------------------------
     # Define Program
@@ -78,13 +86,16 @@ class T1Spectroscopy2DExperiment(BaseExperiment):
             n_st = declare_stream()
             I_st = declare_stream()
             Q_st = declare_stream()
+            reset = None
+            if self.options.active_reset:
+                reset = ActiveReset.from_options(qubit, self.options)
 
             # Main averaging loop
             with for_(n, 0, n < self.options.n_avg, n + 1):
                 with for_(*from_array(df, self.frequencies)):
                     update_frequency(qubit.name, df)
                     with for_(*from_array(a, self.amplitudes)):
-                        qubit_initialization(qubit, self.options)
+                        qubit_initialization(qubit, self.options, reset)
                         qubit.xy.play("lorentzian", amplitude_scale=a)
                         qubit.xy.align(resonator.name)
                         resonator.measure("readout", qua_vars=(I, Q))
@@ -107,34 +118,38 @@ class T1Spectroscopy2DExperiment(BaseExperiment):
                 Q_st.buffer(len(self.amplitudes)).buffer(
                     len(self.detunings)
                 ).average().save("Q")
+                if reset is not None:
+                    reset.save_streams()
 
         self.program = spec_2d
+        self.describe_sweep(
+            "drive_spectroscopy_2d",
+            qubits=[qubit],
+            options=self.options,
+            frequencies_IF=self.frequencies,
+            amplitudes=self.amplitudes,
+        )
 
     # ------------------------------------------------------------------
     # Execute
     # ------------------------------------------------------------------
     def execute_program(self):
-        qm = self.qmm.open_qm(self.config)
-        self.job = qm.execute(self.program)
-
-        results = fetching_tool(
-            self.job, data_list=["I", "Q", "state", "iteration"], mode="live"
-        )
+        self.open_qm()
+        self.execute()
 
-        while results.is_processing():
-            I, Q, state, iteration = results.fetch_all()
-            progress_counter(
-                iteration, self.options.n_avg, start_time=results.get_start_time()
-            )
-
-        self.results = results
+        signal = ("state",) if self.options.state_discrimination else ("I", "Q")
+        early_stopping = from_options(self.options, contrast_snr(*signal))
+        variable_list = ["I", "Q", "state"]
+        variable_list += metric_streams([self.qubit], self.options) + ["iteration"]
+        results = self.live_fetch(variable_list, early_stopping)
+        self.fetched = self.fetch(variable_list, results)
 
     # ------------------------------------------------------------------
     # Analyze Results
     # ------------------------------------------------------------------
     def analyze_results(self):
 
-        I, Q, states, iteration = self.results.fetch_all()
+        I, Q, states = (self.fetched[name] for name in ("I", "Q", "state"))
 
         self.data["amplitudes"] = self.amplitudes
         self.data["frequencies"] = self.frequencies
@@ -142,6 +157,7 @@ class T1Spectroscopy2DExperiment(BaseExperiment):
         self.data["state"] = states
         self.data["I"] = I
         self.data["Q"] = Q
+        self.data.update(qubit_streams(self.fetched, self.qubit))
 
         # Find maximum contrast → peak transition frequency
         idx = np.argmax(np.mean(states, axis=0))
@@ -181,9 +197,6 @@ class T1Spectroscopy2DExperiment(BaseExperiment):
     # ------------------------------------------------------------------
     # Save / Update Params
     # ------------------------------------------------------------------
-    def save_results(self):
-        pass
-
     def update_params(self):
         pass
 
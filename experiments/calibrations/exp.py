@@ -8,6 +8,7 @@ import matplotlib.pyplot as plt
 from qualang_tools.results.data_handler import DataHandler
 
 from qpu.transmon import create_machine
+from qpu.config import save_dir
 from params import QPUConfig
 
 from utils import u
@@ -1,7 +1,6 @@
 # Refactored Power Rabi Experiment (Updated Script)
 
 import numpy as np
-from scipy.optimize import curve_fit
 from qm.qua import *
 import matplotlib.pyplot as plt
 
@@ -10,7 +9,12 @@ from qualang_tools.results import progress_counter, fetching_tool
 from qualang_tools.loops import from_array
 from params import QPUConfig
 from utils import Options, u
+from analysis.fitting import fit_cosine
 from experiments.core.base_experiment import BaseExperiment
+from experiments.core.early_stopping import contrast_snr, from_options
+from experiments.core.multiplexing import qubit_streams
+from macros.pulse_train import pulse_train
+from macros.reset import ActiveReset, metric_streams, qubit_initialization
 
 
 class OptionsPowerRabi(Options):
@@ -29,7 +33,7 @@ class PowerRabiExperiment(BaseExperiment):
 
         self.reps = reps
         self.state_discrimination = False
-        self.rabi_amp = self.params.qubits["q10"].gates.square_gate.amplitude
+        self.rabi_amp = self.params.qubits[self.qubit_id].gates.square_gate.amplitude
 
     def define_program(self):
         with program() as power_rabi:
@@ -45,13 +49,15 @@ class PowerRabiExperiment(BaseExperiment):
             qubit = self.qubit
             rr = qubit.resonator
 
-            ns = range(self.reps)
+            i = declare(int)
+            reset = None
+            if self.options.active_reset:
+                reset = ActiveReset.from_options(qubit, self.options)
 
             with for_(n, 0, n < self.options.n_avg, n + 1):
-                for i in ns:
-                    qubit_initialization(qubit, self.options)
-                    for _ in range(i):
-                        qubit.xy.play("X180", amplitude_scale=0.5)
+                with for_(i, 0, i < self.reps, i + 1):
+                    qubit_initialization(qubit, self.options, reset)
+                    pulse_train(qubit.xy, "X180", i, amplitude_scale=0.5)
                     qubit.xy.align()
                     rr.measure("readout", qua_vars=(I, Q))
                     threshold = qubit.parameters.resonator.threshold
@@ -70,73 +76,60 @@ class PowerRabiExperiment(BaseExperiment):
                 I_st.buffer(self.reps).average().save("I")
                 Q_st.buffer(self.reps).average().save("Q")
                 state_st.buffer(self.reps).average().save("state")
+                if reset is not None:
+                    reset.save_streams()
                 n_st.save("iteration")
 
         self.program = power_rabi
+        self.describe_sweep(
+            "fine_rabi",
+            qubits=[self.qubit],
+            options=self.options,
+            reps=self.reps,
+        )
 
     def execute_program(self):
 
-        qm = self.qmm.open_qm(self.config)
-        self.job = qm.execute(self.program)
-        variable_list = ["I", "Q", "state", "iteration"]
+        self.open_qm()
+        self.execute()
+        variable_list = ["I", "Q", "state"]
+        variable_list += metric_streams([self.qubit], self.options) + ["iteration"]
 
-        results = fetching_tool(self.job, data_list=variable_list, mode="live")
-
-        while results.is_processing():
-            I, Q, state, iteration = results.fetch_all()
-
-            progress_counter(
-                iteration, self.options.n_avg, start_time=results.get_start_time()
-            )
-
-        self.results = results
+        signal = ("state",) if self.options.state_discrimination else ("I", "Q")
+        early_stopping = from_options(self.options, contrast_snr(*signal))
+        results = self.live_fetch(variable_list, early_stopping)
+        self.fetched = self.fetch(variable_list, results)
 
     def analyze_results(self):
-        # pass
-        I, Q, state, iteration = self.results.fetch_all()
+        I, Q, state = (self.fetched[name] for name in ("I", "Q", "state"))
 
         self.data["amplitudes"] = np.arange(self.reps)
         self.data["I"] = I
         self.data["Q"] = Q
         self.data["state"] = state
+        self.data.update(qubit_streams(self.fetched, self.qubit))
 
-        # if self.options.state_discrimination:
-        #     self.y = state
-        # else:
-        #     Ic = np.max(I) - np.min(I)
-        #     Qc = np.max(Q) - np.min(Q)
-        #     self.y = I if Ic > Qc else Q
-        #     self.quad_name = "I" if Ic > Qc else "Q"
-
-        # def cos_fit(x, a, b, c, d):
-        #     return a * np.cos(2 * np.pi * 1 / b * x + c) + d
-
-        # try:
-        #     self.fit_args = curve_fit(
-        #         cos_fit,
-        #         self.x,
-        #         self.y,
-        #         p0=[
-        #             max(self.y) / 2 - min(self.y) / 2,
-        #             self.rabi_amp * 2,
-        #             np.pi,
-        #             np.mean(self.y),
-        #         ],
-        #         maxfev=100000,
-        #         xtol=1e-8,
-        #         ftol=1e-8,
-        #     )[0]
-        # except:
-        #     self.fit_args = None
+        if self.options.state_discrimination:
+            y = state
+        else:
+            y = I if np.ptp(I) > np.ptp(Q) else Q
+
+        # i half-pi pulses rotate by i * pi/2 * (amplitude / pi amplitude): a
+        # quarter cycle per pulse when the pi amplitude is exact.
+        fit = fit_cosine(self.data["amplitudes"], y)
+        self.fit = fit
+        self.data["amplitude_correction"] = 1 / (4 * fit["frequency"])
+        self.data["pi_amplitude"] = self.rabi_amp * self.data["amplitude_correction"]
+        self.data["fit_params"] = fit.params
+        self.data["fit_errors"] = fit.errors
 
     def plot_results(self):
 
-        # I = self.data["I"]
-        # Q = self.data["Q"]
+        I = self.data["I"]
         state = self.data["state"]
 
         if not self.options.state_discrimination:
-            plt.plot(self.x * self.rabi_amp * self.options.num_pis * 1e3, I, ".")
+            plt.plot(range(self.reps), I, ".-")
         else:
             plt.plot(range(self.reps), state, ".-")
             plt.plot(range(1, self.reps, 2), state[1::2], "-")
@@ -146,38 +139,25 @@ class PowerRabiExperiment(BaseExperiment):
         plt.ylabel("State")
         plt.show()
 
-    def save_results(self):
-        pass
+    def analysis_succeeded(self) -> bool:
+        """A significant oscillation close to a quarter cycle per pulse.
+
+        Larger corrections alias in a pulse train; use the power Rabi for them.
+        """
+        fit = self.fit
+        return bool(
+            fit.success
+            and abs(fit["amplitude"]) > 3 * fit.error("amplitude")
+            and abs(self.data["amplitude_correction"] - 1) < 0.2
+        )
 
     def update_params(self):
-        pass
-
-
-def active_reset(qubit):
-    threshold = qubit.parameters.resonator.threshold
-    I_reset = declare(fixed)
-    Q_reset = declare(fixed)
-    qubit.xy.align(qubit.resonator.name)
-    qubit.resonator.measure("readout", qua_vars=(I_reset, Q_reset))
-    qubit.xy.align(qubit.resonator.name)
-    qubit.xy.play("X180", condition=(I_reset > threshold))
-    qubit.resonator.wait(3 * u.us)
-    qubit.xy.align(qubit.resonator.name)
-
-
-def passive_reset(qubit):
-    thermalization_time = qubit.parameters.qubit.thermalization_time
-    thermalization_time = 300 * u.us
-    qubit.xy.align(qubit.resonator.name)
-    wait(thermalization_time, qubit.name)
-    qubit.xy.align(qubit.resonator.name)
-
-
-def qubit_initialization(qubit, options):
-    if options.active_reset:
-        active_reset(qubit)
-    else:
-        passive_reset(qubit)
+        if not self.succeeded[self.qubit_id]:
+            print(f"{self.qubit_id}: fine Rabi fit failed, not updating")
+            return
+        self.stage_update(
+            "gates/square_gate/amplitude", float(self.data["pi_amplitude"])
+        )
 
 
 if __name__ == "__main__":
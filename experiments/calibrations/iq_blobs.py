@@ -9,8 +9,9 @@ from macros.reset import *
 from qpu.transmon import *
 from qpu.config import *
 
-from qualang_tools.analysis.discriminator import two_state_discriminator
+from analysis.readout import discriminate_blobs
 from experiments.core.base_experiment import BaseExperiment
+from experiments.core.multiplexing import stream_name, qubit_streams
 from utils import Options
 from dataclasses import dataclass
 
@@ -23,9 +24,13 @@ from params import QPUConfig
 @dataclass
 class IQBlobsOptions(Options):
     n_avg: int = 20000
+    discrimination: str = "lda"  # rotation: "mean", "lda" or "pca"
+    min_fidelity: float = 60.0  # percent; worse blobs are not written back
 
 
 class IQBlobsExperiment(BaseExperiment):
+    supports_multi_qubit = True
+
     def __init__(
         self,
         qubit,
@@ -35,121 +40,150 @@ class IQBlobsExperiment(BaseExperiment):
         super().__init__(qubit=qubit, options=options, params=params)
 
     def define_program(self):
-        self.program = _program(self.qubit, self.options)
+        self.program = _program(self.batch_qubits, self.options)
+        self.describe_sweep("iq_blobs", qubits=self.batch_qubits, options=self.options)
 
     def execute_program(self):
-        self.qm = self.qmm.open_qm(self.config)
-        job = self.qm.execute(self.program, dry_run=True)
-        variable_list = ["Ig", "Qg", "Ie", "Qe"]
-        results = fetching_tool(job, data_list=variable_list)
-
-        Ig, Qg, Ie, Qe = results.fetch_all()
-        self.data = {
-            "Ig": Ig,
-            "Qg": Qg,
-            "Ie": Ie,
-            "Qe": Qe,
-        }
+        self.qm = self.open_qm()
+        self.execute()
+        variable_list = [
+            stream_name(qubit, name)
+            for qubit in self.batch_qubits
+            for name in ("Ig", "Qg", "Ie", "Qe")
+        ] + metric_streams(self.batch_qubits, self.options)
+        fetched = self.fetch(variable_list)
+        for qubit_id, qubit in zip(self.batch, self.batch_qubits):
+            self.store_data(qubit_id, qubit_streams(fetched, qubit))
 
     def analyze_results(self):
-
-        angle, threshold, fidelity, gg, ge, eg, ee = two_state_discriminator(
+        self.discrimination = discriminate_blobs(
             self.data["Ig"],
             self.data["Qg"],
             self.data["Ie"],
             self.data["Qe"],
-            b_print=False,
-            b_plot=False,
+            method=self.options.discrimination,
         )
-        self.data["angle"] = angle
-        self.data["threshold"] = threshold
-        self.data["fidelity"] = fidelity
+        self.data["angle"] = float(self.discrimination.angle)
+        self.data["threshold"] = float(self.discrimination.threshold)
+        self.data["fidelity"] = float(self.discrimination.fidelity)
+        self.data["confusion"] = self.discrimination.confusion
 
     def plot_results(self):
-        Ig = np.array(self.data["Ig"])
-        Qg = np.array(self.data["Qg"])
-        Ie = np.array(self.data["Ie"])
-        Qe = np.array(self.data["Qe"])
-
-        angle, threshold, fidelity, gg, ge, eg, ee = two_state_discriminator(
-            Ig, Qg, Ie, Qe, b_print=self.options.plot, b_plot=self.options.plot
-        )
-
-    def save_results(self):
-        pass
+        # Reuses the discrimination computed in analyze_results.
+        result = self.discrimination
+        Ig = np.asarray(self.data["Ig"])
+        Qg = np.asarray(self.data["Qg"])
+        Ie = np.asarray(self.data["Ie"])
+        Qe = np.asarray(self.data["Qe"])
+        Ig_rot, Qg_rot = result.rotate(Ig, Qg)
+        Ie_rot, Qe_rot = result.rotate(Ie, Qe)
+
+        fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2)
+        ax1.plot(Ig, Qg, ".", alpha=0.1, label="Ground", markersize=2)
+        ax1.plot(Ie, Qe, ".", alpha=0.1, label="Excited", markersize=2)
+        ax1.axis("equal")
+        ax1.legend(["Ground", "Excited"])
+        ax1.set_xlabel("I")
+        ax1.set_ylabel("Q")
+        ax1.set_title("Original Data")
+
+        ax2.plot(Ig_rot, Qg_rot, ".", alpha=0.1, label="Ground", markersize=2)
+        ax2.plot(Ie_rot, Qe_rot, ".", alpha=0.1, label="Excited", markersize=2)
+        ax2.axis("equal")
+        ax2.set_xlabel("I")
+        ax2.set_ylabel("Q")
+        ax2.set_title(f"Rotated Data ({result.method})")
+
+        ax3.hist(Ig_rot, bins=50, alpha=0.75, label="Ground")
+        ax3.hist(Ie_rot, bins=50, alpha=0.75, label="Excited")
+        ax3.axvline(x=result.threshold, color="k", ls="--", alpha=0.5)
+        ax3.set_xlabel("I")
+        ax3.set_title("1D Histogram")
+
+        ax4.imshow(result.confusion)
+        ax4.set_xticks([0, 1])
+        ax4.set_yticks([0, 1])
+        ax4.set_xticklabels(["|g>", "|e>"])
+        ax4.set_yticklabels(["|g>", "|e>"])
+        ax4.set_ylabel("Prepared")
+        ax4.set_xlabel("Measured")
+        for i in range(2):
+            for j in range(2):
+                label = f"{100 * result.confusion[i, j]:.1f}%"
+                ax4.text(j, i, label, ha="center", color="w")
+        ax4.set_title(f"Fidelity: {result.fidelity:.1f}%")
+        fig.tight_layout()
+
+    def analysis_succeeded(self) -> bool:
+        return bool(self.data["fidelity"] >= self.options.min_fidelity)
 
     def update_params(self):
-        pass
-
-
-def _program(qubit, options):
-    rr = qubit.resonator
+        if not self.succeeded[self.qubit_id]:
+            print(
+                f"{self.qubit_id}: fidelity {self.data['fidelity']:.1f}% below "
+                f"{self.options.min_fidelity:.1f}%, not updating"
+            )
+            return
+        # The readout pulse's axis angle rotates the demodulated IQ, so the
+        # blobs' rotation adds to it and the threshold applies in the new frame.
+        resonator = self.params.qubits[self.qubit_id].resonator
+        angle = (resonator.rotation_angle + np.degrees(self.data["angle"])) % 360
+        self.stage_update("resonator/rotation_angle", round(float(angle), 2))
+        self.stage_update("resonator/threshold", float(self.data["threshold"]))
+
+
+def _program(qubits, options):
+    elements = [q.xy.name for q in qubits] + [q.resonator.name for q in qubits]
 
     with program() as iq_blobs:
 
         n = declare(int)
-        Ig = declare(fixed)
-        Qg = declare(fixed)
-        Ie = declare(fixed)
-        Qe = declare(fixed)
-        Ig_st = declare_stream()
-        Qg_st = declare_stream()
-        Ie_st = declare_stream()
-        Qe_st = declare_stream()
+        Ig = [declare(fixed) for _ in qubits]
+        Qg = [declare(fixed) for _ in qubits]
+        Ie = [declare(fixed) for _ in qubits]
+        Qe = [declare(fixed) for _ in qubits]
+        Ig_st = [declare_stream() for _ in qubits]
+        Qg_st = [declare_stream() for _ in qubits]
+        Ie_st = [declare_stream() for _ in qubits]
+        Qe_st = [declare_stream() for _ in qubits]
+        reset = None
+        if options.active_reset:
+            reset = ActiveReset.from_options(qubits, options)
 
         with for_(n, 0, n < options.n_avg, n + 1):
             # ----------- Ground measurement ---------------
-            qubit_initialization(qubit, options)
-            rr.measure("readout", qua_vars=(Ig, Qg))
-            save(Ig, Ig_st)
-            save(Qg, Qg_st)
+            for qubit in qubits:
+                qubit_initialization(qubit, options, reset)
+            align(*elements)
+            for i, qubit in enumerate(qubits):
+                qubit.resonator.measure("readout", qua_vars=(Ig[i], Qg[i]))
+                save(Ig[i], Ig_st[i])
+                save(Qg[i], Qg_st[i])
 
             # ----------- Excited measurement ---------------
-            qubit_initialization(qubit, options)
-            qubit.xy.play("X180")  # π pulse
-            qubit.xy.align(rr.name)
-            rr.measure("readout", qua_vars=(Ie, Qe), amplitude_scale=1)
-            save(Ie, Ie_st)
-            save(Qe, Qe_st)
+            for qubit in qubits:
+                qubit_initialization(qubit, options, reset)
+                qubit.xy.play("X180")  # π pulse
+            align(*elements)
+            for i, qubit in enumerate(qubits):
+                qubit.resonator.measure(
+                    "readout", qua_vars=(Ie[i], Qe[i]), amplitude_scale=1
+                )
+                save(Ie[i], Ie_st[i])
+                save(Qe[i], Qe_st[i])
 
         with stream_processing():
-            Ig_st.buffer(options.n_avg).save("Ig")
-            Qg_st.buffer(options.n_avg).save("Qg")
-            Ie_st.buffer(options.n_avg).save("Ie")
-            Qe_st.buffer(options.n_avg).save("Qe")
+            for i, qubit in enumerate(qubits):
+                Ig_st[i].buffer(options.n_avg).save(stream_name(qubit, "Ig"))
+                Qg_st[i].buffer(options.n_avg).save(stream_name(qubit, "Qg"))
+                Ie_st[i].buffer(options.n_avg).save(stream_name(qubit, "Ie"))
+                Qe_st[i].buffer(options.n_avg).save(stream_name(qubit, "Qe"))
+            if reset is not None:
+                reset.save_streams()
 
     return iq_blobs
 
 
-def active_reset(qubit):
-    threshold = qubit.parameters.resonator.threshold
-    I_reset = declare(fixed)
-    Q_reset = declare(fixed)
-    qubit.xy.align(qubit.resonator.name)
-    qubit.resonator.measure("readout", qua_vars=(I_reset, Q_reset))
-    qubit.resonator.measure("readout", qua_vars=(I_reset, Q_reset))
-    qubit.resonator.measure("readout", qua_vars=(I_reset, Q_reset))
-    qubit.xy.align(qubit.resonator.name)
-    qubit.xy.play("X180", condition=(I_reset < threshold))
-    qubit.resonator.wait(1 * u.us)
-    qubit.xy.align(qubit.resonator.name)
-
-
-def passive_reset(qubit):
-    thermalization_time = qubit.parameters.qubit.thermalization_time
-    thermalization_time = 300 * u.us
-    qubit.xy.align(qubit.resonator.name)
-    wait(thermalization_time, qubit.name)
-    qubit.xy.align(qubit.resonator.name)
-
-
-def qubit_initialization(qubit, options):
-    if options.active_reset:
-        active_reset(qubit)
-    else:
-        passive_reset(qubit)
-
-
 if __name__ == "__main__":
 
     qubit = "q10"
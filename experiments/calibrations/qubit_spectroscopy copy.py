@@ -70,7 +70,7 @@ class QubitSpectroscopyExperiment(BaseExperiment):
     # Execution
     # ------------------------------------------------------------------
     def execute_program(self):
-        self.qm = self.qmm.open_qm(self.config)
+        self.qm = self.open_qm()
 
         if self.options.simulate:
             job = self.qm.simulate(
@@ -140,10 +140,6 @@ class QubitSpectroscopyExperiment(BaseExperiment):
         # plt.tight_layout()
         plt.show()
 
-    def save_results(self):
-        """Hook into your saving mechanism."""
-        pass
-
     def update_params(self):
         """Optionally write back the extracted qubit frequency to params."""
         pass
@@ -9,11 +9,14 @@ from qualang_tools.loops import from_array
 
 from qpu.transmon import *
 from params import QPUConfig
+from analysis.fitting import fit_lorentzian, lorentzian
 
 from experiments.core.base_experiment import BaseExperiment
+from experiments.core.averaging import save_stream, stream_names, reduce_shots
+from experiments.core.multiplexing import stream_name, qubit_streams
 from utils import Options, u
 from macros.discrimination import discriminate
-from macros.reset import qubit_initialization
+from macros.reset import ActiveReset, metric_streams, qubit_initialization
 
 
 # -------------------------------------------------------------------------
@@ -24,6 +27,8 @@ class QubitSpecOptions(Options):
     """Options for qubit spectroscopy."""
 
     n_avg: int = 200
+    raw_shots: bool = False  # stream every shot instead of averaging on the server
+    error_bars: bool = False  # also stream sums of squares for standard errors
 
 
 # -------------------------------------------------------------------------
@@ -32,9 +37,12 @@ class QubitSpecOptions(Options):
 class QubitSpectroscopyExperiment(BaseExperiment):
     """
     Performs single-tone qubit spectroscopy by sweeping the qubit IF frequency
-    and measuring the resonator response.
+    and measuring the resonator response. Accepts a list of qubits, each swept
+    by the same detunings around its own frequency.
     """
 
+    supports_multi_qubit = True
+
     def __init__(
         self,
         qubit: str,
@@ -50,6 +58,7 @@ class QubitSpectroscopyExperiment(BaseExperiment):
         self.qubit_RF = qubit_LO - qubit_IF
 
         self.frequencies = frequencies
+        self._fits = None
         self.frequencies_IF = frequencies + qubit_IF
         self.frequencies_RF = -frequencies + self.qubit_RF  # absolute frequencies
 
@@ -58,16 +67,22 @@ class QubitSpectroscopyExperiment(BaseExperiment):
     # ------------------------------------------------------------------
     def define_program(self):
         self.program = _program(
-            qubit=self.qubit,
+            qubits=self.batch_qubits,
+            options=self.options,
+            detunings=self.frequencies,
+        )
+        self.describe_sweep(
+            "qubit_spectroscopy",
+            qubits=self.batch_qubits,
             options=self.options,
-            frequencies_IF=self.frequencies_IF,
+            detunings=self.frequencies,
         )
 
     # ------------------------------------------------------------------
     # Execution
     # ------------------------------------------------------------------
     def execute_program(self):
-        self.qm = self.qmm.open_qm(self.config)
+        self.qm = self.open_qm()
 
         if self.options.simulate:
             job = self.qm.simulate(
@@ -78,23 +93,35 @@ class QubitSpectroscopyExperiment(BaseExperiment):
             return
 
         # Normal hardware execution
-        job = self.qm.execute(self.program)
+        self.execute()
         variables = ["I", "Q", "state"]
-        results = fetching_tool(job, data_list=variables)
-
-        I, Q, state = results.fetch_all()
-
-        # Average over shots
-        I = np.mean(I, axis=0)
-        Q = np.mean(Q, axis=0)
-        state = np.mean(state, axis=0)
-
-        self.data = {
-            "frequencies": self.frequencies_RF,
-            "I": I,
-            "Q": Q,
-            "state": state,
-        }
+        fetch_list = [
+            stream_name(qubit, name)
+            for qubit in self.batch_qubits
+            for name in stream_names(variables, self.options)
+        ] + metric_streams(self.batch_qubits, self.options)
+        fetched = self.fetch(fetch_list)
+        self._fits = None
+
+        for qubit_id, qubit in zip(self.batch, self.batch_qubits):
+            qubit_RF = qubit.xy.LO_frequency - qubit.xy.intermediate_frequency
+            self.store_data(
+                qubit_id,
+                {
+                    "frequencies": -self.frequencies + qubit_RF,
+                    "qubit_RF": qubit_RF,
+                    **reduce_shots(
+                        qubit_streams(fetched, qubit),
+                        variables,
+                        self.options.n_avg,
+                        self.options,
+                    ),
+                    **qubit_streams(
+                        {k: fetched[k] for k in metric_streams([qubit], self.options)},
+                        qubit,
+                    ),
+                },
+            )
 
     # ------------------------------------------------------------------
     # Analysis
@@ -103,12 +130,28 @@ class QubitSpectroscopyExperiment(BaseExperiment):
         if self.options.simulate:
             return
 
-        I = self.data["I"]
-        state = self.data["state"]
-
-        # Extract minimum (transition point)
-        min_idx = np.argmin(np.abs(I))
-        self.data["max_freq"] = self.data["frequencies"][min_idx]
+        fit = self.fits()[self.qubit_id]
+        self.fit = fit
+        if fit.success:
+            self.data["max_freq"] = self.data["qubit_RF"] + fit["center"]
+        else:
+            # Extract minimum (transition point)
+            min_idx = np.argmin(np.abs(self.data["I"]))
+            self.data["max_freq"] = self.data["frequencies"][min_idx]
+        self.data["freq_error"] = fit.error("center")
+        self.data["fwhm"] = fit["fwhm"]
+
+    def fits(self):
+        """Lorentzian fits of every qubit's line, computed together on first use."""
+        if self._fits is None:
+            signal = "state" if self.options.state_discrimination else "I"
+            data = self.qubit_data if self.multi_qubit else {self.qubit_id: self.data}
+            ids = list(data)
+            traces = np.stack([data[q][signal] for q in ids])
+            # Detunings are shared by all qubits; frequency = qubit_RF + x.
+            fit = fit_lorentzian(-self.frequencies, traces)
+            self._fits = {q: fit.row(i) for i, q in enumerate(ids)}
+        return self._fits
 
     # ------------------------------------------------------------------
     # Plotting
@@ -122,9 +165,16 @@ class QubitSpectroscopyExperiment(BaseExperiment):
 
         plt.figure(figsize=(8, 5))
         plt.plot(freqs, states, label="Measured State")
+        if self.fit.success and self.options.state_discrimination:
+            plt.plot(
+                freqs,
+                lorentzian(freqs - self.data["qubit_RF"], *self.fit.params),
+                "k:",
+                label=f"Lorentzian, FWHM {self.data['fwhm']/1e3:.0f} kHz",
+            )
         plt.axvline(max_freq, color="r", linestyle="--", label="Detected qubit freq")
         plt.axvline(
-            self.qubit_RF, color="g", linestyle="--", label="Current qubit freq"
+            self.data["qubit_RF"], color="g", linestyle="--", label="Current qubit freq"
         )
         plt.xlabel("Frequency [Hz]")
         plt.ylabel("State")
@@ -133,55 +183,77 @@ class QubitSpectroscopyExperiment(BaseExperiment):
         plt.tight_layout()
         plt.show()
 
-    def save_results(self):
-        """Hook into your saving mechanism."""
-        pass
+    def analysis_succeeded(self) -> bool:
+        """A significant line fitted inside the sweep."""
+        if self.options.simulate:
+            return False
+        offsets = -np.asarray(self.frequencies)
+        fit = self.fit
+        return bool(
+            fit.success
+            and offsets.min() <= fit["center"] <= offsets.max()
+            and abs(fit["amplitude"]) > 3 * fit.error("amplitude")
+        )
 
     def update_params(self):
-        """Optionally write back the extracted qubit frequency to params."""
-        pass
+        """Write the fitted qubit frequency back to the calibrations."""
+        if not self.succeeded[self.qubit_id]:
+            print(f"{self.qubit_id}: qubit line not found, not updating")
+            return
+        self.stage_update("qubit/qubit_ge_freq", int(round(self.data["max_freq"])))
 
 
 # -------------------------------------------------------------------------
 # QUA Program Factory
 # -------------------------------------------------------------------------
-def _program(qubit, options: QubitSpecOptions, frequencies_IF):
-    rr = qubit.resonator
+def _program(qubits, options: QubitSpecOptions, detunings):
     n_avg = options.n_avg
+    n_freqs = len(detunings)
+    elements = [q.xy.name for q in qubits] + [q.resonator.name for q in qubits]
 
     with program() as spec:
         n = declare(int)
-        f = declare(int)
+        df = declare(int)  # detuning from each qubit's IF
 
-        I = declare(fixed)
-        Q = declare(fixed)
+        I = [declare(fixed) for _ in qubits]
+        Q = [declare(fixed) for _ in qubits]
+        state = [declare(int) for _ in qubits]
 
-        I_st = declare_stream()
-        Q_st = declare_stream()
-        state = declare(int)
-        state_st = declare_stream()
+        I_st = [declare_stream() for _ in qubits]
+        Q_st = [declare_stream() for _ in qubits]
+        state_st = [declare_stream() for _ in qubits]
+        reset = None
+        if options.active_reset:
+            reset = ActiveReset.from_options(qubits, options)
 
         with for_(n, 0, n < n_avg, n + 1):
-            with for_(*from_array(f, frequencies_IF)):
+            with for_(*from_array(df, detunings)):
 
-                qubit.xy.update_frequency(f)
-                qubit_initialization(qubit, options)
+                for qubit in qubits:
+                    qubit.xy.update_frequency(df + int(qubit.xy.intermediate_frequency))
+                    qubit_initialization(qubit, options, reset)
 
-                qubit.xy.play("saturation")
-                qubit.xy.align()
+                    qubit.xy.play("saturation")
+                align(*elements)
 
-                rr.measure("readout", qua_vars=(I, Q))
+                for i, qubit in enumerate(qubits):
+                    qubit.resonator.measure("readout", qua_vars=(I[i], Q[i]))
 
-                save(I, I_st)
-                save(Q, Q_st)
+                    save(I[i], I_st[i])
+                    save(Q[i], Q_st[i])
 
-                state = discriminate(qubit, I, state)
-                save(state, state_st)
+                    state[i] = discriminate(qubit, I[i], state[i])
+                    save(state[i], state_st[i])
 
         with stream_processing():
-            I_st.buffer(len(frequencies_IF)).buffer(n_avg).save("I")
-            Q_st.buffer(len(frequencies_IF)).buffer(n_avg).save("Q")
-            state_st.buffer(len(frequencies_IF)).buffer(n_avg).save("state")
+            for i, qubit in enumerate(qubits):
+                save_stream(I_st[i], stream_name(qubit, "I"), n_freqs, n_avg, options)
+                save_stream(Q_st[i], stream_name(qubit, "Q"), n_freqs, n_avg, options)
+                save_stream(
+                    state_st[i], stream_name(qubit, "state"), n_freqs, n_avg, options
+                )
+            if reset is not None:
+                reset.save_streams()
 
     return spec
 
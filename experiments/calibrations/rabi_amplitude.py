@@ -1,7 +1,6 @@
 # Refactored Power Rabi Experiment (Updated Script)
 
 import numpy as np
-from scipy.optimize import curve_fit
 from qm.qua import *
 import matplotlib.pyplot as plt
 
@@ -9,8 +8,13 @@ import matplotlib.pyplot as plt
 from qualang_tools.results import progress_counter, fetching_tool
 from qualang_tools.loops import from_array
 from params import QPUConfig
+from analysis.fitting import cosine, fit_cosine
 from utils import Options, u
 from experiments.core.base_experiment import BaseExperiment
+from experiments.core.early_stopping import all_of, contrast_snr, from_options
+from experiments.core.multiplexing import stream_name, qubit_streams
+from macros.pulse_train import pulse_train
+from macros.reset import ActiveReset, metric_streams, qubit_initialization
 
 
 class OptionsPowerRabi(Options):
@@ -19,179 +23,192 @@ class OptionsPowerRabi(Options):
 
 
 class PowerRabiExperiment(BaseExperiment):
+    supports_multi_qubit = True
+
     def __init__(
         self,
         qubit: str,
         options: OptionsPowerRabi = OptionsPowerRabi(),
-        amplitudes: np.ndarray = np.linspace(0, 1, 100),
+        amplitudes: np.ndarray = np.linspace(0, 1.5, 100),
         params: QPUConfig = None,
     ):
         super().__init__(qubit, options, params)
 
-        print(self.params.qubits["q10"].resonator.threshold)
         self.amplitudes = amplitudes
         self.state_discrimination = False
-        self.rabi_amp = self.params.qubits["q10"].gates.square_gate.amplitude
+        self._fits = None
+
+    @property
+    def rabi_amp(self):
+        return self.params.qubits[self.qubit_id].gates.square_gate.amplitude
 
     def define_program(self):
+        qubits = self.batch_qubits
+        n_amps = len(self.amplitudes)
+
         with program() as power_rabi:
             n = declare(int)
             a = declare(fixed)
-            I = declare(fixed)
-            Q = declare(fixed)
-            state = declare(fixed)
-            I_st = declare_stream()
-            Q_st = declare_stream()
-            state_st = declare_stream()
+            I = [declare(fixed) for _ in qubits]
+            Q = [declare(fixed) for _ in qubits]
+            state = [declare(fixed) for _ in qubits]
+            I_st = [declare_stream() for _ in qubits]
+            Q_st = [declare_stream() for _ in qubits]
+            state_st = [declare_stream() for _ in qubits]
             n_st = declare_stream()
+            reset = None
+            if self.options.active_reset:
+                reset = ActiveReset.from_options(qubits, self.options)
 
             with for_(n, 0, n < self.options.n_avg, n + 1):
                 with for_(*from_array(a, self.amplitudes)):
-                    qubit_initialization(self.qubit, self.options)
-
-                    rr = self.qubit.resonator
-                    for _ in range(self.options.num_pis):
-                        self.qubit.xy.play("X180", a)
-                    self.qubit.xy.align()
-
-                    rr.measure("readout", qua_vars=(I, Q))
-                    threshold = self.qubit.parameters.resonator.threshold
-                    with if_(I > threshold):
-                        assign(state, 1)
-                    with else_():
-                        assign(state, 0)
-
-                    save(I, I_st)
-                    save(Q, Q_st)
-                    save(state, state_st)
+                    for qubit in qubits:
+                        qubit_initialization(qubit, self.options, reset)
+
+                    pulse_train(
+                        [qubit.xy for qubit in qubits],
+                        "X180",
+                        self.options.num_pis,
+                        amplitude_scale=a,
+                    )
+                    for qubit in qubits:
+                        qubit.xy.align()
+
+                    for i, qubit in enumerate(qubits):
+                        qubit.resonator.measure("readout", qua_vars=(I[i], Q[i]))
+                        threshold = qubit.parameters.resonator.threshold
+                        with if_(I[i] > threshold):
+                            assign(state[i], 1)
+                        with else_():
+                            assign(state[i], 0)
+
+                        save(I[i], I_st[i])
+                        save(Q[i], Q_st[i])
+                        save(state[i], state_st[i])
 
                 save(n, n_st)
 
             with stream_processing():
-                I_st.buffer(len(self.amplitudes)).average().save("I")
-                Q_st.buffer(len(self.amplitudes)).average().save("Q")
-                state_st.buffer(len(self.amplitudes)).average().save("state")
+                for i, qubit in enumerate(qubits):
+                    I_st[i].buffer(n_amps).average().save(stream_name(qubit, "I"))
+                    Q_st[i].buffer(n_amps).average().save(stream_name(qubit, "Q"))
+                    state_st[i].buffer(n_amps).average().save(
+                        stream_name(qubit, "state")
+                    )
+                if reset is not None:
+                    reset.save_streams()
                 n_st.save("iteration")
 
         self.program = power_rabi
+        self.describe_sweep(
+            "power_rabi",
+            qubits=qubits,
+            options=self.options,
+            amplitudes=self.amplitudes,
+        )
 
     def execute_program(self):
 
-        qm = self.qmm.open_qm(self.config)
-        self.job = qm.execute(self.program)
-        variable_list = ["I", "Q", "state", "iteration"]
-
-        results = fetching_tool(self.job, data_list=variable_list, mode="live")
-
-        while results.is_processing():
-            I, Q, state, iteration = results.fetch_all()
-
-            progress_counter(
-                iteration, self.options.n_avg, start_time=results.get_start_time()
+        self.open_qm()
+        self.execute()
+        variable_list = [
+            stream_name(qubit, name)
+            for qubit in self.batch_qubits
+            for name in ("I", "Q", "state")
+        ] + metric_streams(self.batch_qubits, self.options)
+        variable_list.append("iteration")
+
+        signal = ("state",) if self.options.state_discrimination else ("I", "Q")
+        metric = all_of(
+            *(
+                contrast_snr(*(stream_name(qubit, name) for name in signal))
+                for qubit in self.batch_qubits
             )
+        )
+        early_stopping = from_options(self.options, metric)
+        results = self.live_fetch(variable_list, early_stopping)
 
-        self.results = results
+        fetched = self.fetch(variable_list, results)
+        self._fits = None
+        for qubit_id, qubit in zip(self.batch, self.batch_qubits):
+            self.store_data(qubit_id, qubit_streams(fetched, qubit))
 
     def analyze_results(self):
-        I, Q, state, iteration = self.results.fetch_all()
-
         self.data["amplitudes"] = self.amplitudes
-        self.data["I"] = I
-        self.data["Q"] = Q
-        self.data["state"] = state
-
+        fit = self.fits()[self.qubit_id]
+        self.fit = fit
+        self.y, self.quad_name = self._signal(self.data)
+
+        # num_pis pulses at scale x rotate by 2 pi frequency x.
+        self.data["pi_amplitude_scale"] = self.options.num_pis / (2 * fit["frequency"])
+        self.data["pi_amplitude_scale_error"] = (
+            self.data["pi_amplitude_scale"] * fit.error("frequency") / fit["frequency"]
+        )
+        self.data["pi_amplitude"] = self.rabi_amp * self.data["pi_amplitude_scale"]
+        self.data["fit_params"] = fit.params
+        self.data["fit_errors"] = fit.errors
+        self.data["fit_r_squared"] = fit.r_squared
+
+    def _signal(self, data):
+        """The trace to fit: the state, or the quadrature with more contrast."""
         if self.options.state_discrimination:
-            self.y = state
-        else:
-            Ic = np.max(I) - np.min(I)
-            Qc = np.max(Q) - np.min(Q)
-            self.y = I if Ic > Qc else Q
-            self.quad_name = "I" if Ic > Qc else "Q"
-
-        def cos_fit(x, a, b, c, d):
-            return a * np.cos(2 * np.pi * 1 / b * x + c) + d
-
-        try:
-            self.fit_args = curve_fit(
-                cos_fit,
-                self.x,
-                self.y,
-                p0=[
-                    max(self.y) / 2 - min(self.y) / 2,
-                    self.rabi_amp * 2,
-                    np.pi,
-                    np.mean(self.y),
-                ],
-                maxfev=100000,
-                xtol=1e-8,
-                ftol=1e-8,
-            )[0]
-        except:
-            self.fit_args = None
+            return data["state"], "state"
+        I, Q = data["I"], data["Q"]
+        return (I, "I") if np.ptp(I) > np.ptp(Q) else (Q, "Q")
+
+    def fits(self):
+        """Cosine fits of every qubit, computed together on first use."""
+        if self._fits is None:
+            data = self.qubit_data if self.multi_qubit else {self.qubit_id: self.data}
+            ids = list(data)
+            traces = np.stack([self._signal(data[q])[0] for q in ids])
+            fit = fit_cosine(self.amplitudes, traces)
+            self._fits = {q: fit.row(i) for i, q in enumerate(ids)}
+        return self._fits
 
     def plot_results(self):
+        x = self.data["amplitudes"] * self.rabi_amp * self.options.num_pis * 1e3
+        fit = self.fit
 
-        amplitudes = self.data["amplitudes"]
-        I = self.data["I"]
-        Q = self.data["Q"]
-        state = self.data["state"]
-
-        if not self.options.state_discrimination:
-            plt.plot(amplitudes * self.rabi_amp * self.options.num_pis * 1e3, I, ".")
-        else:
+        plt.plot(x, self.y, ".", label=self.quad_name)
+        if fit.success:
             plt.plot(
-                amplitudes * self.rabi_amp * self.options.num_pis * 1e3, state, "."
+                x,
+                cosine(self.data["amplitudes"], *fit.params),
+                "-",
+                label=f"fit (R$^2$ = {fit.r_squared:.3f})",
             )
-        plt.title("Power Rabi g->e transition")
+        plt.title(
+            f"Power Rabi g->e transition, "
+            f"pi amplitude = {self.data['pi_amplitude'] * 1e3:.2f} mV"
+        )
         plt.xlabel("Rabi amplitude (mV)")
-        plt.ylabel("State")
+        plt.ylabel("State" if self.options.state_discrimination else "Signal")
+        plt.legend()
         plt.show()
 
-    def save_results(self):
-        pass
+    def analysis_succeeded(self) -> bool:
+        """A significant oscillation whose pi amplitude lies inside the sweep.
+
+        The pi amplitude may exceed the last swept amplitude by one standard
+        error, so that a qubit calibrated right at the sweep edge still passes.
+        """
+        fit = self.fit
+        scale = self.data["pi_amplitude_scale"]
+        margin = self.data["pi_amplitude_scale_error"]
+        return bool(
+            fit.success
+            and abs(fit["amplitude"]) > 3 * fit.error("amplitude")
+            and 0 < scale <= np.max(self.amplitudes) + margin
+        )
 
     def update_params(self):
-        pass
-
-
-def active_reset(qubit):
-    threshold = qubit.parameters.resonator.threshold
-    I_reset = declare(fixed)
-    Q_reset = declare(fixed)
-    state_reset = declare(int)
-    for _ in range(2):
-        qubit.xy.align(qubit.resonator.name)
-        qubit.resonator.measure("readout", qua_vars=(I_reset, Q_reset))
-        qubit.resonator.measure("readout", qua_vars=(I_reset, Q_reset))
-        qubit.resonator.measure("readout", qua_vars=(I_reset, Q_reset))
-
-        with if_(I_reset > threshold):
-            assign(state_reset, 1)
-        with else_():
-            assign(state_reset, 0)
-        qubit.xy.align(qubit.resonator.name)
-
-        with if_(state_reset == 1):
-            qubit.xy.play("X180")
-        with else_():
-            pass
-        qubit.resonator.wait(50 * u.us)
-        qubit.xy.align(qubit.resonator.name)
-
-
-def passive_reset(qubit):
-    thermalization_time = qubit.parameters.qubit.thermalization_time
-    thermalization_time = 300 * u.us
-    qubit.xy.align(qubit.resonator.name)
-    wait(thermalization_time, qubit.name)
-    qubit.xy.align(qubit.resonator.name)
-
-
-def qubit_initialization(qubit, options):
-    if options.active_reset:
-        active_reset(qubit)
-    else:
-        passive_reset(qubit)
+        if not self.succeeded[self.qubit_id]:
+            print(f"{self.qubit_id}: Rabi fit failed, not updating")
+            return
+        self.stage_update(
+            "gates/square_gate/amplitude", float(self.data["pi_amplitude"])
+        )
 
 
 if __name__ == "__main__":
@@ -10,8 +10,12 @@ from qualang_tools.loops import from_array
 
 from qpu.transmon import *
 from params import QPUConfig
+from analysis.fitting import fit_lorentzian, lorentzian
 
 from experiments.core.base_experiment import BaseExperiment
+from experiments.core.averaging import save_stream, stream_names, reduce_shots
+from experiments.core.multiplexing import stream_name, qubit_streams
+from macros.reset import thermalization_cycles
 from utils import Options
 from utils import u
 
@@ -22,12 +26,22 @@ from utils import u
 @dataclass
 class ResonatorSpecOptions(Options):
     n_avg: int = 200
+    raw_shots: bool = False  # stream every shot instead of averaging on the server
+    error_bars: bool = False  # also stream sums of squares for standard errors
 
 
 # -------------------------------------------------------------------------
 # EXPERIMENT
 # -------------------------------------------------------------------------
 class ResonatorSpectroscopyExperiment(BaseExperiment):
+    """
+    Resonator response with the qubit in ground and excited state, swept over
+    ``frequencies`` (detunings from each resonator's current frequency).
+    Accepts a list of qubits to measure several resonators in parallel.
+    """
+
+    supports_multi_qubit = True
+
     def __init__(
         self,
         qubit: str,
@@ -37,31 +51,34 @@ class ResonatorSpectroscopyExperiment(BaseExperiment):
     ):
         super().__init__(qubit=qubit, options=options, params=params)
         self.frequencies = frequencies
+        self._fits = None
 
     # --------------------------------------------------
     # QUA program
     # --------------------------------------------------
     def define_program(self):
         rr = self.qubit.resonator
-
-        resonator_LO = rr.frequency_converter_up.LO_frequency
-        resonator_IF = rr.intermediate_frequency
-        self.resonator_freq = resonator_LO - resonator_IF
-
-        self.frequencies_IF = self.frequencies + resonator_IF
+        self.resonator_freq = _resonator_freq(self.qubit)
+        self.frequencies_IF = self.frequencies + rr.intermediate_frequency
         self.frequencies_RF = -self.frequencies + self.resonator_freq
 
         self.program = _program(
-            qubit=self.qubit,
+            qubits=self.batch_qubits,
+            options=self.options,
+            detunings=self.frequencies,
+        )
+        self.describe_sweep(
+            "resonator_spectroscopy",
+            qubits=self.batch_qubits,
             options=self.options,
-            frequencies_IF=self.frequencies_IF,
+            detunings=self.frequencies,
         )
 
     # --------------------------------------------------
     # Execution
     # --------------------------------------------------
     def execute_program(self):
-        self.qm = self.qmm.open_qm(self.config)
+        self.qm = self.open_qm()
 
         if self.options.simulate:
             job = self.qm.simulate(
@@ -70,25 +87,31 @@ class ResonatorSpectroscopyExperiment(BaseExperiment):
             )
             self.data = {"simulation": job.get_simulated_samples()}
         else:
-            job = self.qm.execute(self.program)
+            self.execute()
             variable_list = ["I1", "Q1", "I2", "Q2"]
-            results = fetching_tool(job, data_list=variable_list)
-
-            I1, Q1, I2, Q2 = results.fetch_all()
-
-            # Average over shots (n_avg)
-            I1 = np.mean(I1, axis=0)
-            Q1 = np.mean(Q1, axis=0)
-            I2 = np.mean(I2, axis=0)
-            Q2 = np.mean(Q2, axis=0)
-
-            self.data = {
-                "frequencies": self.frequencies_RF,
-                "I1": I1,
-                "Q1": Q1,
-                "I2": I2,
-                "Q2": Q2,
-            }
+            fetch_list = [
+                stream_name(qubit, name)
+                for qubit in self.batch_qubits
+                for name in stream_names(variable_list, self.options)
+            ]
+            fetched = self.fetch(fetch_list)
+            self._fits = None
+
+            for qubit_id, qubit in zip(self.batch, self.batch_qubits):
+                resonator_freq = _resonator_freq(qubit)
+                self.store_data(
+                    qubit_id,
+                    {
+                        "frequencies": -self.frequencies + resonator_freq,
+                        "resonator_freq": resonator_freq,
+                        **reduce_shots(
+                            qubit_streams(fetched, qubit),
+                            variable_list,
+                            self.options.n_avg,
+                            self.options,
+                        ),
+                    },
+                )
 
     # --------------------------------------------------
     # Analysis
@@ -113,6 +136,16 @@ class ResonatorSpectroscopyExperiment(BaseExperiment):
         idx_max = int(np.argmax(diff))
         f_max = float(freqs[idx_max])
 
+        # Lorentzian dips of the ground and excited responses.
+        fit = self.fits()[self.qubit_id]
+        self.fit = fit
+        f_g, f_e = self.data["resonator_freq"] + fit["center"]
+        self.data["f_ground"] = f_g
+        self.data["f_excited"] = f_e
+        self.data["f_error"] = fit.error("center")
+        self.data["fwhm"] = fit["fwhm"]
+        self.data["chi"] = (f_e - f_g) / 2
+
         self.data["state1"] = state1
         self.data["state2"] = state2
         self.data["amp1"] = amp1
@@ -121,6 +154,25 @@ class ResonatorSpectroscopyExperiment(BaseExperiment):
         self.data["f_max"] = f_max
         self.data["idx_max"] = idx_max
 
+    def fits(self):
+        """Lorentzian fits of |ground| and |excited| of every qubit, done together."""
+        if self._fits is None:
+            data = self.qubit_data if self.multi_qubit else {self.qubit_id: self.data}
+            ids = list(data)
+            traces = np.stack(
+                [
+                    [
+                        np.abs(data[q]["I1"] + 1j * data[q]["Q1"]),
+                        np.abs(data[q]["I2"] + 1j * data[q]["Q2"]),
+                    ]
+                    for q in ids
+                ]
+            )
+            # Detunings are shared by all qubits; frequency = resonator_freq + x.
+            fit = fit_lorentzian(-self.frequencies, traces)
+            self._fits = {q: fit.row(i) for i, q in enumerate(ids)}
+        return self._fits
+
     # --------------------------------------------------
     # Plotting
     # --------------------------------------------------
@@ -144,9 +196,30 @@ class ResonatorSpectroscopyExperiment(BaseExperiment):
         plt.plot(freqs, amp2, label="|state2| (excited)")
         plt.plot(freqs, diff, label="|state1 - state2|")
 
+        if self.fit.success.all():
+            offset = freqs - self.data["resonator_freq"]
+            for params in self.fit.params:
+                plt.plot(freqs, lorentzian(offset, *params), "k:", lw=1)
+            plt.axvline(
+                self.data["f_ground"],
+                color="C0",
+                linestyle=":",
+                label=f"ground: {self.data['f_ground']/1e9:.6f} GHz, "
+                f"FWHM {self.data['fwhm'][0]/1e3:.0f} kHz",
+            )
+            plt.axvline(
+                self.data["f_excited"],
+                color="C1",
+                linestyle=":",
+                label=f"excited: {self.data['f_excited']/1e9:.6f} GHz, "
+                f"chi {self.data['chi']/1e3:.0f} kHz",
+            )
+
         plt.axvline(f_max, linestyle="--", label=f"max diff: {f_max/1e9:.6f} GHz")
         plt.axvline(
-            self.resonator_freq, linestyle="--", label=f"max diff: {f_max/1e9:.6f} GHz"
+            self.data["resonator_freq"],
+            linestyle="--",
+            label=f"current: {self.data['resonator_freq']/1e9:.6f} GHz",
         )
         plt.xlabel("Frequency [Hz]")
         plt.ylabel("Amplitude")
@@ -154,63 +227,83 @@ class ResonatorSpectroscopyExperiment(BaseExperiment):
         plt.grid(True)
         plt.show()
 
-    def save_results(self):
-        # TODO: hook into your usual saving mechanism
-        pass
+    def analysis_succeeded(self) -> bool:
+        """Both dips fitted, with their centres inside the sweep."""
+        if self.options.simulate:
+            return False
+        offsets = -np.asarray(self.frequencies)
+        centers = self.fit["center"]
+        return bool(
+            np.all(self.fit.success)
+            and np.all((centers >= offsets.min()) & (centers <= offsets.max()))
+        )
 
     def update_params(self):
-        # TODO: e.g., update resonator frequency in params based on f_max
-        pass
+        if not self.succeeded[self.qubit_id]:
+            print(f"{self.qubit_id}: resonator fit failed, not updating")
+            return
+        # Read out where the ground and excited responses differ most.
+        self.stage_update("resonator/resonator_freq", int(round(self.data["f_max"])))
 
 
 # -------------------------------------------------------------------------
 # QUA program factory
 # -------------------------------------------------------------------------
-def _program(qubit, options: ResonatorSpecOptions, frequencies_IF):
+def _resonator_freq(qubit):
     rr = qubit.resonator
-    thermalization = 200 * u.us
+    return rr.frequency_converter_up.LO_frequency - rr.intermediate_frequency
 
+
+def _program(qubits, options: ResonatorSpecOptions, detunings):
     n_avg = options.n_avg
-    n_freqs = len(frequencies_IF)
+    n_freqs = len(detunings)
+    elements = [q.xy.name for q in qubits] + [q.resonator.name for q in qubits]
 
     with program() as resonator_spec:
         n = declare(int)  # averaging loop
-        f = declare(int)  # IF frequency
+        df = declare(int)  # detuning from each resonator's IF
 
-        I1 = declare(fixed)
-        Q1 = declare(fixed)
-        I2 = declare(fixed)
-        Q2 = declare(fixed)
+        I1 = [declare(fixed) for _ in qubits]
+        Q1 = [declare(fixed) for _ in qubits]
+        I2 = [declare(fixed) for _ in qubits]
+        Q2 = [declare(fixed) for _ in qubits]
 
-        I_st1 = declare_stream()
-        Q_st1 = declare_stream()
-        I_st2 = declare_stream()
-        Q_st2 = declare_stream()
+        I_st1 = [declare_stream() for _ in qubits]
+        Q_st1 = [declare_stream() for _ in qubits]
+        I_st2 = [declare_stream() for _ in qubits]
+        Q_st2 = [declare_stream() for _ in qubits]
 
         with for_(n, 0, n < n_avg, n + 1):
-            with for_(*from_array(f, frequencies_IF)):
+            with for_(*from_array(df, detunings)):
                 # ---------- Ground state measurement ----------
-                rr.update_frequency(f)
-                rr.measure("readout", qua_vars=(I1, Q1))
-                save(I1, I_st1)
-                save(Q1, Q_st1)
-                wait(thermalization, rr.name)
-                qubit.xy.align()
+                for i, qubit in enumerate(qubits):
+                    rr = qubit.resonator
+                    rr.update_frequency(df + int(rr.intermediate_frequency))
+                    rr.measure("readout", qua_vars=(I1[i], Q1[i]))
+                    save(I1[i], I_st1[i])
+                    save(Q1[i], Q_st1[i])
+                    wait(thermalization_cycles(qubit), rr.name)
+                align(*elements)
 
                 # ---------- Excited state measurement ----------
-                qubit.xy.play("X180")
-                qubit.xy.align()
-
-                rr.measure("readout", qua_vars=(I2, Q2))
-                save(I2, I_st2)
-                save(Q2, Q_st2)
-                wait(thermalization, rr.name)
+                for qubit in qubits:
+                    qubit.xy.play("X180")
+                align(*elements)
+
+                for i, qubit in enumerate(qubits):
+                    rr = qubit.resonator
+                    rr.measure("readout", qua_vars=(I2[i], Q2[i]))
+                    save(I2[i], I_st2[i])
+                    save(Q2[i], Q_st2[i])
+                    wait(thermalization_cycles(qubit), rr.name)
+                align(*elements)
 
         with stream_processing():
-            I_st1.buffer(n_freqs).buffer(n_avg).save("I1")
-            Q_st1.buffer(n_freqs).buffer(n_avg).save("Q1")
-            I_st2.buffer(n_freqs).buffer(n_avg).save("I2")
-            Q_st2.buffer(n_freqs).buffer(n_avg).save("Q2")
+            for i, qubit in enumerate(qubits):
+                save_stream(I_st1[i], stream_name(qubit, "I1"), n_freqs, n_avg, options)
+                save_stream(Q_st1[i], stream_name(qubit, "Q1"), n_freqs, n_avg, options)
+                save_stream(I_st2[i], stream_name(qubit, "I2"), n_freqs, n_avg, options)
+                save_stream(Q_st2[i], stream_name(qubit, "Q2"), n_freqs, n_avg, options)
 
     return resonator_spec
 
@@ -0,0 +1,247 @@
+# Thermalization time calibration
+
+import numpy as np
+from qm.qua import *
+import matplotlib.pyplot as plt
+
+from qualang_tools.loops import from_array
+from params import QPUConfig
+from analysis.fitting import exponential, fit_exponential
+from utils import Options, u
+from experiments.core.base_experiment import BaseExperiment
+from experiments.core.early_stopping import all_of, contrast_snr, from_options
+from experiments.core.multiplexing import stream_name, qubit_streams
+from macros.reset import ActiveReset, metric_streams
+
+
+class OptionsThermalization(Options):
+    n_avg: int = 200
+    target_residual: float = 0.01  # excited population left of a pi pulse
+
+
+def default_waits(T1: float, points: int = 41, span: float = 8) -> np.ndarray:
+    """Evenly spaced waits (ns, whole clock cycles) from 16 ns to ``span`` T1."""
+    step = max(int(round(span * T1 / (points - 1) / 4)), 1)
+    return 4 * (4 + step * np.arange(points))
+
+
+class ThermalizationExperiment(BaseExperiment):
+    """
+    Residual excited population ``waits`` after a pi pulse, in one program.
+
+    Each shot first waits for the longest ``waits`` (or resets actively), so
+    it starts thermalized whatever the current calibration. The decay is
+    fitted with an exponential, and ``thermalization_time`` is the shortest
+    wait after which at most ``target_residual`` of the pi pulse's excitation
+    is left: ``decay * ln(1 / target_residual)``, rounded up to a clock cycle.
+    With ``update_args`` it is written back to ``calibrations.json``, where
+    ``passive_reset`` reads it, but only for a significant decay whose
+    thermalization time lies inside the scanned waits.
+    """
+
+    supports_multi_qubit = True
+
+    def __init__(
+        self,
+        qubit: str,
+        options: OptionsThermalization = OptionsThermalization(),
+        waits: np.ndarray = None,
+        params: QPUConfig = None,
+    ):
+        super().__init__(qubit, options, params)
+
+        if waits is None:
+            T1 = max(self.params.qubits[q].qubit.T1 for q in self.qubit_ids)
+            waits = default_waits(T1)
+        self.cycles = np.round(np.asarray(waits) / 4).astype(int)
+        self.waits = 4 * self.cycles  # ns, as played
+        self._fits = None
+
+    def define_program(self):
+        qubits = self.batch_qubits
+        n_waits = len(self.cycles)
+        elements = [q.xy.name for q in qubits] + [q.resonator.name for q in qubits]
+
+        with program() as thermalization:
+            n = declare(int)
+            t = declare(int)
+            I = [declare(fixed) for _ in qubits]
+            Q = [declare(fixed) for _ in qubits]
+            state = [declare(bool) for _ in qubits]
+            I_st = [declare_stream() for _ in qubits]
+            Q_st = [declare_stream() for _ in qubits]
+            state_st = [declare_stream() for _ in qubits]
+            n_st = declare_stream()
+            reset = None
+            if self.options.active_reset:
+                reset = ActiveReset.from_options(qubits, self.options)
+
+            with for_(n, 0, n < self.options.n_avg, n + 1):
+                with for_(*from_array(t, self.cycles)):
+                    if reset is not None:
+                        for qubit in qubits:
+                            reset(qubit)
+                    else:
+                        wait(int(self.cycles.max()), *elements)
+                    align(*elements)
+
+                    for qubit in qubits:
+                        qubit.xy.play("X180")
+                    align(*elements)
+                    wait(t, *elements)
+
+                    for i, qubit in enumerate(qubits):
+                        qubit.resonator.measure("readout", qua_vars=(I[i], Q[i]))
+                        assign(state[i], I[i] > qubit.parameters.resonator.threshold)
+                        save(I[i], I_st[i])
+                        save(Q[i], Q_st[i])
+                        save(state[i], state_st[i])
+
+                save(n, n_st)
+
+            with stream_processing():
+                for i, qubit in enumerate(qubits):
+                    I_st[i].buffer(n_waits).average().save(stream_name(qubit, "I"))
+                    Q_st[i].buffer(n_waits).average().save(stream_name(qubit, "Q"))
+                    state_st[i].boolean_to_int().buffer(n_waits).average().save(
+                        stream_name(qubit, "state")
+                    )
+                if reset is not None:
+                    reset.save_streams()
+                n_st.save("iteration")
+
+        self.program = thermalization
+        self.describe_sweep(
+            "thermalization",
+            qubits=qubits,
+            options=self.options,
+            waits=self.waits,
+        )
+
+    def execute_program(self):
+        self.open_qm()
+        self.execute()
+        variable_list = [
+            stream_name(qubit, name)
+            for qubit in self.batch_qubits
+            for name in ("I", "Q", "state")
+        ] + metric_streams(self.batch_qubits, self.options)
+        variable_list.append("iteration")
+
+        signal = ("state",) if self.options.state_discrimination else ("I", "Q")
+        metric = all_of(
+            *(
+                contrast_snr(*(stream_name(qubit, name) for name in signal))
+                for qubit in self.batch_qubits
+            )
+        )
+        early_stopping = from_options(self.options, metric)
+        results = self.live_fetch(variable_list, early_stopping)
+
+        fetched = self.fetch(variable_list, results)
+        self._fits = None
+        for qubit_id, qubit in zip(self.batch, self.batch_qubits):
+            self.store_data(qubit_id, qubit_streams(fetched, qubit))
+
+    def analyze_results(self):
+        self.data["waits"] = self.waits
+        fit = self.fits()[self.qubit_id]
+        self.fit = fit
+        self.y, self.quad_name = self._signal(self.data)
+
+        target = self.options.target_residual
+        wait_time = fit["decay"] * np.log(1 / target)
+        self.data["decay"] = fit["decay"]
+        self.data["decay_error"] = fit.error("decay")
+        self.data["target_residual"] = target
+        self.data["thermalization_time"] = int(4 * np.ceil(wait_time / 4))
+        self.data["previous_thermalization_time"] = self.params.qubits[
+            self.qubit_id
+        ].qubit.thermalization_time
+        self.data["fit_params"] = fit.params
+        self.data["fit_errors"] = fit.errors
+        self.data["fit_r_squared"] = fit.r_squared
+
+    def _signal(self, data):
+        """The trace to fit: the state, or the quadrature with more contrast."""
+        if self.options.state_discrimination:
+            return data["state"], "state"
+        I, Q = data["I"], data["Q"]
+        return (I, "I") if np.ptp(I) > np.ptp(Q) else (Q, "Q")
+
+    def fits(self):
+        """Exponential fits of every qubit, computed together on first use."""
+        if self._fits is None:
+            data = self.qubit_data if self.multi_qubit else {self.qubit_id: self.data}
+            ids = list(data)
+            traces = np.stack([self._signal(data[q])[0] for q in ids])
+            fit = fit_exponential(self.waits, traces)
+            self._fits = {q: fit.row(i) for i, q in enumerate(ids)}
+        return self._fits
+
+    def plot_results(self):
+        x = self.data["waits"] / u.us
+        fit = self.fit
+
+        plt.plot(x, self.y, ".", label=self.quad_name)
+        if fit.success:
+            plt.plot(
+                x,
+                exponential(self.data["waits"], *fit.params),
+                "-",
+                label=f"fit, decay = {self.data['decay'] / u.us:.1f} us",
+            )
+        plt.axvline(
+            self.data["thermalization_time"] / u.us,
+            color="k",
+            ls="--",
+            label=f"{self.data['target_residual']:.1%} residual",
+        )
+        plt.title(
+            f"Thermalization, "
+            f"{self.data['previous_thermalization_time'] / u.us:.0f} us -> "
+            f"{self.data['thermalization_time'] / u.us:.0f} us"
+        )
+        plt.xlabel("Wait after pi pulse (us)")
+        plt.ylabel("State" if self.options.state_discrimination else "Signal")
+        plt.legend()
+        plt.show()
+
+    def _rejection(self):
+        """Why the fit must not be written back, or None if it can be."""
+        fit = self.fit
+        if not fit.success:
+            return "the fit failed"
+        if not abs(fit["amplitude"]) > 3 * fit.error("amplitude"):
+            return "no significant decay after the pi pulse"
+        if not self.waits.min() < fit["decay"]:
+            return "the decay is shorter than the first wait"
+        if self.data["thermalization_time"] > self.waits.max():
+            return (
+                f"{self.data['thermalization_time'] / 1e3:.1f} us is extrapolated "
+                f"beyond the longest wait ({self.waits.max() / 1e3:.1f} us)"
+            )
+        return None
+
+    def analysis_succeeded(self) -> bool:
+        return self._rejection() is None
+
+    def update_params(self):
+        reason = self._rejection()
+        if reason is not None:
+            print(f"{self.qubit_id}: {reason}, not updating the thermalization time")
+            return
+        self.stage_update(
+            "qubit/thermalization_time", self.data["thermalization_time"]
+        )
+
+
+if __name__ == "__main__":
+    qubit = "q10"
+    options = OptionsThermalization()
+    options.n_avg = 200
+    options.state_discrimination = False
+    options.update_args = False
+
+    experiment = ThermalizationExperiment(qubit=qubit, options=options)
+    experiment.run()
@@ -0,0 +1,51 @@
+"""
+Shot averaging shared by the spectroscopy experiments.
+
+By default shots are averaged on the server with ``.average()``, so the data
+shipped to the host scales with the number of sweep points rather than with
+shots x sweep points. An optional sum-of-squares stream provides error bars.
+``raw_shots`` keeps the old behaviour of streaming every single shot.
+"""
+
+from typing import Dict, List
+
+import numpy as np
+
+
+def save_stream(stream, name: str, n_points: int, n_avg: int, options):
+    """Stream-processing for one variable. Call inside ``stream_processing()``."""
+    if options.raw_shots:
+        stream.buffer(n_points).buffer(n_avg).save(name)
+        return
+
+    stream.buffer(n_points).average().save(name)
+    if options.error_bars:
+        (stream * stream).buffer(n_points).average().save(f"{name}_sq")
+
+
+def stream_names(names: List[str], options) -> List[str]:
+    """Names to fetch for ``names`` under the averaging mode in ``options``."""
+    if options.raw_shots or not options.error_bars:
+        return list(names)
+    return list(names) + [f"{name}_sq" for name in names]
+
+
+def reduce_shots(fetched: Dict[str, np.ndarray], names: List[str], n_avg: int, options):
+    """Per-point means (and ``<name>_err`` standard errors) from fetched streams."""
+    data = {}
+    for name in names:
+        values = np.asarray(fetched[name])
+
+        if options.raw_shots:
+            data[name] = values.mean(axis=0)
+            if options.error_bars:
+                data[f"{name}_err"] = values.std(axis=0, ddof=1) / np.sqrt(n_avg)
+            continue
+
+        data[name] = values
+        if options.error_bars:
+            mean_sq = np.asarray(fetched[f"{name}_sq"])
+            variance = np.clip(mean_sq - values**2, 0, None) * n_avg / max(n_avg - 1, 1)
+            data[f"{name}_err"] = np.sqrt(variance / n_avg)
+
+    return data
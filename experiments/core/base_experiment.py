@@ -1,33 +1,212 @@
+import time
 from abc import ABC, abstractmethod
-from qm import QuantumMachinesManager, SimulationConfig
+from contextlib import contextmanager
+from typing import Dict, List, Union
+
+import numpy as np
+
+from qm import SimulationConfig
 from utils import Options
 from qm.qua import *
+from qualang_tools.results import progress_counter, fetching_tool
 
 from qpu.transmon import create_machine
+from qpu.qmm_pool import qmm_pool
+from qpu.offline import offline_manager
+from qpu.config_cache import config_cache
+from qpu.qm_session import qm_session
+from experiments.core.multiplexing import batch_qubits
+from experiments.core.result_store import result_store
+from experiments.core.profiling import profile_log, run_profile
+from experiments.core.timing import StageTimer
 from params import QPUConfig
 from qpu.config import *
 
 
 class BaseExperiment(ABC):
+    """
+    Base class of all experiments.
+
+    ``qubit`` is a qubit id such as ``"q10"`` or, for experiments with
+    ``supports_multi_qubit``, a list of ids. In multi-qubit mode the qubits are
+    split into batches without drive- or readout-line conflicts. Each batch
+    runs as one QUA program that drives its qubits simultaneously and streams
+    their results separately. ``self.data`` then maps each qubit id to that
+    qubit's data, and analysis, plotting and updates run once per qubit.
+
+    Every phase of a run is timed in ``self.timer``. Subclasses submit their
+    programs with ``execute`` and read results with ``fetch`` so that compile
+    and execution times, program size and fetched bytes are recorded too.
+    Once processed, the run is added to ``profile_log`` as ``self.profile``.
+    """
+
+    supports_multi_qubit = False
+
     def __init__(
         self,
-        qubit: str,
+        qubit: Union[str, List[str]],
         options: Options,
-        params: QPUConfig = QPUConfig(),
+        params: QPUConfig = None,
     ):
-        self.qubit_id = qubit
+        self.started = time.time()
+        self.timer = StageTimer()
+        self.program_bytes: List[int] = []
+        self.stream_bytes = dict()
+
+        self.multi_qubit = not isinstance(qubit, str)
+        if self.multi_qubit and not self.supports_multi_qubit:
+            raise TypeError(f"{type(self).__name__} runs on a single qubit")
+
+        self.qubit_ids = list(qubit) if self.multi_qubit else [qubit]
+        self.qubit_id = self.qubit_ids[0]
         self.qubit_num = self.qubit_id[1:]
         self.data = dict()
+        self.qubit_data = dict()
         self.program = None
+        self.sweep = None  # (kind, arguments) for the offline backend
         self.options = options
-        self.params = params
+        self.succeeded: Dict[str, bool] = {}  # per qubit, from analysis_succeeded
+        self.param_updates: Dict[str, object] = {}  # staged by stage_update
+        self.params = params if params is not None else QPUConfig.default()
+
+        with self.timer.stage("config"):
+            self.machine = create_machine(self.params)
+            self.config = config_cache.get(self.params, self.machine)
+
+        self.qubits = {q: self.machine.qubits[q[1:]] for q in self.qubit_ids}
+        self.qubit = self.qubits[self.qubit_id]
+
+        if self.multi_qubit:
+            self.batches = batch_qubits(
+                self.params, self.qubit_ids, options.max_multiplexed
+            )
+        else:
+            self.batches = [self.qubit_ids]
+        self.batch = self.batches[0]
+
+    @property
+    def batch_qubits(self):
+        """Transmons driven by the program of the current batch."""
+        return [self.qubits[q] for q in self.batch]
+
+    def store_data(self, qubit_id: str, data: dict):
+        """Record the data of one qubit of the current batch."""
+        self.qubit_data[qubit_id] = data
+        if not self.multi_qubit:
+            self.data = data
+
+    @contextmanager
+    def focus(self, qubit_id: str):
+        """Point ``self.qubit``/``self.data`` at one qubit for per-qubit steps."""
+        saved = self.qubit_id, self.qubit, self.data
+        self.qubit_id, self.qubit = qubit_id, self.qubits[qubit_id]
+        self.data = self.qubit_data.get(qubit_id, self.data)
+        try:
+            yield
+        finally:
+            self.qubit_id, self.qubit, self.data = saved
+
+    @property
+    def qmm(self):
+        # Borrowed from the process-wide pool so that sweeps building many
+        # experiments share one connection to the QOP server.
+        if self.options.offline:
+            return qmm_pool.get(host="offline", port=0, factory=offline_manager)
+        return qmm_pool.get(host=qm_host, port=qm_port)
+
+    def open_qm(self):
+        # Reuses the Quantum Machine left open by a previous experiment when
+        # the config is unchanged (or only differs by live-updatable fields).
+        with self.timer.stage("open_qm"):
+            self.qm = qm_session(self.qmm).open(self.config)
+        return self.qm
+
+    def execute(self, program=None):
+        """Compile and start ``program`` (default ``self.program``) on ``self.qm``.
+
+        Like ``qm.execute``, it replaces whatever is queued or running. Sets
+        and returns ``self.job``.
+        """
+        program = self.program if program is None else program
+        self.program_bytes.append(program.qua_program.ByteSize())
+
+        with self.timer.stage("compile"):
+            if self.options.offline:
+                program_id = self.qm.compile(program, sweep=self.sweep)
+            else:
+                program_id = self.qm.compile(program)
+
+        with self.timer.stage("execute"):
+            self.qm.queue.clear()
+            running = self.qm.get_running_job()
+            if running is not None:
+                running.cancel()
+            job = self.qm.queue.add_compiled(program_id)
+            if hasattr(job, "wait_for_execution"):
+                job = job.wait_for_execution()
+        self.job = job
+        return job
+
+    def describe_sweep(self, kind: str, **arguments):
+        """Record what the current program sweeps, for the offline backend.
+
+        ``kind`` names a generator in ``qpu.transmon_model.PROGRAMS`` and
+        ``arguments`` holds its keyword arguments (qubits, options, sweep
+        arrays). The program itself is left untouched, and the description is
+        ignored on real hardware.
+        """
+        self.sweep = (kind, arguments)
+
+    def fetch(self, data_list, results=None) -> dict:
+        """Wait for ``self.job`` and fetch the streams in ``data_list`` by name.
 
-        self.qmm = QuantumMachinesManager(host=qm_host, port=qm_port)
+        Pass the ``results`` of ``live_fetch`` to read the final values after
+        live fetching instead of waiting again.
+        """
+        if results is None:
+            results = fetching_tool(self.job, data_list=data_list)
+            with self.timer.stage("execute"):
+                self.job.result_handles.wait_for_all_values()
 
-        self.machine = create_machine(params)
-        self.config = self.machine.generate_config()
+        with self.timer.stage("fetch"):
+            values = results.fetch_all()
 
-        self.qubit = self.machine.qubits[self.qubit_num]
+        for name, value in zip(data_list, values):
+            nbytes = 0 if value is None else np.asarray(value).nbytes
+            self.stream_bytes[name] = self.stream_bytes.get(name, 0) + nbytes
+        return dict(zip(data_list, values))
+
+    def live_fetch(self, data_list, early_stopping=None):
+        """Poll ``self.job`` live until it finishes or ``early_stopping`` converges.
+
+        ``data_list`` must end with the ``"iteration"`` stream. Returns the
+        fetching tool; its last fetch holds the averages up to the halt.
+        """
+        results = fetching_tool(self.job, data_list=data_list, mode="live")
+        self.iterations_done = self.options.n_avg
+
+        with self.timer.stage("execute"):
+            self._poll(results, data_list, early_stopping)
+        return results
+
+    def _poll(self, results, data_list, early_stopping):
+        while results.is_processing():
+            *values, iteration = results.fetch_all()
+            progress_counter(
+                iteration, self.options.n_avg, start_time=results.get_start_time()
+            )
+
+            if early_stopping is None or any(v is None for v in values):
+                continue
+            fetched = dict(zip(data_list, values))
+            if early_stopping.converged(fetched, iteration):
+                self.job.halt()
+                self.iterations_done = int(iteration) + 1
+                print(
+                    f"\nConverged after {self.iterations_done}/{self.options.n_avg} "
+                    f"averages (score {early_stopping.score:.3g})"
+                )
+                break
 
     @abstractmethod
     def define_program(self):
@@ -45,44 +224,122 @@ class BaseExperiment(ABC):
     def plot_results(self):
         pass
 
-    @abstractmethod
     def save_results(self):
-        pass
+        """Write ``self.data`` with a parameter snapshot to the result store."""
+        self.saved_path = result_store.save(
+            f"{type(self).__name__}_{self.qubit_id}",
+            self.data,
+            params=self.params,
+            options=self.options,
+            attrs={"qubit": self.qubit_id},
+        )
+        print(f"Saved results to {self.saved_path}")
 
     @abstractmethod
     def update_params(self):
         pass
 
-    def run(self):
-        self.define_program()
+    def analysis_succeeded(self) -> bool:
+        """Whether the analysis of the current qubit gave a usable result.
+
+        Recorded per qubit in ``succeeded``; experiments that write parameters
+        back override it so that a failed fit is never written or validated.
+        """
+        return True
 
+    def stage_update(self, path: str, value):
+        """Queue ``value`` for ``<qubit>/<path>`` in ``calibrations.json``.
+
+        Everything staged by ``update_params`` is written once, after all
+        qubits are processed, and applied to ``self.params`` (see
+        ``write_params``).
+        """
+        self.param_updates[f"{self.qubit_id}/{path}"] = value
+
+    def run(self):
         if self.options.simulate:
-            import matplotlib.pyplot as plt
+            self.define_program()
+            self.simulate()
+            return
 
-            simulation_config = SimulationConfig(
-                duration=self.options.simulate_duration
-            )  # In clock cycles = 4ns
-            job = self.qmm.simulate(self.config, self.program, simulation_config)
-            job.get_simulated_samples().con1.plot()
+        self.acquire()
+        self.process()
 
-            plt.show()
-        else:
+    def simulate(self):
+        import matplotlib.pyplot as plt
+
+        simulation_config = SimulationConfig(
+            duration=self.options.simulate_duration
+        )  # In clock cycles = 4ns
+        job = self.qmm.simulate(self.config, self.program, simulation_config)
+        job.get_simulated_samples().con1.plot()
+
+        plt.show()
 
-            if self.options.dc_set_voltage:
-                # DC.set_voltage(qubit_flux_bias_channel, flux_bias)
-                pass
+    def acquire(self):
+        """Hardware part of ``run``: define and execute every batch's program."""
+        if self.options.dc_set_voltage:
+            # DC.set_voltage(qubit_flux_bias_channel, flux_bias)
+            pass
 
+        for self.batch in self.batches:
+            with self.timer.stage("define_program"):
+                self.define_program()
             self.execute_program()
 
-            if self.options.dc_set_voltage:
-                # DC.set_voltage(qubit_flux_bias_channel, 0)
-                pass
+        if self.options.dc_set_voltage:
+            # DC.set_voltage(qubit_flux_bias_channel, 0)
+            pass
+
+    def process(self, plot: bool = None, write_params: bool = True):
+        """Host part of ``run``: analysis, plotting, saving and updates.
+
+        With ``write_params=False`` the staged updates are kept in
+        ``param_updates`` until ``write_params()`` is called.
+        """
+        plot = self.options.plot if plot is None else plot
+        self.param_updates = {}
+        self._for_each_qubit(lambda: self._process_results(plot))
+
+        if write_params:
+            self.write_params()
 
+        self.profile = run_profile(self, time.time() - self.started, self.started)
+        profile_log.add(self.profile, persist=not self.options.offline)
+
+    def write_params(self):
+        """Write the updates staged by ``update_params`` to ``self.params``."""
+        if self.param_updates:
+            with self.timer.stage("write_params"):
+                self.params.update_calibrations(self.param_updates)
+
+    def render(self):
+        """Plot already analysed results."""
+        self._for_each_qubit(self.plot_results)
+
+    def _for_each_qubit(self, step):
+        if not self.multi_qubit:
+            step()
+            return
+
+        for qubit_id in self.qubit_ids:
+            with self.focus(qubit_id):
+                step()
+        self.data = self.qubit_data
+
+    def _process_results(self, plot: bool):
+        with self.timer.stage("analyze_results", self.qubit_id):
             self.analyze_results()
-            if self.options.plot:
-                self.plot_results()
-            if self.options.save:
-                self.save_results()
+        self.succeeded[self.qubit_id] = self.analysis_succeeded()
+
+        steps = []
+        if plot:
+            steps.append(self.plot_results)
+        if self.options.save:
+            steps.append(self.save_results)
+        if self.options.update_args:
+            steps.append(self.update_params)
 
-            if self.options.update_args:
-                self.update_params()
+        for step in steps:
+            with self.timer.stage(step.__name__, self.qubit_id):
+                step()
@@ -0,0 +1,128 @@
+"""
+Convergence-based early stopping for live-fetched experiments.
+
+Experiments that poll ``fetching_tool(mode="live")`` can hand an
+``EarlyStopping`` to ``BaseExperiment.live_fetch``. On every fetch the
+averaged data is scored with a convergence metric, and once the score reaches
+the target the job is halted with ``job.halt()``. The running averages
+fetched at that point are used for analysis, so well-behaved qubits finish
+well before ``n_avg`` iterations.
+"""
+
+from typing import Callable, Dict, Optional
+
+import numpy as np
+
+
+Metric = Callable[[Dict[str, np.ndarray]], float]
+
+
+def noise_level(y: np.ndarray) -> float:
+    """Noise of a sweep estimated from point-to-point differences.
+
+    Differences of neighbouring points cancel the (smooth) signal, leaving
+    ``sqrt(2)`` times the noise of a single averaged point.
+    """
+    y = np.asarray(y, dtype=float)
+    if y.shape[-1] < 3:
+        return np.inf
+    return float(np.std(np.diff(y, axis=-1)) / np.sqrt(2))
+
+
+def contrast_snr(*names: str) -> Metric:
+    """Metric: contrast (peak-to-peak) over noise of the best of ``names``."""
+
+    def metric(values: Dict[str, np.ndarray]) -> float:
+        best = 0.0
+        for name in names:
+            y = np.asarray(values[name], dtype=float)
+            noise = noise_level(y)
+            if noise > 0 and np.isfinite(noise):
+                best = max(best, float(np.ptp(y)) / noise)
+            elif noise == 0 and np.ptp(y) > 0:
+                best = np.inf
+        return best
+
+    return metric
+
+
+def all_of(*metrics: Metric) -> Metric:
+    """Metric: the worst score of ``metrics`` (e.g. one per qubit)."""
+
+    def metric(values: Dict[str, np.ndarray]) -> float:
+        return min(m(values) for m in metrics)
+
+    return metric
+
+
+def fit_precision(
+    model: Callable, x: np.ndarray, name: str, p0: Callable, index: int
+) -> Metric:
+    """Metric: inverse relative uncertainty of fit parameter ``index``.
+
+    ``p0`` maps the current data to an initial guess. A target of 100 means
+    the parameter must be known to 1%.
+    """
+    from scipy.optimize import curve_fit
+
+    def metric(values: Dict[str, np.ndarray]) -> float:
+        y = np.asarray(values[name], dtype=float)
+        try:
+            popt, pcov = curve_fit(model, x, y, p0=p0(y), maxfev=10000)
+        except (RuntimeError, ValueError):
+            return 0.0
+        error = np.sqrt(np.abs(pcov[index, index]))
+        if not np.isfinite(error):
+            return 0.0
+        return float(np.abs(popt[index]) / error) if error > 0 else np.inf
+
+    return metric
+
+
+class EarlyStopping:
+    """Decides when a live-fetched experiment has converged.
+
+    Args:
+        metric: maps the fetched streams (by name) to a score, higher is better.
+        target: score at which the job is halted.
+        min_iterations: averages to collect before the metric is trusted.
+        patience: number of consecutive fetches that must reach the target.
+    """
+
+    def __init__(
+        self,
+        metric: Metric,
+        target: float,
+        min_iterations: int = 50,
+        patience: int = 2,
+    ):
+        self.metric = metric
+        self.target = target
+        self.min_iterations = min_iterations
+        self.patience = patience
+        self.history = []
+        self._hits = 0
+
+    def converged(self, values: Dict[str, np.ndarray], iteration: int) -> bool:
+        if iteration is None or iteration + 1 < self.min_iterations:
+            return False
+
+        score = self.metric(values)
+        self.history.append((int(iteration), score))
+        self._hits = self._hits + 1 if score >= self.target else 0
+        return self._hits >= self.patience
+
+    @property
+    def score(self) -> Optional[float]:
+        return self.history[-1][1] if self.history else None
+
+
+def from_options(options, metric: Metric) -> Optional[EarlyStopping]:
+    """``EarlyStopping`` configured from ``Options`` (``None`` if disabled)."""
+    if options.early_stop_target is None:
+        return None
+    return EarlyStopping(
+        metric,
+        target=options.early_stop_target,
+        min_iterations=options.early_stop_min_avg,
+    )
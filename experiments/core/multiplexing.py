@@ -0,0 +1,72 @@
+"""
+Grouping of qubits into batches that can be driven and read out in parallel.
+
+Two qubits can share a QUA program when they do not share a drive line and
+their resonators can be read out in the same acquisition window: either on
+the same feedline (frequency multiplexed, up to ``max_multiplexed``
+resonators) or on feedlines wired to different readout inputs.
+"""
+
+from typing import List, Optional
+
+from params import QPUConfig
+from qpu.transmon import feedline_of
+
+
+def _drive_ports(node):
+    return {node.qubit.IQ_input.I, node.qubit.IQ_input.Q}
+
+
+def _readout_inputs(node):
+    return {node.resonator.readout_input.I, node.resonator.readout_input.Q}
+
+
+def conflicts(params: QPUConfig, a: str, b: str) -> bool:
+    """Whether qubits ``a`` and ``b`` cannot run in the same program."""
+    node_a, node_b = params.qubits[a], params.qubits[b]
+    if _drive_ports(node_a) & _drive_ports(node_b):
+        return True
+    if feedline_of(node_a) != feedline_of(node_b):
+        return bool(_readout_inputs(node_a) & _readout_inputs(node_b))
+    return False
+
+
+def batch_qubits(
+    params: QPUConfig, qubit_ids: List[str], max_multiplexed: Optional[int] = None
+) -> List[List[str]]:
+    """Split ``qubit_ids`` into as few conflict-free batches as possible.
+
+    Greedy first-fit in the given order, so a calibration order chosen by the
+    caller is preserved within and across batches.
+    """
+    batches: List[List[str]] = []
+    for qubit_id in qubit_ids:
+        feedline = feedline_of(params.qubits[qubit_id])
+        for batch in batches:
+            if any(conflicts(params, qubit_id, other) for other in batch):
+                continue
+            on_feedline = sum(
+                feedline_of(params.qubits[other]) == feedline for other in batch
+            )
+            if max_multiplexed is not None and on_feedline >= max_multiplexed:
+                continue
+            batch.append(qubit_id)
+            break
+        else:
+            batches.append([qubit_id])
+    return batches
+
+
+def stream_name(qubit, name: str) -> str:
+    """Per-qubit name of a result stream, e.g. ``q10_I``."""
+    return f"q{qubit.id}_{name}"
+
+
+def qubit_streams(fetched: dict, qubit) -> dict:
+    """The entries of ``fetched`` belonging to ``qubit``, with the prefix removed."""
+    prefix = stream_name(qubit, "")
+    return {
+        key[len(prefix):]: value
+        for key, value in fetched.items()
+        if key.startswith(prefix)
+    }
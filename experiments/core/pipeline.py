@@ -0,0 +1,73 @@
+"""
+Pipelined execution of a queue of experiments.
+
+``BaseExperiment.run`` leaves the OPX idle while the host fits and saves.
+``Pipeline`` runs only the hardware part (define and execute) on the calling
+thread. Each finished experiment is handed to a worker pool for analysis,
+saving and parameter updates, while the next experiment is already being
+compiled and executed.
+
+Plots are never drawn on the workers: pyplot keeps global state that is not
+thread-safe, whatever the backend. They are rendered on the calling thread in
+queue order once the pipeline has drained.
+
+Parameter updates are staged on the worker and written on the calling thread
+once every experiment has been acquired and processed, in queue order, so
+that a worker never changes a shared ``QPUConfig`` while the next experiment
+is being defined. Experiments later in the queue are therefore built from the
+parameters as they stood when they were constructed; chain dependent
+calibrations (e.g. a Rabi after a spectroscopy that updates the qubit
+frequency) with ``run`` instead.
+"""
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterable, List
+
+from experiments.core.timing import StageTimer
+
+
+class Pipeline:
+    def __init__(self, max_workers: int = 2):
+        self.max_workers = max_workers
+        self.timer = StageTimer()
+
+    def run(self, experiments: Iterable) -> List:
+        """Run ``experiments`` in order, overlapping hardware and host work."""
+        experiments = list(experiments)
+        futures: List[Future] = []
+
+        with ThreadPoolExecutor(self.max_workers, "experiment-analysis") as pool:
+            for experiment in experiments:
+                label = type(experiment).__name__
+                with self.timer.stage("acquire", label):
+                    experiment.acquire()
+                futures.append(pool.submit(self._process, experiment, label))
+
+            # Surface the first analysis error instead of losing it in the pool.
+            for future in futures:
+                future.result()
+
+        for experiment in experiments:
+            experiment.write_params()
+
+        for experiment in experiments:
+            if experiment.options.plot:
+                with self.timer.stage("plot", type(experiment).__name__):
+                    experiment.render()
+
+        return experiments
+
+    def _process(self, experiment, label: str):
+        with self.timer.stage("process", label):
+            experiment.process(plot=False, write_params=False)
+
+    @property
+    def hardware_utilization(self) -> float:
+        """Fraction of the pipeline's wall time spent acquiring data."""
+        return self.timer.busy_fraction("acquire")
+
+    def summary(self) -> str:
+        return (
+            f"{self.timer.summary()}\n"
+            f"hardware utilization: {self.hardware_utilization:.1%}"
+        )
@@ -0,0 +1,117 @@
+"""
+Per-run profiles of experiments.
+
+``BaseExperiment`` times every phase of a run (config generation,
+``define_program``, ``open_qm``, compile, execution, fetch, analysis,
+plotting, saving and parameter updates). It also records the serialized size
+of each QUA program and the bytes fetched per stream. When the run finishes,
+the numbers become a ``RunProfile`` and are appended to ``profile_log`` in
+memory. With ``save_profiles`` set in ``qpu.config``, hardware runs are also
+appended as one JSON line to ``save_dir/profiles.jsonl``; offline runs never
+are.
+
+``python -m experiments.core.profiling`` prints the last runs of every
+experiment, to spot a phase that got slower at a glance.
+"""
+
+import json
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from qpu.config import save_dir, save_profiles
+
+
+PROFILE_PATH = save_dir / "profiles.jsonl"
+
+PHASES = (
+    "config",
+    "define_program",
+    "open_qm",
+    "compile",
+    "execute",
+    "fetch",
+    "analyze_results",
+    "plot_results",
+    "save_results",
+    "update_params",
+)
+
+
+@dataclass
+class RunProfile:
+    experiment: str
+    qubits: List[str]
+    started: str
+    wall: float  # seconds from construction to the end of processing
+    stages: Dict[str, float]  # seconds per phase, summed over batches and qubits
+    program_bytes: int  # serialized QUA programs, summed over batches
+    stream_bytes: Dict[str, int] = field(default_factory=dict)
+    iterations: Optional[int] = None
+
+    @property
+    def fetched_bytes(self) -> int:
+        return sum(self.stream_bytes.values())
+
+
+class ProfileLog:
+    """In-memory registry of recent profiles, mirrored to ``path`` if one is set."""
+
+    def __init__(self, path: Optional[Path] = None, keep: int = 1000):
+        self.path = Path(path) if path is not None else None
+        self.records = deque(maxlen=keep)
+        self._lock = threading.Lock()
+
+    def add(self, profile: RunProfile, persist: bool = True):
+        """Record ``profile``; with ``persist`` also append it to ``path``, if set."""
+        with self._lock:
+            self.records.append(profile)
+            if persist and self.path is not None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.path, "a") as f:
+                    f.write(json.dumps(asdict(profile)) + "\n")
+
+    def load(self) -> List[RunProfile]:
+        """Every profile in the file, oldest first."""
+        if self.path is None or not self.path.exists():
+            return []
+        with open(self.path) as f:
+            return [RunProfile(**json.loads(line)) for line in f if line.strip()]
+
+    def table(self, profiles: Optional[List[RunProfile]] = None, last: int = 20) -> str:
+        """Phase durations (ms), program size and fetched bytes of recent runs."""
+        profiles = list(self.records) if profiles is None else profiles
+        phases = [p for p in PHASES if any(p in r.stages for r in profiles)]
+        header = f"{'experiment':<32} {'wall':>8}" + "".join(
+            f" {p[:10]:>10}" for p in phases
+        )
+        lines = [header + f" {'program':>9} {'fetched':>10}"]
+        for r in profiles[-last:]:
+            line = f"{r.experiment[:32]:<32} {r.wall * 1e3:>8.0f}"
+            line += "".join(f" {r.stages.get(p, 0.0) * 1e3:>10.1f}" for p in phases)
+            line += f" {r.program_bytes:>9} {r.fetched_bytes:>10}"
+            lines.append(line)
+        return "\n".join(lines)
+
+
+profile_log = ProfileLog(PROFILE_PATH if save_profiles else None)
+
+
+def run_profile(experiment, wall: float, started: float) -> RunProfile:
+    return RunProfile(
+        experiment=type(experiment).__name__,
+        qubits=list(experiment.qubit_ids),
+        started=time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(started)),
+        wall=wall,
+        stages=experiment.timer.totals(),
+        program_bytes=sum(experiment.program_bytes),
+        stream_bytes=dict(experiment.stream_bytes),
+        iterations=getattr(experiment, "iterations_done", None),
+    )
+
+
+if __name__ == "__main__":
+    print(profile_log.table(ProfileLog(PROFILE_PATH).load()))
@@ -0,0 +1,207 @@
+"""
+HDF5 store for experiment results.
+
+Every run is written to its own file under ``save_dir/<date>/``. Arrays
+become chunked, gzip-compressed datasets. Scalars, the experiment options and
+a snapshot of the QPU parameters are stored as attributes, and nested dicts
+(e.g. multi-qubit data) become groups. Data keys share the root attributes
+with the run's metadata, so ``METADATA`` names and ``attrs`` keys are
+rejected as data keys.
+
+Reading is lazy: ``open_run(path)["Ig"]`` is an ``h5py.Dataset``, and slicing
+it reads only the chunks it touches. A 20000-shot x many-amplitude IQ blobs
+scan can therefore be plotted or re-analysed row by row without ever being
+loaded as a whole.
+"""
+
+import json
+import os
+import re
+import time
+from dataclasses import asdict, is_dataclass
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+try:
+    import h5py
+except ImportError:  # optional dependency
+    h5py = None
+
+from qpu.config import save_dir
+
+# Root attributes written by ``ResultStore.save`` itself.
+METADATA = ("name", "created", "params", "params_fingerprint", "options")
+
+
+def _safe(name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", name)
+
+
+def _require_h5py():
+    if h5py is None:
+        raise ImportError("Saving results requires h5py (pip install h5py)")
+
+
+def _json(value) -> str:
+    def default(obj):
+        if is_dataclass(obj):
+            return asdict(obj)
+        if hasattr(obj, "tolist"):
+            return obj.tolist()
+        return str(obj)
+
+    return json.dumps(value, default=default)
+
+
+def params_snapshot(params) -> str:
+    """JSON of every qubit's parameters."""
+    return _json({qubit_id: asdict(node) for qubit_id, node in params.qubits.items()})
+
+
+def _write(group, data: dict):
+    for key, value in data.items():
+        key = str(key)
+        if isinstance(value, dict):
+            _write(group.create_group(key), value)
+            continue
+
+        if value is None:
+            continue
+        if isinstance(value, (str, bool, int, float, np.generic)):
+            group.attrs[key] = value
+            continue
+
+        array = np.asarray(value)
+        if array.dtype == object:
+            group.attrs[key] = _json(value)
+        elif array.ndim == 0:
+            group.attrs[key] = array[()]
+        else:
+            group.create_dataset(
+                key, data=array, chunks=True, compression="gzip", shuffle=True
+            )
+
+
+class StoredRun:
+    """Read-only, lazy view of one saved run. Use as a context manager."""
+
+    def __init__(self, path: Path):
+        _require_h5py()
+        self.path = Path(path)
+        self.file = h5py.File(self.path, "r")
+
+    def __getitem__(self, key):
+        """Dataset or group (lazy) for arrays, the value itself for attributes."""
+        if key in self.file:
+            return self.file[key]
+        return self.file.attrs[key]
+
+    def __contains__(self, key):
+        return key in self.file or key in self.file.attrs
+
+    def keys(self):
+        return list(self.file.keys()) + [
+            k for k in self.file.attrs if k not in ("params", "options")
+        ]
+
+    def load(self, key) -> np.ndarray:
+        """Read a whole dataset into memory."""
+        return self.file[key][()]
+
+    @property
+    def attrs(self):
+        return self.file.attrs
+
+    @property
+    def params(self) -> dict:
+        return json.loads(self.file.attrs["params"])
+
+    @property
+    def options(self) -> dict:
+        return json.loads(self.file.attrs.get("options", "{}"))
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ResultStore:
+    def __init__(self, root: Path = save_dir):
+        self.root = Path(root)
+
+    def save(
+        self,
+        name: str,
+        data: dict,
+        params=None,
+        options=None,
+        attrs: Optional[dict] = None,
+    ) -> Path:
+        """Write one run and return the path of the new file."""
+        _require_h5py()
+        reserved = set(METADATA) | set(attrs or {})
+        clashes = sorted(str(key) for key in data if str(key) in reserved)
+        if clashes:
+            raise ValueError(
+                f"Data keys {clashes} of '{name}' clash with the run's metadata"
+            )
+
+        now = time.localtime()
+        folder = self.root / time.strftime("%Y-%m-%d", now)
+        folder.mkdir(parents=True, exist_ok=True)
+
+        # Claim the name with an exclusive create, so concurrent saves of the
+        # same name (analysis runs on pool threads) never overwrite each other.
+        # h5py's own mode "x" reports a file another thread has open as a
+        # plain OSError, which cannot be told apart from real failures.
+        stem = f"{time.strftime('%H%M%S', now)}_{_safe(name)}"
+        index = 0
+        while True:
+            path = folder / (f"{stem}.h5" if index == 0 else f"{stem}_{index}.h5")
+            try:
+                os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                break
+            except FileExistsError:
+                index += 1
+
+        with h5py.File(path, "w") as f:
+            f.attrs["name"] = name
+            f.attrs["created"] = time.strftime("%Y-%m-%dT%H:%M:%S", now)
+            if params is not None:
+                f.attrs["params"] = params_snapshot(params)
+                f.attrs["params_fingerprint"] = params.fingerprint()
+            if options is not None:
+                f.attrs["options"] = _json(options)
+            for key, value in (attrs or {}).items():
+                f.attrs[key] = value
+            _write(f, data)
+
+        return path
+
+    def runs(self, name: Optional[str] = None):
+        """Saved files, oldest first, optionally only those of ``name``."""
+        runs = sorted(self.root.glob("*/*.h5"))
+        if name is None:
+            return runs
+        stem = re.compile(rf"\d{{6}}_{re.escape(_safe(name))}(_\d+)?")
+        return [path for path in runs if stem.fullmatch(path.stem)]
+
+    def latest(self, name: Optional[str] = None) -> StoredRun:
+        runs = self.runs(name)
+        if not runs:
+            raise FileNotFoundError(f"No saved runs of '{name}' in {self.root}")
+        return StoredRun(runs[-1])
+
+
+def open_run(path: Path) -> StoredRun:
+    return StoredRun(path)
+
+
+result_store = ResultStore()
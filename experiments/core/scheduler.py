@@ -0,0 +1,321 @@
+"""
+Calibration graph: re-run only the calibrations that are out of date.
+
+Each ``CalibrationNode`` builds an experiment for a list of qubits and
+declares the calibration parameters it reads (``inputs``) and writes
+(``outputs``), as paths below the qubit in ``calibrations.json``. Its
+dependencies are listed in ``after``.
+
+For every node and qubit the scheduler records when the calibration was last
+validated and a hash of its inputs at that time. A node is stale for a qubit
+when any of the following holds:
+
+* it never ran, or its result is older than ``max_age``;
+* one of its inputs changed since;
+* an upstream node is stale or was validated more recently.
+
+``calibrate`` runs the stale nodes level by level in dependency order. Within
+a level, independent nodes are pipelined (see ``experiments.core.pipeline``),
+and multi-qubit capable experiments calibrate all their stale qubits in
+parallel programs. A qubit is only marked validated when its experiment's
+``analysis_succeeded`` held; otherwise it stays stale, and so does everything
+downstream of it.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+from params import QPUConfig
+from params.loader import Params, CALIBRATIONS_PATH, BASE_DIR
+from experiments.core.pipeline import Pipeline
+
+
+STATE_PATH = BASE_DIR / "data/calibration_state.json"
+
+
+@dataclass
+class CalibrationNode:
+    name: str
+    build: Callable  # (qubits, params) -> BaseExperiment
+    inputs: Sequence[str] = ()
+    outputs: Sequence[str] = ()
+    after: Sequence[str] = ()
+    max_age: Optional[float] = None  # seconds; None never expires
+    multi_qubit: bool = True  # whether ``build`` accepts a list of qubits
+
+
+@dataclass
+class _Record:
+    validated: float
+    inputs: str
+
+
+class CalibrationGraph:
+    def __init__(self, nodes: Iterable[CalibrationNode], state_path: Path = STATE_PATH):
+        self.nodes: Dict[str, CalibrationNode] = {node.name: node for node in nodes}
+        self.state_path = Path(state_path)
+        self.order = self._topological_order()
+        self.state: Dict[str, Dict[str, _Record]] = self._load_state()
+
+    # --------------------
+    # GRAPH
+    # --------------------
+    def _topological_order(self) -> List[str]:
+        order, visiting, done = [], set(), set()
+
+        def visit(name):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Calibration graph has a cycle through '{name}'")
+            if name not in self.nodes:
+                raise KeyError(f"Unknown calibration '{name}'")
+            visiting.add(name)
+            for parent in self.nodes[name].after:
+                visit(parent)
+            visiting.discard(name)
+            done.add(name)
+            order.append(name)
+
+        for name in self.nodes:
+            visit(name)
+        return order
+
+    def levels(self, names: Iterable[str]) -> List[List[str]]:
+        """``names`` grouped so that each group only depends on earlier groups."""
+        names = set(names)
+        depth: Dict[str, int] = {}
+        for name in self.order:
+            parents = [depth[p] for p in self.nodes[name].after if p in depth]
+            depth[name] = 1 + max(parents, default=-1)
+        grouped: Dict[int, List[str]] = {}
+        for name in self.order:
+            if name in names:
+                grouped.setdefault(depth[name], []).append(name)
+        return [grouped[level] for level in sorted(grouped)]
+
+    # --------------------
+    # STALENESS
+    # --------------------
+    def _load_state(self) -> Dict[str, Dict[str, _Record]]:
+        if not self.state_path.exists():
+            return {}
+        with open(self.state_path) as f:
+            raw = json.load(f)
+        return {
+            name: {qubit: _Record(**record) for qubit, record in qubits.items()}
+            for name, qubits in raw.items()
+        }
+
+    def _save_state(self):
+        raw = {
+            name: {qubit: vars(record) for qubit, record in qubits.items()}
+            for name, qubits in self.state.items()
+        }
+        fd, tmp_path = tempfile.mkstemp(
+            dir=self.state_path.parent, prefix=f".{self.state_path.name}.", suffix=".tmp"
+        )
+        with os.fdopen(fd, "w") as f:
+            json.dump(raw, f, indent=4)
+        os.replace(tmp_path, self.state_path)
+
+    def _input_hash(self, node: CalibrationNode, qubit: str, calibrations: Params) -> str:
+        # A node's own outputs are not inputs: updating them must not make it stale.
+        paths = [p for p in node.inputs if p not in node.outputs]
+        values = calibrations.get_many([f"{qubit}/{p}" for p in paths])
+        payload = json.dumps(dict(zip(paths, values)), sort_keys=True, default=str)
+        return hashlib.sha1(payload.encode()).hexdigest()
+
+    def stale(self, qubits: Sequence[str], force: Iterable[str] = ()) -> Dict[str, List[str]]:
+        """Qubits to recalibrate per node, in dependency order."""
+        calibrations = Params(CALIBRATIONS_PATH, autosave=False)
+        force = set(force)
+        now = time.time()
+        stale: Dict[str, List[str]] = {}
+
+        for name in self.order:
+            node = self.nodes[name]
+            for qubit in qubits:
+                record = self.state.get(name, {}).get(qubit)
+                upstream = [
+                    self.state.get(parent, {}).get(qubit) for parent in node.after
+                ]
+                is_stale = (
+                    name in force
+                    or record is None
+                    or (node.max_age is not None and now - record.validated > node.max_age)
+                    or record.inputs != self._input_hash(node, qubit, calibrations)
+                    or any(qubit in stale.get(parent, ()) for parent in node.after)
+                    or any(r is None or r.validated > record.validated for r in upstream)
+                )
+                if is_stale:
+                    stale.setdefault(name, []).append(qubit)
+
+        return stale
+
+    def mark_validated(self, name: str, qubits: Sequence[str]):
+        calibrations = Params(CALIBRATIONS_PATH, autosave=False)
+        node = self.nodes[name]
+        now = time.time()
+        for qubit in qubits:
+            self.state.setdefault(name, {})[qubit] = _Record(
+                validated=now, inputs=self._input_hash(node, qubit, calibrations)
+            )
+        self._save_state()
+
+    # --------------------
+    # RUNNING
+    # --------------------
+    def calibrate(
+        self,
+        qubits: Sequence[str],
+        force: Iterable[str] = (),
+        dry_run: bool = False,
+    ) -> Dict[str, List[str]]:
+        """Re-run the stale calibrations of ``qubits``; returns what was run.
+
+        Qubits whose analysis failed are skipped by every downstream node.
+        """
+        plan = self.stale(qubits, force)
+        if dry_run:
+            return plan
+
+        blocked: Dict[str, set] = {}  # node -> qubits that failed or were skipped
+        ran: Dict[str, List[str]] = {}
+        for level in self.levels(plan):
+            # Earlier levels may have written new calibrations to disk.
+            params = QPUConfig.default()
+
+            jobs = []
+            for name in level:
+                node = self.nodes[name]
+                todo = [
+                    q
+                    for q in plan[name]
+                    if not any(q in blocked.get(parent, ()) for parent in node.after)
+                ]
+                skipped = [q for q in plan[name] if q not in todo]
+                if skipped:
+                    print(f"{name}: skipping {skipped} after an upstream failure")
+                    blocked.setdefault(name, set()).update(skipped)
+                if not todo:
+                    continue
+                ran[name] = todo
+                if node.multi_qubit:
+                    jobs.append((name, todo, node.build(todo, params)))
+                else:
+                    jobs += [(name, [q], node.build(q, params)) for q in todo]
+
+            Pipeline().run(experiment for _, _, experiment in jobs)
+
+            for name, job_qubits, experiment in jobs:
+                passed = [q for q in job_qubits if experiment.succeeded.get(q, False)]
+                failed = [q for q in job_qubits if q not in passed]
+                if failed:
+                    print(f"{name}: analysis failed for {failed}, left stale")
+                    blocked.setdefault(name, set()).update(failed)
+                if passed:
+                    self.mark_validated(name, passed)
+
+        return ran
+
+
+def default_graph(state_path: Path = STATE_PATH) -> CalibrationGraph:
+    """The standard single-qubit bring-up sequence."""
+    import numpy as np
+
+    from experiments.calibrations.resonator_spectroscopy import (
+        ResonatorSpectroscopyExperiment,
+        ResonatorSpecOptions,
+    )
+    from experiments.calibrations.qubit_spectroscopy import (
+        QubitSpectroscopyExperiment,
+        QubitSpecOptions,
+    )
+    from experiments.calibrations.rabi_amplitude import (
+        PowerRabiExperiment,
+        OptionsPowerRabi,
+    )
+    from experiments.calibrations.fine_rabi import (
+        PowerRabiExperiment as FineRabiExperiment,
+        OptionsPowerRabi as OptionsFineRabi,
+    )
+    from experiments.calibrations.iq_blobs import IQBlobsExperiment, IQBlobsOptions
+    from experiments.calibrations.thermalization import (
+        ThermalizationExperiment,
+        OptionsThermalization,
+    )
+
+    def automatic(options):
+        options.plot = False
+        options.update_args = True
+        return options
+
+    nodes = [
+        CalibrationNode(
+            "resonator_spectroscopy",
+            lambda q, p: ResonatorSpectroscopyExperiment(
+                q,
+                automatic(ResonatorSpecOptions()),
+                p,
+                frequencies=np.arange(-10e6, 10e6, 0.2e6),
+            ),
+            inputs=["resonator/resonator_freq"],
+            outputs=["resonator/resonator_freq"],
+            max_age=24 * 3600,
+        ),
+        CalibrationNode(
+            "qubit_spectroscopy",
+            lambda q, p: QubitSpectroscopyExperiment(
+                q, np.arange(-5e6, 5e6, 0.1e6), automatic(QubitSpecOptions()), p
+            ),
+            inputs=["resonator/resonator_freq", "qubit/qubit_ge_freq"],
+            outputs=["qubit/qubit_ge_freq"],
+            after=["resonator_spectroscopy"],
+            max_age=12 * 3600,
+        ),
+        CalibrationNode(
+            "power_rabi",
+            lambda q, p: PowerRabiExperiment(
+                q, automatic(OptionsPowerRabi()), np.linspace(0, 1.5, 100), p
+            ),
+            inputs=["qubit/qubit_ge_freq", "gates/square_gate/amplitude"],
+            outputs=["gates/square_gate/amplitude"],
+            after=["qubit_spectroscopy"],
+            max_age=12 * 3600,
+        ),
+        CalibrationNode(
+            "fine_rabi",
+            lambda q, p: FineRabiExperiment(q, automatic(OptionsFineRabi()), 30, p),
+            inputs=["gates/square_gate/amplitude"],
+            outputs=["gates/square_gate/amplitude"],
+            after=["power_rabi"],
+            max_age=6 * 3600,
+            multi_qubit=False,
+        ),
+        CalibrationNode(
+            "iq_blobs",
+            lambda q, p: IQBlobsExperiment(q, automatic(IQBlobsOptions()), p),
+            inputs=["gates/square_gate/amplitude", "gates/readout_pulse/amplitude"],
+            outputs=["resonator/threshold", "resonator/rotation_angle"],
+            after=["fine_rabi"],
+            max_age=6 * 3600,
+        ),
+        CalibrationNode(
+            "thermalization",
+            lambda q, p: ThermalizationExperiment(
+                q, automatic(OptionsThermalization()), params=p
+            ),
+            inputs=["gates/square_gate/amplitude"],
+            outputs=["qubit/thermalization_time"],
+            after=["fine_rabi"],
+            max_age=24 * 3600,
+        ),
+    ]
+    return CalibrationGraph(nodes, state_path)
@@ -0,0 +1,65 @@
+"""
+Wall-clock timing of the stages of an experiment run.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+
+@dataclass
+class Stage:
+    name: str
+    start: float
+    end: float
+    label: str = ""
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+
+class StageTimer:
+    """Records ``(name, start, end)`` of named stages; safe to share across threads."""
+
+    def __init__(self):
+        self.stages: List[Stage] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str, label: str = ""):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            with self._lock:
+                self.stages.append(Stage(name, start, end, label))
+
+    def totals(self) -> Dict[str, float]:
+        """Summed duration per stage name."""
+        totals: Dict[str, float] = {}
+        for stage in self.stages:
+            totals[stage.name] = totals.get(stage.name, 0.0) + stage.duration
+        return totals
+
+    def span(self) -> float:
+        if not self.stages:
+            return 0.0
+        return max(s.end for s in self.stages) - min(s.start for s in self.stages)
+
+    def busy_fraction(self, name: str, span: Optional[float] = None) -> float:
+        """Fraction of the wall-clock span spent in stages called ``name``."""
+        span = self.span() if span is None else span
+        return self.totals().get(name, 0.0) / span if span > 0 else 0.0
+
+    def summary(self) -> str:
+        span = self.span()
+        lines = [f"{'stage':<10} {'total [s]':>10} {'share':>7}"]
+        for name, total in self.totals().items():
+            share = total / span if span > 0 else 0.0
+            lines.append(f"{name:<10} {total:>10.3f} {share:>7.1%}")
+        lines.append(f"{'wall':<10} {span:>10.3f}")
+        return "\n".join(lines)
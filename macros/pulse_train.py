@@ -0,0 +1,33 @@
+from typing import Sequence
+
+from qm.qua import *
+
+
+def pulse_train(
+    channels,
+    operation: str,
+    count,
+    amplitude_scale=None,
+    counter=None,
+):
+    """Play ``operation`` ``count`` times on every channel in ``channels``.
+
+    The repetition is a real-time ``for_`` loop, so the compiled program has
+    a single ``play`` per channel whatever ``count`` is, and ``count`` may be
+    a QUA variable swept inside the program. All channels play in the same
+    loop and therefore stay simultaneous, as with unrolled ``play`` calls.
+    A ``count`` of zero plays nothing.
+
+    Args:
+        channels: a quam channel (e.g. ``qubit.xy``) or a list of them.
+        amplitude_scale: passed on to ``play``; a number or QUA expression.
+        counter: QUA ``int`` to use as the loop variable; declared if omitted.
+    """
+    if not isinstance(channels, Sequence):
+        channels = [channels]
+    if counter is None:
+        counter = declare(int)
+
+    with for_(counter, 0, counter < count, counter + 1):
+        for channel in channels:
+            channel.play(operation, amplitude_scale=amplitude_scale)
@@ -1,30 +1,146 @@
+from typing import List, Sequence
+
 from qm.qua import *
-from macros.discrimination import discriminate
 from utils import u
 from qpu.transmon import KatzTransmon
+from experiments.core.multiplexing import stream_name
+
+
+class ActiveReset:
+    """Measurement-based reset: measure, flip the qubits found excited, repeat.
+
+    Construct it once inside the ``program()`` block; it declares its QUA
+    variables there and every ``reset(qubit)`` call reuses them. Each of the
+    ``rounds`` measures the qubit, plays ``X180`` if ``I`` is above the
+    threshold and waits ``wait`` ns for the resonator to ring down.
+
+    ``strategy`` picks how the flip is played: ``"condition"`` uses
+    ``play(..., condition=...)``, which keeps the timing of both branches
+    equal, and ``"if"`` uses an ``if_`` block.
 
+    With ``metrics``, every reset ends with a verification measurement, and
+    two streams per qubit are saved by ``save_streams``:
+    ``reset_residual`` (fraction of shots still found excited after the reset,
+    i.e. one minus the success rate) and ``reset_flips`` (mean number of pi
+    pulses played per reset). Together with the shot rate they tell whether
+    more rounds or a longer wait pay off.
+    """
 
-def active_reset(qubit: KatzTransmon):
-    I = declare(fixed)
-    Q = declare(fixed)
-    state = declare(int)
+    STRATEGIES = ("condition", "if")
 
-    for _ in range(2):
+    def __init__(
+        self,
+        qubits,
+        rounds: int = 2,
+        wait: int = 1 * u.us,
+        strategy: str = "condition",
+        metrics: bool = False,
+    ):
+        if strategy not in self.STRATEGIES:
+            raise ValueError(
+                f"Unknown reset strategy '{strategy}', expected one of {self.STRATEGIES}"
+            )
+        if not isinstance(qubits, Sequence):
+            qubits = [qubits]
+
+        self.qubits = list(qubits)
+        self.rounds = rounds
+        self.wait = u.to_clock_cycles(wait)
+        self.strategy = strategy
+        self.metrics = metrics
+
+        self._I = {q.id: declare(fixed) for q in self.qubits}
+        self._Q = {q.id: declare(fixed) for q in self.qubits}
+        self._excited = {q.id: declare(bool) for q in self.qubits}
+        if metrics:
+            self._flips = {q.id: declare(int) for q in self.qubits}
+            self._residual_st = {q.id: declare_stream() for q in self.qubits}
+            self._flips_st = {q.id: declare_stream() for q in self.qubits}
+
+    @classmethod
+    def from_options(cls, qubits, options) -> "ActiveReset":
+        return cls(
+            qubits,
+            rounds=options.reset_rounds,
+            wait=options.reset_wait,
+            strategy=options.reset_strategy,
+            metrics=options.reset_metrics,
+        )
+
+    def _measure(self, qubit: KatzTransmon):
+        I, Q, excited = self._I[qubit.id], self._Q[qubit.id], self._excited[qubit.id]
+        qubit.xy.align(qubit.resonator.name)
         qubit.resonator.measure("readout", qua_vars=(I, Q))
-        state = discriminate(qubit, I, state)
-        qubit.xy.play("X180")
-        qubit.resonator.wait(1 * u.us)
+        assign(excited, I > qubit.parameters.resonator.threshold)
+        qubit.xy.align(qubit.resonator.name)
+        return excited
+
+    def __call__(self, qubit: KatzTransmon):
+        if self.metrics:
+            flips = self._flips[qubit.id]
+            assign(flips, 0)
+
+        for _ in range(self.rounds):
+            excited = self._measure(qubit)
+            if self.strategy == "condition":
+                qubit.xy.play("X180", condition=excited)
+            else:
+                with if_(excited):
+                    qubit.xy.play("X180")
+            if self.metrics:
+                assign(flips, flips + Cast.to_int(excited))
+            qubit.resonator.wait(self.wait)
+            qubit.xy.align(qubit.resonator.name)
+
+        if self.metrics:
+            excited = self._measure(qubit)
+            save(excited, self._residual_st[qubit.id])
+            save(flips, self._flips_st[qubit.id])
+            qubit.resonator.wait(self.wait)
+            qubit.xy.align(qubit.resonator.name)
+
+    def save_streams(self):
+        """Stream processing of the reset metrics; call inside ``stream_processing()``."""
+        if not self.metrics:
+            return
+        for qubit in self.qubits:
+            self._residual_st[qubit.id].boolean_to_int().average().save(
+                stream_name(qubit, "reset_residual")
+            )
+            self._flips_st[qubit.id].average().save(stream_name(qubit, "reset_flips"))
+
+
+def metric_streams(qubits, options) -> List[str]:
+    """Names of the streams ``ActiveReset.save_streams`` saves under ``options``."""
+    if not (options.active_reset and options.reset_metrics):
+        return []
+    return [
+        stream_name(qubit, name)
+        for qubit in qubits
+        for name in ("reset_residual", "reset_flips")
+    ]
+
+
+def active_reset(qubit: KatzTransmon, options, reset: ActiveReset = None):
+    """Reset ``qubit`` with the program's ``reset``, or a new one from ``options``."""
+    if reset is None:
+        reset = ActiveReset.from_options(qubit, options)
+    reset(qubit)
+
+
+def thermalization_cycles(qubit: KatzTransmon) -> int:
+    """The calibrated ``thermalization_time`` (ns) in clock cycles, for ``wait``."""
+    return max(u.to_clock_cycles(round(qubit.parameters.qubit.thermalization_time)), 4)
 
 
 def passive_reset(qubit):
-    thermalization_time = qubit.parameters.qubit.thermalization_time * u.ns
     qubit.xy.align(qubit.resonator.name)
-    wait(thermalization_time, qubit.name)
+    wait(thermalization_cycles(qubit), qubit.name)
     qubit.xy.align(qubit.resonator.name)
 
 
-def qubit_initialization(qubit, options):
+def qubit_initialization(qubit, options, reset: ActiveReset = None):
     if options.active_reset:
-        active_reset(qubit)
+        active_reset(qubit, options, reset)
     else:
         passive_reset(qubit)
@@ -1,50 +1,172 @@
 import numpy as np
 
-from utils import Options
+from qm.qua import *
+from qualang_tools.results import fetching_tool
+from qualang_tools.loops import from_array
+
+from utils import Options, u
 from params import QPUConfig
 
-from experiments.calibrations.iq_blobs import IQBlobsExperiment, IQBlobsOptions
-from qpu.transmon import u
+from analysis.readout import assignment_fidelity
+from experiments.calibrations.iq_blobs import IQBlobsOptions
+from macros.reset import ActiveReset, metric_streams, qubit_initialization
+from experiments.core.multiplexing import qubit_streams
+from experiments.core.base_experiment import BaseExperiment
 import matplotlib.pyplot as plt
 from scipy.ndimage import gaussian_filter
 
 
+class IQBlobsAmplitudeSweepExperiment(BaseExperiment):
+    """
+    IQ blobs for a whole set of readout amplitudes in a single QUA program.
+
+    The readout pulse is compiled at the largest requested amplitude and swept
+    with ``amplitude_scale`` in a real-time ``for_`` loop; single shots are
+    buffered per amplitude on the server.
+    """
+
+    def __init__(
+        self,
+        qubit: str,
+        amplitudes: np.ndarray,
+        options: IQBlobsOptions = IQBlobsOptions(),
+        params: QPUConfig = None,
+    ):
+        params = params if params is not None else QPUConfig.default()
+        self.amplitudes = np.asarray(amplitudes, dtype=float)
+        if self.amplitudes.size == 0 or not np.all(np.isfinite(self.amplitudes)):
+            raise ValueError("amplitudes must be a non-empty array of finite values")
+        reference = float(np.max(np.abs(self.amplitudes)))
+        if reference == 0:
+            raise ValueError(
+                "amplitudes are all zero; the sweep needs a non-zero amplitude "
+                "to scale the readout pulse from"
+            )
+
+        # Build the config with the readout pulse at the reference amplitude,
+        # on a copy: the caller's params may be shared with other experiments.
+        params = params.copy()
+        params.qubits[qubit].gates.readout_pulse.amplitude = reference
+        super().__init__(qubit=qubit, options=options, params=params)
+
+        self.amplitude_scales = self.amplitudes / reference
+
+    def define_program(self):
+        self.program = _program(self.qubit, self.options, self.amplitude_scales)
+
+    def execute_program(self):
+        self.qm = self.open_qm()
+        self.execute()
+        fetched = self.fetch(
+            ["Ig", "Qg", "Ie", "Qe"] + metric_streams([self.qubit], self.options)
+        )
+
+        # Streams are (n_avg, n_amplitudes); keep one row per amplitude.
+        Ig, Qg, Ie, Qe = (np.asarray(fetched[k]).T for k in ("Ig", "Qg", "Ie", "Qe"))
+        self.data = {
+            "amplitudes": self.amplitudes,
+            "Ig": Ig,
+            "Qg": Qg,
+            "Ie": Ie,
+            "Qe": Qe,
+            **qubit_streams(fetched, self.qubit),
+        }
+
+    def analyze_results(self):
+        angle, threshold, fidelity = assignment_fidelity(
+            self.data["Ig"], self.data["Qg"], self.data["Ie"], self.data["Qe"]
+        )
+        self.data["angle"] = angle
+        self.data["threshold"] = threshold
+        self.data["fidelity"] = fidelity
+
+    def plot_results(self):
+        plt.figure(figsize=(10, 5))
+        plt.plot(self.data["amplitudes"], self.data["fidelity"], ".-")
+        plt.xlabel("Amplitude")
+        plt.ylabel("Fidelity")
+        plt.grid()
+
+    def update_params(self):
+        pass
+
+
+def _program(qubit, options, amplitude_scales):
+    rr = qubit.resonator
+    n_amps = len(amplitude_scales)
+
+    with program() as scan_amplitude:
+        n = declare(int)
+        a = declare(fixed)
+        Ig = declare(fixed)
+        Qg = declare(fixed)
+        Ie = declare(fixed)
+        Qe = declare(fixed)
+        Ig_st = declare_stream()
+        Qg_st = declare_stream()
+        Ie_st = declare_stream()
+        Qe_st = declare_stream()
+        reset = None
+        if options.active_reset:
+            reset = ActiveReset.from_options(qubit, options)
+
+        with for_(n, 0, n < options.n_avg, n + 1):
+            with for_(*from_array(a, amplitude_scales)):
+                # ----------- Ground measurement ---------------
+                qubit_initialization(qubit, options, reset)
+                rr.measure("readout", qua_vars=(Ig, Qg), amplitude_scale=a)
+                save(Ig, Ig_st)
+                save(Qg, Qg_st)
+
+                # ----------- Excited measurement ---------------
+                qubit_initialization(qubit, options, reset)
+                qubit.xy.play("X180")  # π pulse
+                qubit.xy.align(rr.name)
+                rr.measure("readout", qua_vars=(Ie, Qe), amplitude_scale=a)
+                save(Ie, Ie_st)
+                save(Qe, Qe_st)
+
+        with stream_processing():
+            Ig_st.buffer(n_amps).buffer(options.n_avg).save("Ig")
+            Qg_st.buffer(n_amps).buffer(options.n_avg).save("Qg")
+            Ie_st.buffer(n_amps).buffer(options.n_avg).save("Ie")
+            Qe_st.buffer(n_amps).buffer(options.n_avg).save("Qe")
+            if reset is not None:
+                reset.save_streams()
+
+    return scan_amplitude
+
+
 class ScanAmplitude:
     def __init__(
         self,
         qubit: str,
         options: Options,
         amplitudes: np.ndarray,
-        params: QPUConfig = QPUConfig(),
+        params: QPUConfig = None,
     ):
         self.qubit = qubit
         self.options = options
-        self.params = params
+        self.params = params if params is not None else QPUConfig.default()
         self.data = dict()
         self.amplitudes = amplitudes
 
     def run(self):
         self.data["amplitudes"] = self.amplitudes
-        self.data["fidelities"] = []
 
         options = IQBlobsOptions()
         options.simulate = False
         options.n_avg = 20000
         options.plot = False
 
-        for amplitude in self.amplitudes:
-            print(f"Amplitude: {amplitude}")
-            self._update_amplitude(amplitude)
-            iqblobs_experiment = IQBlobsExperiment(self.qubit, options, self.params)
-            iqblobs_experiment.run()
-            data = iqblobs_experiment.data
-            self.data["fidelities"].append(data["fidelity"])
+        experiment = IQBlobsAmplitudeSweepExperiment(
+            self.qubit, self.amplitudes, options, self.params
+        )
+        experiment.run()
+        self.data["fidelities"] = experiment.data["fidelity"]
 
         return self.data
 
-    def _update_amplitude(self, amplitude: float):
-        self.params.qubits[self.qubit].gates.readout_pulse.amplitude = amplitude
-
     def plot_results(self, label: str = ""):
 
         amplitudes = self.data["amplitudes"]
@@ -72,27 +194,29 @@ class ScanAmplitude:
 
 
 if __name__ == "__main__":
+    from optimize.readout.scan_length import ReadoutLengthExperiment, ReadoutLengthOptions
 
     params = QPUConfig()
 
-    lengths = np.arange(1000, 3000, 200)
+    lengths = np.arange(1000, 3000, 200) * u.ns
     amplitudes = np.linspace(0, 0.15, 10)
 
-    fidelities_matrix = []
-
-    for length in lengths:
-
-        l = int(length) * u.ns
-        params.qubits["q10"].gates.readout_pulse.length = l
-
-        scan_amplitude = ScanAmplitude(
-            qubit="q10", options=Options(), amplitudes=amplitudes, params=params
-        )
-        scan_amplitude.run()
-        fidelities_matrix.append(scan_amplitude.data["fidelities"])
-
-    fidelities_matrix = np.array(fidelities_matrix)
-
+    # One sliced acquisition covers every readout length at once.
+    options = ReadoutLengthOptions()
+    options.n_avg = 20000
+    options.slice_length = 50
+    options.plot = False
+
+    experiment = ReadoutLengthExperiment(
+        qubit="q10",
+        lengths=lengths,
+        amplitudes=amplitudes,
+        options=options,
+        params=params,
+    )
+    experiment.run()
+
+    fidelities_matrix = experiment.data["fidelity"].T
 
     plt.figure(figsize=(10, 5))
     plt.title("Scan Amplitude")
@@ -0,0 +1,224 @@
+import numpy as np
+import matplotlib.pyplot as plt
+from dataclasses import dataclass
+
+from qm.qua import *
+from qualang_tools.results import fetching_tool
+from qualang_tools.loops import from_array
+
+from params import QPUConfig
+from utils import u
+
+from analysis.readout import assignment_fidelity
+from experiments.calibrations.iq_blobs import IQBlobsOptions
+from macros.reset import ActiveReset, metric_streams, qubit_initialization
+from experiments.core.multiplexing import qubit_streams
+from optimize.readout.scan_amplitude import IQBlobsAmplitudeSweepExperiment
+from qpu.config_cache import config_cache
+
+
+@dataclass
+class ReadoutLengthOptions(IQBlobsOptions):
+    slice_length: int = 25  # demodulation slice in clock cycles (4 ns)
+
+
+class ReadoutLengthExperiment(IQBlobsAmplitudeSweepExperiment):
+    """
+    Readout fidelity versus integration length from a single acquisition.
+
+    The readout pulse is played at the longest candidate length and demodulated
+    in slices. Summing the first k slices of a shot gives exactly the I/Q that a
+    k-slice integration window would have produced, so every candidate length
+    (and every amplitude of an optional amplitude sweep) is evaluated on the
+    host with one prefix sum instead of one run per length.
+    """
+
+    def __init__(
+        self,
+        qubit: str,
+        lengths: np.ndarray,
+        amplitudes: np.ndarray = None,
+        options: ReadoutLengthOptions = ReadoutLengthOptions(),
+        params: QPUConfig = None,
+    ):
+        params = params if params is not None else QPUConfig.default()
+        slice_ns = 4 * options.slice_length
+        self.lengths = np.asarray(lengths, dtype=int)
+        if np.any(self.lengths % slice_ns) or np.any(self.lengths <= 0):
+            raise ValueError(
+                f"Readout lengths must be positive multiples of the {slice_ns} ns slice"
+            )
+        max_length = int(self.lengths.max())
+        self.n_slices = max_length // slice_ns
+
+        # The pulse is played at the longest length, on a copy of the params.
+        params = params.copy()
+        readout_pulse = params.qubits[qubit].gates.readout_pulse
+        if amplitudes is None:
+            amplitudes = [readout_pulse.amplitude]
+        readout_pulse.length = max_length
+        super().__init__(qubit, amplitudes, options=options, params=params)
+
+        # Integrate over the whole pulse so that every slice carries signal.
+        readout = self.qubit.resonator.operations["readout"]
+        readout.integration_weights = [(1, max_length)]
+        self.config = config_cache.get(
+            self.params,
+            self.machine,
+            extra_operations={f"{self.qubit.resonator.name}.readout": readout},
+        )
+
+    def define_program(self):
+        self.program = _program(
+            self.qubit, self.options, self.amplitude_scales, self.n_slices
+        )
+
+    def execute_program(self):
+        self.qm = self.open_qm()
+        self.execute()
+        fetched = self.fetch(
+            ["Ig", "Qg", "Ie", "Qe"] + metric_streams([self.qubit], self.options)
+        )
+
+        # Streams are (n_avg, n_amplitudes, n_slices) per-slice integrals.
+        Ig, Qg, Ie, Qe = (np.asarray(fetched[k]) for k in ("Ig", "Qg", "Ie", "Qe"))
+        self.data = {
+            "amplitudes": self.amplitudes,
+            "lengths": self.lengths,
+            "Ig": Ig,
+            "Qg": Qg,
+            "Ie": Ie,
+            "Qe": Qe,
+            **qubit_streams(fetched, self.qubit),
+        }
+
+    def analyze_results(self):
+        slice_index = self.lengths // (4 * self.options.slice_length) - 1
+
+        def integrate(x):
+            # (n_avg, n_amps, n_slices) -> (n_amps, n_lengths, n_avg)
+            prefix = np.cumsum(x, axis=-1)[..., slice_index]
+            return np.moveaxis(prefix, 0, -1)
+
+        angle, threshold, fidelity = assignment_fidelity(
+            integrate(self.data["Ig"]),
+            integrate(self.data["Qg"]),
+            integrate(self.data["Ie"]),
+            integrate(self.data["Qe"]),
+        )
+        self.data["angle"] = angle
+        self.data["threshold"] = threshold
+        self.data["fidelity"] = fidelity
+
+        i_amp, i_len = np.unravel_index(np.argmax(fidelity), fidelity.shape)
+        self.data["best_amplitude"] = float(self.amplitudes[i_amp])
+        self.data["best_length"] = int(self.lengths[i_len])
+        self.data["best_fidelity"] = float(fidelity[i_amp, i_len])
+
+    def plot_results(self):
+        amplitudes = self.data["amplitudes"]
+        lengths = self.data["lengths"]
+        fidelity = self.data["fidelity"]
+
+        print(
+            f"Best readout: {self.data['best_length']} ns at amplitude "
+            f"{self.data['best_amplitude']:.4f} ({self.data['best_fidelity']:.1f}%)"
+        )
+
+        plt.figure(figsize=(10, 5))
+        if len(amplitudes) == 1:
+            plt.plot(lengths, fidelity[0], ".-")
+            plt.ylabel("Fidelity")
+        else:
+            plt.pcolormesh(lengths, amplitudes, fidelity)
+            plt.colorbar(label="Fidelity")
+            plt.ylabel("Amplitude")
+        plt.xlabel("Integration length [ns]")
+        plt.title("Readout length optimization")
+        plt.show()
+
+
+def _program(qubit, options, amplitude_scales, n_slices):
+    rr = qubit.resonator
+    n_amps = len(amplitude_scales)
+
+    with program() as scan_length:
+        n = declare(int)
+        k = declare(int)
+        a = declare(fixed)
+        II = declare(fixed, size=n_slices)
+        IQ = declare(fixed, size=n_slices)
+        QI = declare(fixed, size=n_slices)
+        QQ = declare(fixed, size=n_slices)
+        I = declare(fixed)
+        Q = declare(fixed)
+        Ig_st = declare_stream()
+        Qg_st = declare_stream()
+        Ie_st = declare_stream()
+        Qe_st = declare_stream()
+        reset = None
+        if options.active_reset:
+            reset = ActiveReset.from_options(qubit, options)
+
+        def save_slices(I_st, Q_st):
+            with for_(k, 0, k < n_slices, k + 1):
+                assign(I, II[k] + IQ[k])
+                assign(Q, QI[k] + QQ[k])
+                save(I, I_st)
+                save(Q, Q_st)
+
+        with for_(n, 0, n < options.n_avg, n + 1):
+            with for_(*from_array(a, amplitude_scales)):
+                # ----------- Ground measurement ---------------
+                qubit_initialization(qubit, options, reset)
+                rr.measure_sliced(
+                    "readout",
+                    amplitude_scale=a,
+                    segment_length=options.slice_length,
+                    qua_vars=(II, IQ, QI, QQ),
+                )
+                save_slices(Ig_st, Qg_st)
+
+                # ----------- Excited measurement ---------------
+                qubit_initialization(qubit, options, reset)
+                qubit.xy.play("X180")  # π pulse
+                qubit.xy.align(rr.name)
+                rr.measure_sliced(
+                    "readout",
+                    amplitude_scale=a,
+                    segment_length=options.slice_length,
+                    qua_vars=(II, IQ, QI, QQ),
+                )
+                save_slices(Ie_st, Qe_st)
+
+        with stream_processing():
+            Ig_st.buffer(n_slices).buffer(n_amps).buffer(options.n_avg).save("Ig")
+            Qg_st.buffer(n_slices).buffer(n_amps).buffer(options.n_avg).save("Qg")
+            Ie_st.buffer(n_slices).buffer(n_amps).buffer(options.n_avg).save("Ie")
+            Qe_st.buffer(n_slices).buffer(n_amps).buffer(options.n_avg).save("Qe")
+            if reset is not None:
+                reset.save_streams()
+
+    return scan_length
+
+
+if __name__ == "__main__":
+    qubit = "q10"
+
+    options = ReadoutLengthOptions()
+    options.n_avg = 5000
+    options.slice_length = 50  # 200 ns
+
+    params = QPUConfig()
+
+    lengths = np.arange(1000, 3000, 200) * u.ns
+    amplitudes = np.linspace(0.01, 0.15, 10)
+
+    experiment = ReadoutLengthExperiment(
+        qubit=qubit,
+        lengths=lengths,
+        amplitudes=amplitudes,
+        options=options,
+        params=params,
+    )
+    experiment.run()
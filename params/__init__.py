@@ -1,2 +1,2 @@
 from .loader import Params
-from .params_class import QPUConfig
\ No newline at end of file
+from .params_class import QPUConfig, QPUTables
\ No newline at end of file
@@ -1,5 +1,10 @@
+import copy
 import json
+import os
+import stat
+import tempfile
 import yaml
+from contextlib import contextmanager
 from pathlib import Path
 
 
@@ -9,76 +14,193 @@ CALIBRATIONS_PATH = BASE_DIR / "data/calibrations.json"
 HARDWARE_PATH = BASE_DIR / "data/hardware.yaml"
 
 
+_parsed = {}
+
+
+def file_stamp(path: Path):
+    """``(mtime_ns, size)`` of ``path``; changes whenever the file is rewritten."""
+    info = os.stat(path)
+    return info.st_mtime_ns, info.st_size
+
+
+def _parse(path: Path):
+    suffix = path.suffix.lower()
+    with open(path) as f:
+        if suffix == ".json":
+            return json.load(f)
+        elif suffix in (".yaml", ".yml"):
+            return yaml.safe_load(f)
+        else:
+            raise ValueError(f"Unsupported file type: {suffix}")
+
+
+def load_file(path: Path):
+    """Parsed content of a JSON/YAML file, re-read only when its mtime changes.
+
+    The returned object is shared between callers and must not be mutated.
+    """
+    path = Path(path).resolve()
+    stamp = file_stamp(path)
+    cached = _parsed.get(path)
+    if cached is None or cached[0] != stamp:
+        cached = (stamp, _parse(path))
+        _parsed[path] = cached
+    return cached[1]
+
+
 class Params:
-    def __init__(self, path: Path):
+    """
+    Nested parameters stored in a JSON or YAML file, addressed as "a/b/c".
+
+    By default every ``set`` is written to disk immediately. Inside
+    ``transaction()`` (or with ``autosave=False``) changes are only staged in
+    memory and written once by ``save()``. Writes go to a temporary file that
+    is renamed over the original, so a crash never leaves a truncated file.
+    """
+
+    def __init__(self, path: Path, autosave: bool = True):
         self.path = Path(path)
+        self.autosave = autosave
         self.data = self._load()
+        self._dirty = set()
+        self._transactions = 0
+        self._accessors = {}
+        self._generation = 0
 
     # --------------------
     # LOADING / SAVING
     # --------------------
     def _load(self):
-        suffix = self.path.suffix.lower()
-        with open(self.path) as f:
-            if suffix == ".json":
-                return json.load(f)
-            elif suffix in (".yaml", ".yml"):
-                return yaml.safe_load(f)
-            else:
-                raise ValueError(f"Unsupported file type: {suffix}")
+        # Private copy: ``set`` mutates it, the cached parse must stay pristine.
+        return copy.deepcopy(load_file(self.path))
 
     def _save(self):
         suffix = self.path.suffix.lower()
-        with open(self.path, "w") as f:
-            if suffix == ".json":
-                json.dump(self.data, f, indent=4)
-            elif suffix in (".yaml", ".yml"):
-                yaml.safe_dump(self.data, f, sort_keys=False)
-            else:
-                raise ValueError(f"Unsupported file type: {suffix}")
+        if suffix not in (".json", ".yaml", ".yml"):
+            raise ValueError(f"Unsupported file type: {suffix}")
+
+        fd, tmp_path = tempfile.mkstemp(
+            dir=self.path.parent, prefix=f".{self.path.name}.", suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, "w") as f:
+                if suffix == ".json":
+                    json.dump(self.data, f, indent=4)
+                else:
+                    yaml.safe_dump(self.data, f, sort_keys=False)
+                f.flush()
+                os.fsync(f.fileno())
+            # mkstemp creates the file 0600; keep the original's permissions.
+            if self.path.exists():
+                os.chmod(tmp_path, stat.S_IMODE(os.stat(self.path).st_mode))
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    @property
+    def dirty(self) -> bool:
+        """Whether there are staged changes not yet written to disk."""
+        return bool(self._dirty)
+
+    def save(self):
+        """Write staged changes to disk (no-op if nothing changed)."""
+        if not self._dirty:
+            return
+        self._save()
+        self._dirty.clear()
+
+    @contextmanager
+    def transaction(self):
+        """Stage every ``set`` in the block and write the file once at the end.
+
+        If the block raises, the in-memory data is rolled back and nothing is
+        written. Nested transactions commit with the outermost one.
+        """
+        snapshot = copy.deepcopy(self.data)
+        dirty = set(self._dirty)
+        self._transactions += 1
+        try:
+            yield self
+        except BaseException:
+            self.data = snapshot
+            self._dirty = dirty
+            self._invalidate()
+            raise
+        finally:
+            self._transactions -= 1
+
+        if self._transactions == 0 and self.autosave:
+            changed = len(self._dirty)
+            self.save()
+            if changed:
+                print(f"Updated {changed} parameter(s) in '{self.path.name}'")
 
     # --------------------
     # ACCESSORS
     # --------------------
-    def get(self, path, default=None):
-        keys = path.split("/")
-        cur = self.data
+    def accessor(self, path) -> "ParamAccessor":
+        """Precompiled accessor for ``path``, shared by every caller."""
+        acc = self._accessors.get(path)
+        if acc is None:
+            acc = ParamAccessor(self, path)
+            acc._resolve()
+            self._accessors[path] = acc
+        return acc
 
-        for k in keys:
-            if isinstance(cur, dict) and k in cur:
-                cur = cur[k]
-            else:
-                if default is not None:
-                    return default
-                raise KeyError(f"Key not found: '{k}' in '{path}'")
-        return cur
+    def get(self, path, default=None):
+        try:
+            return self.accessor(path).get()
+        except KeyError:
+            if default is not None:
+                return default
+            raise
 
     def set(self, path, value):
-        keys = path.split("/")
-        cur = self.data
+        self.accessor(path).set(value)
 
-        # navigate to parent
-        for k in keys[:-1]:
+    def get_many(self, paths):
+        """Values of several paths, in order."""
+        compiled = self._accessors
+        return [
+            (compiled.get(path) or self.accessor(path)).get() for path in paths
+        ]
+
+    def set_many(self, values: dict):
+        """Set several paths with a single write to disk."""
+        accessors = [(self.accessor(path), value) for path, value in values.items()]
+        with self.transaction():
+            for acc, value in accessors:
+                acc.set(value)
+
+    def reload(self):
+        """Re-read the file, discarding staged changes and compiled accessors."""
+        self.data = self._load()
+        self._dirty.clear()
+        self._invalidate()
+
+    def _invalidate(self):
+        self._generation += 1
+
+    def _walk(self, keys, path):
+        cur = self.data
+        for k in keys:
+            if not isinstance(cur, dict):
+                raise KeyError(f"Cannot descend into non-dict key '{k}' in '{path}'")
             if k not in cur:
-                raise KeyError(
-                    f"Missing parent key '{k}' while accessing '{path}'"
-                )
-            if not isinstance(cur[k], dict):
-                raise KeyError(
-                    f"Cannot descend into non-dict key '{k}' in '{path}'"
-                )
+                raise KeyError(f"Key not found: '{k}' in '{path}'")
             cur = cur[k]
+        return cur
 
-        final_key = keys[-1]
-        if final_key not in cur:
-            raise KeyError(
-                f"Final key '{final_key}' does not exist in '{path}'"
-            )
+    def _assigned(self, path, old, value):
+        # Replacing a whole sub-tree orphans accessors compiled below it.
+        if isinstance(old, dict):
+            self._invalidate()
+        self._dirty.add(path)
 
-        # update and save
-        cur[final_key] = value
-        self._save()
-        print(f"Updated '{path}' → {value}")
+        if self.autosave and self._transactions == 0:
+            self.save()
+            print(f"Updated '{path}' → {value}")
 
     # Pythonic access
     def __getitem__(self, path):
@@ -88,6 +210,50 @@ class Params:
         self.set(path, value)
 
 
+class ParamAccessor:
+    """
+    A ``Params`` path resolved once to its parent dict.
+
+    ``get``/``set`` are a dict lookup instead of a split and a walk. The
+    resolution is redone lazily after ``Params.reload()`` or anything else
+    that replaces the dicts it points into.
+    """
+
+    __slots__ = ("params", "path", "_keys", "_parent", "_key", "_generation")
+
+    def __init__(self, params: Params, path: str):
+        self.params = params
+        self.path = path
+        self._keys = path.split("/")
+        self._parent = None
+        self._key = self._keys[-1]
+        self._generation = -1
+
+    def _resolve(self):
+        parent = self.params._walk(self._keys[:-1], self.path)
+        if not isinstance(parent, dict) or self._key not in parent:
+            raise KeyError(f"Key not found: '{self._key}' in '{self.path}'")
+        self._parent = parent
+        self._generation = self.params._generation
+        return parent
+
+    def get(self):
+        parent = self._parent
+        if self._generation != self.params._generation:
+            parent = self._resolve()
+        return parent[self._key]
+
+    def set(self, value):
+        parent = self._parent
+        if self._generation != self.params._generation:
+            parent = self._resolve()
+        old = parent[self._key]
+        parent[self._key] = value
+        self.params._assigned(self.path, old, value)
+
+    __call__ = get
+
+
 # --------------------
 # USAGE EXAMPLE
 # --------------------
@@ -99,6 +265,9 @@ if __name__ == "__main__":
     from pprint import pprint
     pprint(hardware.data)
 
-    # Example updates:
+    # Example updates (written once, atomically):
+    # with calibrations.transaction():
+    #     calibrations["q10/qubit/qubit_freq"] = 4.59e9
+    #     calibrations["q10/gates/square_gate/amplitude"] = 0.07
     # hardware["q10/qubit/qubit_LO"] = 4.5e9
     # print(hardware["q10/qubit/qubit_LO"])
\ No newline at end of file
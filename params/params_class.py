@@ -1,9 +1,22 @@
-from dataclasses import dataclass, field
+import copy
+import hashlib
+import json
+import threading
+from dataclasses import dataclass, field, asdict, fields
 from typing import List, Dict, Any
 
-from params import Params
+import numpy as np
 
-from params.loader import HARDWARE_PATH, CALIBRATIONS_PATH
+from params.loader import (
+    HARDWARE_PATH,
+    CALIBRATIONS_PATH,
+    Params,
+    file_stamp,
+    load_file,
+)
+
+# Serializes read-modify-write cycles of calibrations.json across threads.
+_calibrations_lock = threading.Lock()
 
 # ---------- Basic Structures ----------
 
@@ -132,6 +145,8 @@ class ResonatorConfig:
     smearing: float
     rotation_angle: float
     threshold: float
+    readout_input: IQInput = field(default_factory=lambda: IQInput(I=1, Q=2))
+    feedline: str = None
 
     @property
     def IF_freq(self) -> float:
@@ -148,105 +163,270 @@ class QPUNode:
     gates: GatesConfig
 
 
+# ---------- Column-wise Tables ----------
+
+
+_QUBIT_COLUMNS = {
+    "qubit_LO": lambda n: n.qubit.qubit_LO,
+    "qubit_ge_freq": lambda n: n.qubit.qubit_ge_freq,
+    "qubit_ef_freq": lambda n: n.qubit.qubit_ef_freq,
+    "T1": lambda n: n.qubit.T1,
+    "T2": lambda n: n.qubit.T2,
+    "thermalization_time": lambda n: n.qubit.thermalization_time,
+    "resonator_LO": lambda n: n.resonator.resonator_LO,
+    "resonator_freq": lambda n: n.resonator.resonator_freq,
+    "time_of_flight": lambda n: n.resonator.time_of_flight,
+    "smearing": lambda n: n.resonator.smearing,
+    "rotation_angle": lambda n: n.resonator.rotation_angle,
+    "threshold": lambda n: n.resonator.threshold,
+}
+
+
+def _gate_column(gate: str, attribute: str):
+    return lambda n: getattr(getattr(n.gates, gate), attribute)
+
+
+for _gate in fields(GatesConfig):
+    for _attribute in ("amplitude", "length"):
+        _QUBIT_COLUMNS[f"{_gate.name}_{_attribute}"] = _gate_column(
+            _gate.name, _attribute
+        )
+
+
+class QPUTables:
+    """
+    Struct-of-arrays view of a ``QPUConfig``: one float array per parameter,
+    indexed by qubit in the order of ``ids``.
+
+    ``tables.threshold`` or ``tables["readout_pulse_amplitude"]`` give every
+    qubit's value at once; ``tables.index["q10"]`` is the row of a qubit.
+    Missing values are NaN.
+    """
+
+    columns = tuple(_QUBIT_COLUMNS)
+
+    def __init__(self, ids: List[str], data: Dict[str, np.ndarray]):
+        self.ids = list(ids)
+        self.index = {qubit_id: i for i, qubit_id in enumerate(self.ids)}
+        self._data = data
+
+    @classmethod
+    def from_nodes(cls, nodes: Dict[str, QPUNode]) -> "QPUTables":
+        ids = list(nodes)
+        data = {}
+        for name, get in _QUBIT_COLUMNS.items():
+            values = (get(nodes[qubit_id]) for qubit_id in ids)
+            data[name] = np.array(
+                [np.nan if v is None else v for v in values], dtype=float
+            )
+        return cls(ids, data)
+
+    @property
+    def qubit_IF(self) -> np.ndarray:
+        return self.qubit_LO - self.qubit_ge_freq
+
+    @property
+    def resonator_IF(self) -> np.ndarray:
+        return self.resonator_LO - self.resonator_freq
+
+    @property
+    def anharmonicity(self) -> np.ndarray:
+        return self.qubit_ef_freq - self.qubit_ge_freq
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        if name in self._data:
+            return self._data[name]
+        if name in ("qubit_IF", "resonator_IF", "anharmonicity"):
+            return getattr(self, name)
+        raise KeyError(name)
+
+    def __getattr__(self, name: str) -> np.ndarray:
+        data = self.__dict__.get("_data", {})
+        if name in data:
+            return data[name]
+        raise AttributeError(name)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def row(self, qubit_id: str) -> Dict[str, float]:
+        i = self.index[qubit_id]
+        return {name: float(column[i]) for name, column in self._data.items()}
+
+
 class QPUConfig:
     qubits: Dict[str, QPUNode]
 
+    _default = None
+    _default_stamp = None
+
     def __init__(self):
         self.qubits = self._from_dict()
+        self._tables = None
+
+    @classmethod
+    def default(cls) -> "QPUConfig":
+        """Shared config built on first use and rebuilt when the files change.
+
+        Use this for default arguments instead of ``QPUConfig()`` so that
+        importing a module does not read the parameter files.
+        """
+        stamp = (file_stamp(HARDWARE_PATH), file_stamp(CALIBRATIONS_PATH))
+        if cls._default is None or cls._default_stamp != stamp:
+            cls._default = cls()
+            cls._default_stamp = stamp
+        return cls._default
+
+    def fingerprint(self) -> str:
+        """Stable content hash of every qubit's parameters."""
+        content = {qubit_id: asdict(node) for qubit_id, node in self.qubits.items()}
+        payload = json.dumps(content, sort_keys=True, default=str)
+        return hashlib.sha1(payload.encode()).hexdigest()
+
+    @property
+    def tables(self) -> "QPUTables":
+        """Column-wise view of every qubit's parameters, built on first use.
+
+        The tables are a snapshot: call ``invalidate_tables()`` after editing
+        the per-qubit dataclasses.
+        """
+        if self._tables is None:
+            self._tables = QPUTables.from_nodes(self.qubits)
+        return self._tables
+
+    def invalidate_tables(self):
+        self._tables = None
+
+    def copy(self) -> "QPUConfig":
+        """Independent copy, to derive a modified config without touching this one."""
+        clone = copy.copy(self)
+        clone.qubits = copy.deepcopy(self.qubits)
+        clone._tables = None
+        return clone
+
+    def update_calibrations(self, values: Dict[str, Any]):
+        """Write ``{"q10/qubit/T1": value, ...}`` to ``calibrations.json`` at once.
+
+        The same values are applied to this config's dataclasses, so
+        experiments built from it afterwards see them without a reload.
+        """
+        if not values:
+            return
+        with _calibrations_lock:
+            Params(CALIBRATIONS_PATH).set_many(values)
+
+        for path, value in values.items():
+            qubit_id, *keys, attribute = path.split("/")
+            node = self.qubits[qubit_id]
+            for key in keys:
+                node = getattr(node, key)
+            setattr(node, attribute, value)
+        self.invalidate_tables()
 
     @staticmethod
     def _from_dict(hardware=None, calibrations=None):
 
         if hardware is None:
-            hardware = Params(HARDWARE_PATH).__dict__["data"]
+            hardware = load_file(HARDWARE_PATH)
         if calibrations is None:
-            calibrations = Params(CALIBRATIONS_PATH).__dict__["data"]
+            calibrations = load_file(CALIBRATIONS_PATH)
 
         parsed = {}
 
         for qubit_id in hardware.keys():
+            if qubit_id not in calibrations:
+                raise KeyError(f"No calibrations for qubit '{qubit_id}'")
 
-            calibrations = calibrations[qubit_id]
-            hardware = hardware[qubit_id]
-
-            calibrations_q = calibrations["qubit"]
-            calibrations_r = calibrations["resonator"]
-            calibrations_g = calibrations["gates"]
-
-            hardware_q = hardware["qubit"]
-            hardware_r = hardware["resonator"]
-
-            # ---- qubit output channels ----
-            q_out = hardware_q["output"]
-            q_chan = q_out["channel"]
-            q_off = q_out["offset"]
-
-            qubit_cfg = QubitConfig(
-                IQ_input=IQInput(
-                    I=q_chan.get("I", 0),
-                    Q=q_chan.get("Q", 0),
-                ),
-                IQ_bias=IQBias(
-                    I=q_off.get("I", 0.0),
-                    Q=q_off.get("Q", 0.0),
-                ),
-                correction_gain=hardware_q.get("correction_gain"),
-                correction_phase=hardware_q.get("correction_phase"),
-                qubit_LO=hardware_q.get("LO_frequency"),
-                qubit_ge_freq=calibrations_q.get("qubit_ge_freq"),
-                qubit_ef_freq=calibrations_q.get("qubit_ef_freq"),
-                T1=calibrations_q.get("T1"),
-                T2=calibrations_q.get("T2"),
-                thermalization_time=calibrations_q.get("thermalization_time"),
-            )
-
-            # # # ---- resonator output channels ----
-            hw_res = hardware_r["output"]
-            r_chan = hw_res["channel"]
-            r_off = hw_res["offset"]
-
-            resonator_cfg = ResonatorConfig(
-                IQ_input=IQInput(
-                    I=r_chan.get("I", 0),
-                    Q=r_chan.get("Q", 0),
-                ),
-                IQ_bias=IQBias(
-                    I=r_off.get("I", 0.0),
-                    Q=r_off.get("Q", 0.0),
-                ),
-                correction_gain=hardware_r.get("correction_gain"),
-                correction_phase=hardware_r.get("correction_phase"),
-                resonator_LO=hardware_r.get("LO_frequency"),
-                resonator_freq=calibrations_r.get("resonator_freq"),
-                time_of_flight=calibrations_r.get("time_of_flight"),
-                smearing=calibrations_r.get("smearing"),
-                rotation_angle=calibrations_r.get("rotation_angle"),
-                threshold=calibrations_r.get("threshold"),
-            )
-
-            # # # ---- gates ----
-            calibrations_g = calibrations["gates"]
-
-            gates_cfg = GatesConfig(
-                square_gate=SquareGate(**calibrations_g["square_gate"]),
-                gaussian_gate=GaussianGate(**calibrations_g["gaussian_gate"]),
-                cos_gate=CosGate(**calibrations_g["cos_gate"]),
-                drag_cos_gate=DragCosGate(**calibrations_g["drag_cos_gate"]),
-                drag_gaussian_gate=DragGaussianGate(
-                    **calibrations_g["drag_gaussian_gate"]
-                ),
-                saturation_pulse=SaturationPulse(**calibrations_g["saturation_pulse"]),
-                readout_pulse=ReadoutPulse(**calibrations_g["readout_pulse"]),
-            )
-
-            parsed[qubit_id] = QPUNode(
-                qubit=qubit_cfg,
-                resonator=resonator_cfg,
-                gates=gates_cfg,
+            parsed[qubit_id] = QPUConfig._parse_node(
+                hardware[qubit_id], calibrations[qubit_id]
             )
 
         return parsed
 
+    @staticmethod
+    def _parse_node(hardware, calibrations) -> QPUNode:
+        calibrations_q = calibrations["qubit"]
+        calibrations_r = calibrations["resonator"]
+        calibrations_g = calibrations["gates"]
+
+        hardware_q = hardware["qubit"]
+        hardware_r = hardware["resonator"]
+
+        # ---- qubit output channels ----
+        q_out = hardware_q["output"]
+        q_chan = q_out["channel"]
+        q_off = q_out["offset"]
+
+        qubit_cfg = QubitConfig(
+            IQ_input=IQInput(
+                I=q_chan.get("I", 0),
+                Q=q_chan.get("Q", 0),
+            ),
+            IQ_bias=IQBias(
+                I=q_off.get("I", 0.0),
+                Q=q_off.get("Q", 0.0),
+            ),
+            correction_gain=hardware_q.get("correction_gain"),
+            correction_phase=hardware_q.get("correction_phase"),
+            qubit_LO=hardware_q.get("LO_frequency"),
+            qubit_ge_freq=calibrations_q.get("qubit_ge_freq"),
+            qubit_ef_freq=calibrations_q.get("qubit_ef_freq"),
+            T1=calibrations_q.get("T1"),
+            T2=calibrations_q.get("T2"),
+            thermalization_time=calibrations_q.get("thermalization_time"),
+        )
+
+        # # # ---- resonator output channels ----
+        hw_res = hardware_r["output"]
+        r_chan = hw_res["channel"]
+        r_off = hw_res["offset"]
+        r_in_chan = hardware_r.get("input", {}).get("channel", {})
+
+        resonator_cfg = ResonatorConfig(
+            IQ_input=IQInput(
+                I=r_chan.get("I", 0),
+                Q=r_chan.get("Q", 0),
+            ),
+            IQ_bias=IQBias(
+                I=r_off.get("I", 0.0),
+                Q=r_off.get("Q", 0.0),
+            ),
+            correction_gain=hardware_r.get("correction_gain"),
+            correction_phase=hardware_r.get("correction_phase"),
+            resonator_LO=hardware_r.get("LO_frequency"),
+            resonator_freq=calibrations_r.get("resonator_freq"),
+            time_of_flight=calibrations_r.get("time_of_flight"),
+            smearing=calibrations_r.get("smearing"),
+            rotation_angle=calibrations_r.get("rotation_angle"),
+            threshold=calibrations_r.get("threshold"),
+            readout_input=IQInput(
+                I=r_in_chan.get("I", 1),
+                Q=r_in_chan.get("Q", 2),
+            ),
+            feedline=hardware_r.get("feedline"),
+        )
+
+        # # # ---- gates ----
+        calibrations_g = calibrations["gates"]
+
+        gates_cfg = GatesConfig(
+            square_gate=SquareGate(**calibrations_g["square_gate"]),
+            gaussian_gate=GaussianGate(**calibrations_g["gaussian_gate"]),
+            cos_gate=CosGate(**calibrations_g["cos_gate"]),
+            drag_cos_gate=DragCosGate(**calibrations_g["drag_cos_gate"]),
+            drag_gaussian_gate=DragGaussianGate(
+                **calibrations_g["drag_gaussian_gate"]
+            ),
+            saturation_pulse=SaturationPulse(**calibrations_g["saturation_pulse"]),
+            readout_pulse=ReadoutPulse(**calibrations_g["readout_pulse"]),
+        )
+
+        return QPUNode(
+            qubit=qubit_cfg,
+            resonator=resonator_cfg,
+            gates=gates_cfg,
+        )
+
 
 if __name__ == "__main__":
 
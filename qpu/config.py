@@ -2,6 +2,8 @@
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
+save_dir = BASE_DIR / "data"
+save_profiles = False  # append every run's profile to save_dir/profiles.jsonl
 
 sa_address = "TCPIP0::192.168.43.100::inst0::INSTR"
 qm_host = "192.168.43.253"
@@ -0,0 +1,169 @@
+"""
+Content-hashed cache for ``machine.generate_config()``.
+
+Generating the QUA config walks the whole QUAM tree and is the dominant host
+cost when constructing an experiment. Configs are cached by the fingerprint of
+the ``QPUConfig`` they were built from plus any operations added to the machine
+afterwards, and handed out as copy-on-write views of the cached dict.
+"""
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from params import QPUConfig
+
+
+class CowDict(dict):
+    """Dict that shares nested containers with a cached original until written.
+
+    Nested dicts and lists are copied the first time they are looked up by key,
+    so ``config["elements"]["10"]["intermediate_frequency"] = f`` only copies
+    the branch it walks through. Writes must go through indexing or ``get``;
+    containers reached via ``values()``/``items()`` are still shared.
+
+    ``cache_key`` identifies the cached config this view was created from. It
+    is cleared as soon as the view hands out a nested container or is written
+    to, since the content may no longer match the cached original.
+    """
+
+    __slots__ = ("cache_key",)
+
+    def __init__(self, *args, cache_key: Optional[str] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache_key = cache_key
+
+    def __getitem__(self, key):
+        value = dict.__getitem__(self, key)
+        if type(value) is dict or type(value) is list:
+            value = _cow(value)
+            dict.__setitem__(self, key, value)
+        if isinstance(value, (CowDict, CowList)):
+            self.cache_key = None
+        return value
+
+    def __setitem__(self, key, value):
+        self.cache_key = None
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        self.cache_key = None
+        dict.__delitem__(self, key)
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def pop(self, *args):
+        self.cache_key = None
+        return dict.pop(self, *args)
+
+    def update(self, *args, **kwargs):
+        self.cache_key = None
+        dict.update(self, *args, **kwargs)
+
+
+class CowList(list):
+    """List counterpart of :class:`CowDict`."""
+
+    __slots__ = ()
+
+    def __getitem__(self, index):
+        value = list.__getitem__(self, index)
+        if isinstance(index, int) and (type(value) is dict or type(value) is list):
+            value = _cow(value)
+            list.__setitem__(self, index, value)
+        return value
+
+
+def _cow(value):
+    if type(value) is dict:
+        return CowDict(value)
+    return CowList(value)
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class ConfigCache:
+    """LRU cache of generated QUA configs."""
+
+    def __init__(self, maxsize: int = 32):
+        self.maxsize = maxsize
+        self.stats = CacheStats()
+        self._configs: "OrderedDict[str, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(params: QPUConfig, extra_operations: Optional[Dict] = None) -> str:
+        """Hash of the parameter set plus operations added after ``create_machine``."""
+        key = params.fingerprint()
+        if extra_operations:
+            operations = {
+                name: op.to_dict() if hasattr(op, "to_dict") else repr(op)
+                for name, op in extra_operations.items()
+            }
+            payload = json.dumps(operations, sort_keys=True, default=str)
+            key += hashlib.sha1(payload.encode()).hexdigest()
+        return key
+
+    def get(
+        self,
+        params: QPUConfig,
+        machine,
+        extra_operations: Optional[Dict] = None,
+    ) -> dict:
+        """Return the config for ``machine``, generating it only on a cache miss.
+
+        ``extra_operations`` maps a unique name (e.g. ``"10.xy.lorentzian"``) to
+        each operation added to ``machine`` on top of what ``create_machine``
+        builds from ``params``.
+        """
+        key = self.key(params, extra_operations)
+
+        with self._lock:
+            config = self._configs.get(key)
+            if config is not None:
+                self._configs.move_to_end(key)
+                self.stats.hits += 1
+                return CowDict(config, cache_key=key)
+
+        config = machine.generate_config()
+
+        with self._lock:
+            self.stats.misses += 1
+            self._configs[key] = config
+            self._configs.move_to_end(key)
+            while len(self._configs) > self.maxsize:
+                self._configs.popitem(last=False)
+                self.stats.evictions += 1
+
+        return CowDict(config, cache_key=key)
+
+    def clear(self):
+        with self._lock:
+            self._configs.clear()
+
+    def __len__(self):
+        return len(self._configs)
+
+
+config_cache = ConfigCache()
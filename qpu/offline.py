@@ -0,0 +1,300 @@
+"""
+Local stand-ins for the Quantum Machines backend.
+
+These classes mimic the parts of the ``qm`` API used by this repo so that the
+host-side plumbing (connection pooling, experiment construction) can be
+exercised and benchmarked without an OPX on the network.
+
+``LocalQuantumMachinesManager.open_qm`` returns an ``OfflineQuantumMachine``
+that runs programs against ``qpu.transmon_model``. The QUA program itself is
+never interpreted: experiments record what they sweep with
+``BaseExperiment.describe_sweep(kind, **sweep)`` and, with
+``options.offline = True``, pass that description to
+``OfflineQuantumMachine.compile``. The fake job then serves synthetic result
+streams with the names and shapes the real stream processing produces.
+"""
+
+import threading
+import time
+from itertools import count
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+
+class LocalQuantumMachinesManager:
+    """Drop-in replacement for ``QuantumMachinesManager`` that never leaves the host.
+
+    ``connect_latency`` emulates the handshake a real manager performs on
+    construction, so pooling strategies can be compared offline.
+    """
+
+    connect_latency: float = 0.05
+
+    def __init__(
+        self,
+        host: Optional[str] = None,
+        port: Optional[int] = None,
+        connection_headers: Optional[Dict[str, str]] = None,
+        connect_latency: Optional[float] = None,
+    ):
+        self.host = host
+        self.port = port
+        self.connection_headers = connection_headers
+        if connect_latency is not None:
+            self.connect_latency = connect_latency
+        self.closed = False
+        self._open: Dict[str, "OfflineQuantumMachine"] = {}
+        self._qm_ids = count()
+
+        time.sleep(self.connect_latency)
+
+    def version(self):
+        if self.closed:
+            raise ConnectionError("LocalQuantumMachinesManager is closed")
+        return {"qm-qua": "offline", "QOP": "offline"}
+
+    def close_all_qms(self):
+        for qm in list(self._open.values()):
+            qm.close()
+
+    def close(self):
+        self.closed = True
+
+    def open_qm(self, config: dict, close_other_machines: bool = True):
+        if close_other_machines:
+            self.close_all_qms()
+        qm_id = f"offline-qm-{next(self._qm_ids)}"
+        qm = OfflineQuantumMachine(config, self.models, qm_id)
+        qm.on_close = lambda: self._open.pop(qm.id, None)
+        self._open[qm.id] = qm
+        return qm
+
+    def list_open_qms(self) -> List[str]:
+        return list(self._open)
+
+    def models(self, qubit):
+        """The ``TransmonModel`` of a transmon, created from its parameters."""
+        from qpu.transmon_model import TransmonModel
+
+        key = f"q{qubit.id}"
+        with _models_lock:
+            if key not in _models:
+                _models[key] = TransmonModel.from_node(qubit.parameters)
+            return _models[key]
+
+
+# Shared by all offline managers, so tweaks survive reconnects.
+_models: Dict[str, object] = {}
+_models_lock = threading.Lock()
+
+
+def model(qubit_id: str):
+    """The model of ``qubit_id`` (e.g. ``"q10"``), for emulating a miscalibration."""
+    from params import QPUConfig
+    from qpu.transmon_model import TransmonModel
+
+    with _models_lock:
+        if qubit_id not in _models:
+            _models[qubit_id] = TransmonModel.from_node(
+                QPUConfig.default().qubits[qubit_id]
+            )
+        return _models[qubit_id]
+
+
+def offline_manager(host: str = "offline", port: int = 0, connection_headers=None):
+    """Factory for ``qmm_pool``: an offline manager without connect latency."""
+    return LocalQuantumMachinesManager(host, port, connection_headers, connect_latency=0)
+
+
+# --------------------
+# QUANTUM MACHINE
+# --------------------
+class OfflineQuantumMachine:
+    def __init__(self, config: dict, models: Callable, id: str = "offline-qm"):
+        self.id = id
+        self.on_close: Optional[Callable] = None
+        self.config = config
+        self.models = models
+        self.queue = _Queue(self)
+        self.running_job: Optional["OfflineJob"] = None
+        self._sweeps: Dict[str, object] = {}
+        self._ids = count()
+
+    def compile(self, program, compiler_options=None, sweep=None) -> str:
+        """Register ``program`` with its ``sweep``, a ``(kind, arguments)`` pair.
+
+        ``kind`` names a generator in ``qpu.transmon_model.PROGRAMS`` and
+        ``arguments`` holds its keyword arguments (qubits, options, sweep
+        arrays), as recorded by ``BaseExperiment.describe_sweep``.
+        """
+        if sweep is None:
+            raise NotImplementedError(
+                "The offline backend needs a sweep description, "
+                "see BaseExperiment.describe_sweep"
+            )
+        program_id = f"offline-{next(self._ids)}"
+        self._sweeps[program_id] = sweep
+        return program_id
+
+    def execute(self, program, *args, sweep=None, **kwargs) -> "OfflineJob":
+        self.queue.clear()
+        program_id = self.compile(program, sweep=sweep)
+        return self.queue.add_compiled(program_id).wait_for_execution()
+
+    def simulate(self, *args, **kwargs):
+        raise NotImplementedError("The offline backend cannot simulate waveforms")
+
+    def get_running_job(self) -> Optional["OfflineJob"]:
+        job = self.running_job
+        return job if job is not None and job.result_handles.is_processing() else None
+
+    # Live updates pushed by QMSession; the model ignores them.
+    def set_mixer_correction(self, *args):
+        pass
+
+    def set_output_dc_offset_by_element(self, *args):
+        pass
+
+    def set_input_dc_offset_by_element(self, *args):
+        pass
+
+    def close(self):
+        self.running_job = None
+        if self.on_close is not None:
+            self.on_close()
+        return True
+
+
+class _Queue:
+    def __init__(self, qm: OfflineQuantumMachine):
+        self.qm = qm
+
+    def clear(self):
+        pass
+
+    def add_compiled(self, program_id: str) -> "_PendingJob":
+        return _PendingJob(self.qm, self.qm._sweeps[program_id])
+
+
+class _PendingJob:
+    def __init__(self, qm: OfflineQuantumMachine, sweep):
+        self.qm = qm
+        self.sweep = sweep
+
+    def wait_for_execution(self, timeout: float = None) -> "OfflineJob":
+        self.qm.running_job = OfflineJob(self.sweep, self.qm.models)
+        return self.qm.running_job
+
+
+# --------------------
+# JOB
+# --------------------
+class OfflineJob:
+    """A running program whose averages improve with (scaled) wall time.
+
+    With ``time_scale = 0`` (default) the job finishes instantly. With
+    ``time_scale = 1`` it takes as long as the real shots would, so live
+    fetching and early stopping see partial averages.
+    """
+
+    time_scale: float = 0.0
+
+    def __init__(self, sweep, models: Callable, seed: Optional[int] = None):
+        from qpu.transmon_model import PROGRAMS, reset_streams, shot_time
+
+        kind, arguments = sweep
+        rng = np.random.default_rng(seed)
+        self.streams = PROGRAMS[kind](models, rng, **arguments)
+        self.streams.update(
+            reset_streams(models, arguments["qubits"], arguments["options"])
+        )
+        self.n_avg = arguments["options"].n_avg
+
+        # Fixed unit noise per averaged stream, scaled by 1/sqrt(averages).
+        self._noise = {
+            name: rng.standard_normal(np.shape(stream.values))
+            for name, stream in self.streams.items()
+            if not stream.raw
+        }
+
+        points = max((np.size(v) for v in self._noise.values()), default=1)
+        self.duration = self.time_scale * self.n_avg * points * shot_time(
+            models, arguments["qubits"]
+        )
+        self.start = time.monotonic()
+        self.halted_at: Optional[int] = None
+        self.result_handles = _ResultHandles(self)
+
+    @property
+    def iterations(self) -> int:
+        """Averages completed so far."""
+        if self.halted_at is not None:
+            return self.halted_at
+        if self.duration <= 0:
+            return self.n_avg
+        elapsed = time.monotonic() - self.start
+        return int(np.clip(self.n_avg * elapsed / self.duration, 1, self.n_avg))
+
+    def value(self, name: str):
+        k = self.iterations
+        if name == "iteration":
+            return k - 1
+        stream = self.streams[name]
+        if stream.raw:
+            return stream.values[:k] if k < self.n_avg else stream.values
+        return stream.values + stream.sigma / np.sqrt(k) * self._noise[name]
+
+    def halt(self):
+        self.halted_at = self.iterations
+        return True
+
+    cancel = halt
+
+
+class _ResultHandle:
+    def __init__(self, job: OfflineJob, name: str):
+        self.job = job
+        self.name = name
+
+    def fetch_all(self):
+        return self.job.value(self.name)
+
+    def wait_for_values(self, count: int = 1, timeout: float = None):
+        pass
+
+    def wait_for_all_values(self, timeout: float = None):
+        self.job.result_handles.wait_for_all_values(timeout)
+
+    def count_so_far(self) -> int:
+        return self.job.iterations
+
+
+class _ResultHandles:
+    def __init__(self, job: OfflineJob):
+        self._job = job
+
+    def keys(self):
+        return list(self._job.streams) + ["iteration"]
+
+    def get(self, name: str) -> _ResultHandle:
+        return _ResultHandle(self._job, name)
+
+    def __getattr__(self, name: str) -> _ResultHandle:
+        if name.startswith("_") or name not in self.keys():
+            raise AttributeError(name)
+        return self.get(name)
+
+    def is_processing(self) -> bool:
+        return self._job.iterations < self._job.n_avg and self._job.halted_at is None
+
+    def wait_for_all_values(self, timeout: float = None) -> bool:
+        while self.is_processing():
+            time.sleep(0.01)
+        return True
+
+    def fetch_results(self, wait_until_done: bool = True, stream_names=None) -> dict:
+        if wait_until_done:
+            self.wait_for_all_values()
+        names = self.keys() if stream_names is None else stream_names
+        return {name: self._job.value(name) for name in names}
@@ -0,0 +1,216 @@
+"""
+Reuse of an open Quantum Machine across executions.
+
+``qmm.open_qm(config)`` closes whatever machine is running and uploads the
+full config to the server. A ``QMSession`` keeps the machine open and only
+reopens it when the config actually changed, or when the machine was closed
+behind its back. Changes that do not touch an element's IF/LO pair (mixer
+corrections of existing pairs and DC offsets) are pushed to the running
+machine in place instead of reopening. A new intermediate frequency always
+changes the element's mixer entry, which the QOP only accepts for pairs
+already in the config, so it reopens the machine.
+"""
+
+import atexit
+import hashlib
+import json
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+
+Path = Tuple[str, ...]
+
+
+@dataclass
+class SessionStats:
+    opens: int = 0
+    reuses: int = 0
+    in_place_updates: int = 0
+
+    @property
+    def opens_avoided(self) -> int:
+        return self.reuses + self.in_place_updates
+
+
+def _json_default(value):
+    return value.tolist() if hasattr(value, "tolist") else str(value)
+
+
+def config_hash(config: dict) -> str:
+    """Content hash of a QUA config, reusing the config cache key when intact."""
+    cache_key = getattr(config, "cache_key", None)
+    if cache_key is not None:
+        return cache_key
+    payload = json.dumps(config, sort_keys=True, default=_json_default)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def _normalize(config: dict) -> dict:
+    """Plain JSON copy of ``config`` (string keys, lists instead of tuples)."""
+    return json.loads(json.dumps(config, default=_json_default))
+
+
+def _flatten(config: dict, prefix: Path = ()) -> Dict[Path, object]:
+    flat = {}
+    for key, value in config.items():
+        path = prefix + (str(key),)
+        if isinstance(value, dict):
+            flat.update(_flatten(value, path))
+        else:
+            flat[path] = value
+    return flat
+
+
+def _port_owners(config: dict, field: str) -> Dict[Tuple[str, str], Tuple[str, str]]:
+    """Map ``(controller, port)`` to the ``(element, input/output name)`` using it."""
+    owners = {}
+    for element, element_cfg in config.get("elements", {}).items():
+        for name, port in element_cfg.get(field, {}).items():
+            if isinstance(port, (tuple, list)) and len(port) == 2:
+                owners.setdefault((str(port[0]), str(port[1])), (element, name))
+    return owners
+
+
+def _mixer_pairs(entries) -> List[Tuple[int, int]]:
+    return sorted(
+        (int(e["intermediate_frequency"]), int(e["lo_frequency"])) for e in entries
+    )
+
+
+def in_place_updates(old: dict, new: dict) -> Optional[List[Tuple]]:
+    """Translate the difference between two configs into live QM calls.
+
+    Both configs must be normalized with ``_normalize``. Returns a list of
+    ``(method_name, *args)`` tuples, or ``None`` if any of the changes requires
+    the machine to be reopened (e.g. new waveforms, which is how pulse
+    amplitudes are represented in the config, or a new intermediate
+    frequency). Mixer corrections can only be set for IF/LO pairs the open
+    machine already has, so a changed pair also needs a reopen.
+    """
+    old_flat = _flatten(old)
+    new_flat = _flatten(new)
+    if old_flat.keys() != new_flat.keys():
+        return None
+
+    outputs = _port_owners(new, "mixInputs")
+    inputs = _port_owners(new, "outputs")
+
+    updates = []
+    for path, value in new_flat.items():
+        if old_flat[path] == value:
+            continue
+
+        if path[0] == "mixers" and len(path) == 2:
+            if _mixer_pairs(value) != _mixer_pairs(old_flat[path]):
+                return None
+            for entry in value:
+                updates.append(
+                    (
+                        "set_mixer_correction",
+                        path[1],
+                        int(entry["intermediate_frequency"]),
+                        int(entry["lo_frequency"]),
+                        tuple(entry["correction"]),
+                    )
+                )
+        elif path[0] == "controllers" and path[-1] == "offset":
+            _, controller, ports, port, _ = path
+            owners = outputs if ports == "analog_outputs" else inputs
+            owner = owners.get((controller, port))
+            if owner is None:
+                return None
+            method = (
+                "set_output_dc_offset_by_element"
+                if ports == "analog_outputs"
+                else "set_input_dc_offset_by_element"
+            )
+            updates.append((method, owner[0], owner[1], value))
+        else:
+            return None
+
+    return updates
+
+
+class QMSession:
+    """Keeps a single Quantum Machine open on ``qmm`` for as long as possible."""
+
+    def __init__(self, qmm):
+        self.qmm = qmm
+        self.qm = None
+        self.config = None
+        self.config_key = None
+        self.stats = SessionStats()
+
+    def open(self, config: dict):
+        """Return a Quantum Machine running ``config``, reopening only if needed."""
+        key = config_hash(config)
+
+        if self.qm is not None and not self._is_open():
+            self.qm, self.config, self.config_key = None, None, None
+
+        if self.qm is not None and key == self.config_key:
+            self.stats.reuses += 1
+            return self.qm
+
+        # Private snapshot: the caller may keep mutating its own dict.
+        snapshot = _normalize(config)
+
+        if self.qm is not None:
+            updates = in_place_updates(self.config, snapshot)
+            if updates is not None:
+                for method, *args in updates:
+                    getattr(self.qm, method)(*args)
+                if updates:
+                    self.stats.in_place_updates += 1
+                else:
+                    self.stats.reuses += 1
+                self.config, self.config_key = snapshot, key
+                return self.qm
+
+        self.qm = self.qmm.open_qm(config)
+        self.stats.opens += 1
+        self.config, self.config_key = snapshot, key
+        return self.qm
+
+    def _is_open(self) -> bool:
+        """Whether the held machine is still open (another client may close it)."""
+        try:
+            return self.qm.id in self.qmm.list_open_qms()
+        except Exception:
+            return False
+
+    def close(self):
+        if self.qm is not None:
+            self.qm.close()
+        self.qm = None
+        self.config = None
+        self.config_key = None
+
+    def summary(self) -> str:
+        return (
+            f"QM session: {self.stats.opens} opens, "
+            f"{self.stats.reuses} reuses, "
+            f"{self.stats.in_place_updates} in-place updates "
+            f"({self.stats.opens_avoided} opens avoided)"
+        )
+
+
+_sessions: Dict[int, QMSession] = {}
+
+
+def qm_session(qmm) -> QMSession:
+    """The session bound to ``qmm`` (one open machine per manager)."""
+    session = _sessions.get(id(qmm))
+    if session is None or session.qmm is not qmm:
+        session = QMSession(qmm)
+        _sessions[id(qmm)] = session
+    return session
+
+
+def _report():
+    for session in _sessions.values():
+        if session.stats.opens or session.stats.opens_avoided:
+            print(session.summary())
+
+
+atexit.register(_report)
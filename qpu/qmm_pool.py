@@ -0,0 +1,166 @@
+"""
+Process-wide pool of QuantumMachinesManager connections.
+
+Constructing a ``QuantumMachinesManager`` performs a network handshake with the
+QOP server. Experiments borrow managers from ``qmm_pool`` instead, so a sweep
+that builds many experiment objects only connects once per (host, port, headers).
+"""
+
+import atexit
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Tuple
+
+from qm import QuantumMachinesManager
+
+from qpu.config import qm_host, qm_port
+
+
+PoolKey = Tuple[str, int, Tuple[Tuple[str, str], ...]]
+
+
+@dataclass
+class PoolStats:
+    requests: int = 0
+    connects: int = 0
+    reconnects: int = 0
+    connect_time: float = 0.0
+
+    @property
+    def reuse_rate(self) -> float:
+        if self.requests == 0:
+            return 0.0
+        return 1 - self.connects / self.requests
+
+    @property
+    def mean_connect_time(self) -> float:
+        if self.connects == 0:
+            return 0.0
+        return self.connect_time / self.connects
+
+
+@dataclass
+class _PoolEntry:
+    qmm: object
+    last_check: float
+
+
+class QMMPool:
+    """Registry of open managers keyed by (host, port, connection headers).
+
+    Managers are created lazily on first request. A borrowed manager is
+    health-checked at most once every ``health_check_interval`` seconds and is
+    transparently replaced if the check fails.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[..., object] = QuantumMachinesManager,
+        health_check_interval: float = 30.0,
+    ):
+        self.factory = factory
+        self.health_check_interval = health_check_interval
+        self.stats = PoolStats()
+        self._entries: Dict[PoolKey, _PoolEntry] = {}
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _key(host, port, connection_headers) -> PoolKey:
+        headers = tuple(sorted((connection_headers or {}).items()))
+        return (host, port, headers)
+
+    def get(
+        self,
+        host: str = qm_host,
+        port: int = qm_port,
+        connection_headers: Optional[Dict[str, str]] = None,
+        factory: Optional[Callable[..., object]] = None,
+    ):
+        """Borrow the manager for ``(host, port, connection_headers)``."""
+        key = self._key(host, port, connection_headers)
+
+        with self._lock:
+            self.stats.requests += 1
+            entry = self._entries.get(key)
+
+            if entry is not None:
+                now = time.monotonic()
+                if now - entry.last_check < self.health_check_interval:
+                    return entry.qmm
+                if self._is_healthy(entry.qmm):
+                    entry.last_check = now
+                    return entry.qmm
+                self._close(entry.qmm)
+                self.stats.reconnects += 1
+
+            qmm = self._connect(host, port, connection_headers, factory or self.factory)
+            self._entries[key] = _PoolEntry(qmm=qmm, last_check=time.monotonic())
+            return qmm
+
+    def invalidate(
+        self,
+        host: str = qm_host,
+        port: int = qm_port,
+        connection_headers: Optional[Dict[str, str]] = None,
+    ):
+        """Drop (and close) a pooled manager; the next ``get`` reconnects."""
+        with self._lock:
+            entry = self._entries.pop(self._key(host, port, connection_headers), None)
+        if entry is not None:
+            self._close(entry.qmm)
+
+    def shutdown(self):
+        """Close every pooled manager."""
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for entry in entries:
+            self._close(entry.qmm)
+
+    def __len__(self):
+        return len(self._entries)
+
+    # --------------------
+    # INTERNALS
+    # --------------------
+    def _connect(self, host, port, connection_headers, factory):
+        kwargs = dict(host=host, port=port)
+        if connection_headers:
+            kwargs["connection_headers"] = connection_headers
+
+        start = time.perf_counter()
+        qmm = factory(**kwargs)
+        self.stats.connect_time += time.perf_counter() - start
+        self.stats.connects += 1
+        return qmm
+
+    @staticmethod
+    def _is_healthy(qmm) -> bool:
+        try:
+            qmm.version()
+        except Exception:
+            return False
+        return True
+
+    @staticmethod
+    def _close(qmm):
+        close = getattr(qmm, "close", None)
+        if close is None:
+            return
+        try:
+            close()
+        except Exception:
+            pass
+
+
+qmm_pool = QMMPool()
+atexit.register(qmm_pool.shutdown)
+
+
+def get_qmm(
+    host: str = qm_host,
+    port: int = qm_port,
+    connection_headers: Optional[Dict[str, str]] = None,
+):
+    return qmm_pool.get(host=host, port=port, connection_headers=connection_headers)
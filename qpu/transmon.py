@@ -12,19 +12,90 @@ from params import QPUConfig
 
 from qpu.config import BASE_DIR
 import numpy as np
+from typing import Dict, List
+
+
+class _Parameters:
+    """``KatzTransmon.parameters``: the ``QPUNode`` bound by ``create_machine``.
+
+    Falls back to the shared default config, looked up only when accessed so
+    that importing this module does not read the parameter files.
+    """
+
+    def __get__(self, transmon, owner=None):
+        if transmon is None:
+            return self
+        node = transmon.__dict__.get("_parameters")
+        if node is None:
+            node = QPUConfig.default().qubits.get(f"q{transmon.id}")
+        return node
+
+    def __set__(self, transmon, node):
+        transmon.__dict__["_parameters"] = node
 
 
 class KatzTransmon(Transmon):
-    parameters = QPUConfig().qubits["q10"]
+    parameters = _Parameters()
+
 
+def create_machine(params: QPUConfig, qubits: List[str] = None):
+    """Quam machine with every qubit of ``params`` (or only ``qubits``).
 
-def create_machine(params: QPUConfig):
+    Resonators that share OPX output ports form a feedline and are frequency
+    multiplexed: they share the readout input ports and are told apart by
+    their intermediate frequency, so they can be measured in the same
+    acquisition window.
+    """
     machine = Quam()
     controller = "con1"
-    transmon = KatzTransmon(id="10")
-    qubit_params = params.qubits["q10"].qubit
-    resonator_params = params.qubits["q10"].resonator
-    gates = params.qubits["q10"].gates
+    qubit_ids = list(params.qubits) if qubits is None else list(qubits)
+
+    for qubit_id in qubit_ids:
+        transmon = _create_transmon(qubit_id, params.qubits[qubit_id], controller)
+        machine.qubits[transmon.name] = transmon
+
+    _check_feedlines(params, qubit_ids)
+
+    return machine
+
+
+def feedline_of(node) -> str:
+    """Feedline name of a ``QPUNode``: explicit, or named after its output ports."""
+    resonator = node.resonator
+    if resonator.feedline is not None:
+        return resonator.feedline
+    return f"feedline_{resonator.IQ_input.I}_{resonator.IQ_input.Q}"
+
+
+def feedlines(params: QPUConfig, qubits: List[str] = None) -> Dict[str, List[str]]:
+    """Qubit ids grouped by the feedline their resonator sits on."""
+    groups = {}
+    for qubit_id in params.qubits if qubits is None else qubits:
+        groups.setdefault(feedline_of(params.qubits[qubit_id]), []).append(qubit_id)
+    return groups
+
+
+def _check_feedlines(params: QPUConfig, qubit_ids: List[str]):
+    for feedline, members in feedlines(params, qubit_ids).items():
+        resonators = [params.qubits[q].resonator for q in members]
+        if len({r.resonator_LO for r in resonators}) > 1:
+            raise ValueError(f"Resonators on {feedline} must share one LO: {members}")
+        if len({(r.readout_input.I, r.readout_input.Q) for r in resonators}) > 1:
+            raise ValueError(
+                f"Resonators on {feedline} must share the readout inputs: {members}"
+            )
+        if len({r.IF_freq for r in resonators}) < len(resonators):
+            raise ValueError(
+                f"Resonators on {feedline} need distinct frequencies: {members}"
+            )
+
+
+def _create_transmon(qubit_id: str, node, controller: str) -> KatzTransmon:
+    transmon = KatzTransmon(id=qubit_id[1:])
+    transmon.parameters = node
+    qubit_params = node.qubit
+    resonator_params = node.resonator
+    gates = node.gates
 
     transmon.xy = IQChannel(
         opx_output_I=(controller, qubit_params.IQ_input.I),
@@ -45,8 +116,8 @@ def create_machine(params: QPUConfig):
 
     transmon.resonator = InOutIQChannel(
         id=transmon.name,
-        opx_input_I=(controller, 1),
-        opx_input_Q=(controller, 2),
+        opx_input_I=(controller, resonator_params.readout_input.I),
+        opx_input_Q=(controller, resonator_params.readout_input.Q),
         opx_output_I=(controller, resonator_params.IQ_input.I),
         opx_output_Q=(controller, resonator_params.IQ_input.Q),
         opx_output_offset_I=resonator_params.IQ_bias.I,
@@ -85,9 +156,7 @@ def create_machine(params: QPUConfig):
         axis_angle=resonator_params.rotation_angle / 180 * np.pi,
     )
 
-    machine.qubits[transmon.name] = transmon
-
-    return machine
+    return transmon
 
 
 if __name__ == "__main__":
@@ -0,0 +1,366 @@
+"""
+Physics model of a dispersively read out transmon, for the offline backend.
+
+``TransmonModel`` holds the "true" parameters of one qubit, initialised from
+its ``QPUConfig`` node. Tweak its fields to emulate a miscalibrated device,
+e.g. ``model.qubit_freq += 0.5e6``. The program generators below turn the
+sweep an experiment describes (see ``BaseExperiment.describe_sweep``) into
+the result streams the real stream processing would produce.
+
+The model:
+
+* The readout resonator is a notch-type Lorentzian. It sits at
+  ``resonator_freq + chi`` with the qubit in ground and at
+  ``resonator_freq - chi`` in excited, so the calibrated frequency is the
+  point of best separation. IQ is scaled and rotated (never offset) so that,
+  at that frequency, the excited blob lies ``separation`` away from the
+  ground blob along +I, as after a calibrated rotation angle. ``state``
+  streams compare I with the threshold of the program's qubit, like the
+  QUA code does, so they are meaningful once the threshold is calibrated.
+* An excited qubit decays during the readout window with ``T1``, which
+  smears its blob towards ground.
+* Rabi rotations scale linearly with the drive amplitude, ``pi_amplitude``
+  being the true pi pulse. Saturation spectroscopy follows the steady state
+  of a driven two-level system, with linewidth from ``T2``.
+* Every shot starts in the excited state with probability ``p_thermal``, and
+  an excited qubit relaxes back to it with ``T1``.
+
+Averaged streams are returned as the expectation value with the per-shot
+standard deviation, so the backend can add noise for any number of averages
+without drawing every shot. Raw-shot streams draw every shot.
+"""
+
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+import numpy as np
+from scipy.special import ndtr
+
+from experiments.core.multiplexing import stream_name
+
+
+@dataclass
+class Stream:
+    """One result stream: averaged (``values`` is the mean, ``sigma`` per shot) or raw."""
+
+    values: np.ndarray
+    sigma: Optional[np.ndarray] = None  # None for raw shots (n_avg along axis 0)
+
+    @property
+    def raw(self) -> bool:
+        return self.sigma is None
+
+
+@dataclass
+class TransmonModel:
+    resonator_freq: float
+    qubit_freq: float
+    pi_amplitude: float
+    readout_amplitude: float
+    readout_length: float  # s
+    T1: float  # s
+    T2: float  # s
+    chi: float = 0.4e6  # Hz, half the dispersive shift
+    kappa: float = 1.5e6  # Hz, resonator linewidth
+    coupling: float = 0.9  # depth of the notch
+    separation: float = 1.2e-3  # |I_e - I_g| at the calibrated readout point
+    noise: float = 3e-4  # per-shot standard deviation of I and Q
+    p_thermal: float = 0.03
+    saturation_rabi: float = 0.3e6  # Hz, Rabi frequency of the saturation pulse
+    saturation_amplitude: float = 0.4  # amplitude at which it is reached
+
+    @classmethod
+    def from_node(cls, node) -> "TransmonModel":
+        return cls(
+            resonator_freq=node.resonator.resonator_freq,
+            qubit_freq=node.qubit.qubit_ge_freq,
+            pi_amplitude=node.gates.square_gate.amplitude,
+            readout_amplitude=node.gates.readout_pulse.amplitude,
+            readout_length=node.gates.readout_pulse.length * 1e-9,
+            T1=node.qubit.T1 * 1e-9,
+            T2=node.qubit.T2 * 1e-9,
+            saturation_amplitude=node.gates.saturation_pulse.amplitude,
+        )
+
+    # --------------------
+    # READOUT
+    # --------------------
+    def _response(self, frequency, excited):
+        center = self.resonator_freq + np.where(excited, -self.chi, self.chi)
+        return 1 - self.coupling / (1 + 2j * (frequency - center) / self.kappa)
+
+    def iq(self, frequency, excited, amplitude: float = None) -> np.ndarray:
+        """Noise-free IQ (complex) of the resonator at ``frequency``."""
+        amplitude = self.readout_amplitude if amplitude is None else amplitude
+        delta = self._response(self.resonator_freq, True) - self._response(
+            self.resonator_freq, False
+        )
+        frame = self.separation / delta * amplitude / self.readout_amplitude
+        return frame * self._response(frequency, excited)
+
+    def decay_fraction(self) -> float:
+        """Mean fraction of the readout window an excited qubit stays excited."""
+        ratio = self.readout_length / self.T1
+        return (1 - np.exp(-ratio)) / ratio if ratio > 0 else 1.0
+
+    def readout(
+        self,
+        p_excited,
+        frequency,
+        threshold: float,
+        n_avg: int,
+        raw: bool,
+        rng: np.random.Generator,
+        amplitude: float = None,
+    ) -> Dict[str, Stream]:
+        """``I``, ``Q`` and ``state`` (``I > threshold``) streams at each point."""
+        p_excited = np.asarray(p_excited, dtype=float)
+        frequency = np.broadcast_to(frequency, p_excited.shape)
+        z_g = self.iq(frequency, False, amplitude)
+        z_e = self.iq(frequency, True, amplitude)
+
+        if raw:
+            shape = (n_avg,) + p_excited.shape
+            excited = rng.random(shape) < p_excited
+            # Time spent excited before decaying, as a fraction of the window.
+            stay = np.minimum(
+                rng.exponential(self.T1, shape) / self.readout_length, 1.0
+            )
+            z = np.where(excited, z_g + stay * (z_e - z_g), z_g)
+            I = z.real + self.noise * rng.standard_normal(shape)
+            Q = z.imag + self.noise * rng.standard_normal(shape)
+            return {
+                "I": Stream(I),
+                "Q": Stream(Q),
+                "state": Stream((I > threshold).astype(float)),
+            }
+
+        z_e = z_g + self.decay_fraction() * (z_e - z_g)
+        p_g = 1 - p_excited
+        mean = p_g * z_g + p_excited * z_e
+        spread = p_g * p_excited
+        state = p_g * ndtr((z_g.real - threshold) / self.noise) + p_excited * ndtr(
+            (z_e.real - threshold) / self.noise
+        )
+        return {
+            "I": Stream(mean.real, np.sqrt(self.noise**2 + spread * (z_e - z_g).real ** 2)),
+            "Q": Stream(mean.imag, np.sqrt(self.noise**2 + spread * (z_e - z_g).imag ** 2)),
+            "state": Stream(state, np.sqrt(state * (1 - state))),
+        }
+
+    def active_reset(self, threshold: float, rounds: int):
+        """Residual excited population and mean flips of ``ActiveReset``.
+
+        Each round flips the qubit if it reads excited: an excited qubit read
+        as ground stays excited, a ground one read as excited gets excited.
+        """
+        z_g = self.iq(self.resonator_freq, False)
+        z_e = z_g + self.decay_fraction() * (self.iq(self.resonator_freq, True) - z_g)
+        false_excited = ndtr((z_g.real - threshold) / self.noise)
+        missed = 1 - ndtr((z_e.real - threshold) / self.noise)
+
+        p = self.p_thermal
+        flips = flips_var = 0.0
+        for _ in range(rounds):
+            read_excited = p * (1 - missed) + (1 - p) * false_excited
+            flips += read_excited
+            flips_var += read_excited * (1 - read_excited)
+            p = p * missed + (1 - p) * false_excited
+        residual = p * (1 - missed) + (1 - p) * false_excited  # verification read
+        return residual, flips, flips_var
+
+    # --------------------
+    # DRIVE
+    # --------------------
+    def rotation(self, amplitude):
+        """Excited population after a pulse from ground (thermal start included)."""
+        theta = np.pi * np.asarray(amplitude) / self.pi_amplitude
+        return self.p_thermal + (1 - 2 * self.p_thermal) * np.sin(theta / 2) ** 2
+
+    def relaxation(self, p_excited, duration):
+        """Excited population after ``duration`` (s) of free decay towards thermal."""
+        decay = np.exp(-np.asarray(duration) / self.T1)
+        return self.p_thermal + (p_excited - self.p_thermal) * decay
+
+    def saturation(self, frequency, amplitude):
+        """Steady-state excited population under a long drive at ``frequency``."""
+        omega = self.saturation_rabi * amplitude / self.saturation_amplitude
+        gamma = 1 / (np.pi * self.T2)
+        detuning = np.asarray(frequency) - self.qubit_freq
+        p = 0.25 * omega**2 / (detuning**2 + 0.5 * omega**2 + 0.25 * gamma**2)
+        return self.p_thermal + (1 - 2 * self.p_thermal) * p
+
+
+# --------------------
+# PROGRAMS
+# --------------------
+def _drive_freq(qubit):
+    return qubit.xy.LO_frequency - qubit.xy.intermediate_frequency
+
+
+def _readout_freq(qubit):
+    rr = qubit.resonator
+    return rr.frequency_converter_up.LO_frequency - rr.intermediate_frequency
+
+
+def _threshold(qubit):
+    return qubit.parameters.resonator.threshold
+
+
+def _operation_amplitude(channel, name):
+    return channel.operations[name].amplitude
+
+
+def _averaged(streams: Dict[str, Stream], n_avg: int, options) -> Dict[str, Stream]:
+    """Apply ``save_stream``'s naming: add ``_sq`` streams when error bars are on."""
+    out = dict(streams)
+    if not options.raw_shots and options.error_bars:
+        for name, stream in streams.items():
+            out[f"{name}_sq"] = Stream(stream.values**2 + stream.sigma**2, 0 * stream.sigma)
+    return out
+
+
+def iq_blobs(models, rng, qubits, options):
+    streams = {}
+    for qubit in qubits:
+        model = models(qubit)
+        f = _readout_freq(qubit)
+        x180 = _operation_amplitude(qubit.xy, "X180")
+        threshold = _threshold(qubit)
+        ground = model.readout(model.p_thermal, f, threshold, options.n_avg, True, rng)
+        excited = model.readout(
+            model.rotation(x180), f, threshold, options.n_avg, True, rng
+        )
+        for suffix, result in (("g", ground), ("e", excited)):
+            streams[stream_name(qubit, f"I{suffix}")] = result["I"]
+            streams[stream_name(qubit, f"Q{suffix}")] = result["Q"]
+    return streams
+
+
+def resonator_spectroscopy(models, rng, qubits, options, detunings):
+    raw = options.raw_shots
+    streams = {}
+    for qubit in qubits:
+        model = models(qubit)
+        f = _readout_freq(qubit) - np.asarray(detunings)
+        x180 = _operation_amplitude(qubit.xy, "X180")
+        populations = {"1": model.p_thermal, "2": model.rotation(x180)}
+        for suffix, p in populations.items():
+            result = model.readout(
+                np.full(f.shape, p), f, _threshold(qubit), options.n_avg, raw, rng
+            )
+            result = _averaged({n: result[n] for n in ("I", "Q")}, options.n_avg, options)
+            for name, stream in result.items():
+                # I -> I1, Q_sq -> Q1_sq
+                streams[stream_name(qubit, name[0] + suffix + name[1:])] = stream
+    return streams
+
+
+def qubit_spectroscopy(models, rng, qubits, options, detunings):
+    raw = options.raw_shots
+    streams = {}
+    for qubit in qubits:
+        model = models(qubit)
+        f_drive = _drive_freq(qubit) - np.asarray(detunings)
+        p = model.saturation(f_drive, _operation_amplitude(qubit.xy, "saturation"))
+        result = model.readout(
+            p, _readout_freq(qubit), _threshold(qubit), options.n_avg, raw, rng
+        )
+        for name, stream in _averaged(result, options.n_avg, options).items():
+            streams[stream_name(qubit, name)] = stream
+    return streams
+
+
+def power_rabi(models, rng, qubits, options, amplitudes):
+    streams = {}
+    for qubit in qubits:
+        model = models(qubit)
+        x180 = _operation_amplitude(qubit.xy, "X180")
+        angle = options.num_pis * np.asarray(amplitudes) * x180
+        result = model.readout(
+            model.rotation(angle),
+            _readout_freq(qubit),
+            _threshold(qubit),
+            options.n_avg,
+            False,
+            rng,
+        )
+        for name, stream in result.items():
+            streams[stream_name(qubit, name)] = stream
+    return streams
+
+
+def fine_rabi(models, rng, qubits, options, reps):
+    (qubit,) = qubits
+    model = models(qubit)
+    # i half-pi pulses at the i-th point
+    angle = 0.5 * _operation_amplitude(qubit.xy, "X180") * np.arange(reps)
+    return model.readout(
+        model.rotation(angle),
+        _readout_freq(qubit),
+        _threshold(qubit),
+        options.n_avg,
+        False,
+        rng,
+    )
+
+
+def drive_spectroscopy_2d(models, rng, qubits, options, frequencies_IF, amplitudes):
+    """Frequency x amplitude map of a long drive pulse, taken as saturating."""
+    (qubit,) = qubits
+    model = models(qubit)
+    f_drive = qubit.xy.LO_frequency - np.asarray(frequencies_IF)
+    drive = np.asarray(amplitudes) * _operation_amplitude(qubit.xy, "lorentzian")
+    p = model.saturation(f_drive[:, None], drive[None, :])
+    return model.readout(
+        p, _readout_freq(qubit), _threshold(qubit), options.n_avg, False, rng
+    )
+
+
+def thermalization(models, rng, qubits, options, waits):
+    """Readout ``waits`` (ns) after a pi pulse."""
+    streams = {}
+    for qubit in qubits:
+        model = models(qubit)
+        x180 = _operation_amplitude(qubit.xy, "X180")
+        p = model.relaxation(model.rotation(x180), np.asarray(waits) * 1e-9)
+        result = model.readout(
+            p, _readout_freq(qubit), _threshold(qubit), options.n_avg, False, rng
+        )
+        for name, stream in result.items():
+            streams[stream_name(qubit, name)] = stream
+    return streams
+
+
+PROGRAMS = {
+    "iq_blobs": iq_blobs,
+    "resonator_spectroscopy": resonator_spectroscopy,
+    "qubit_spectroscopy": qubit_spectroscopy,
+    "power_rabi": power_rabi,
+    "fine_rabi": fine_rabi,
+    "drive_spectroscopy_2d": drive_spectroscopy_2d,
+    "thermalization": thermalization,
+}
+
+
+def reset_streams(models, qubits, options) -> Dict[str, Stream]:
+    """The ``ActiveReset`` metric streams, when the program saves them."""
+    if not (options.active_reset and options.reset_metrics):
+        return {}
+    streams = {}
+    for qubit in qubits:
+        residual, flips, flips_var = models(qubit).active_reset(
+            _threshold(qubit), options.reset_rounds
+        )
+        streams[stream_name(qubit, "reset_residual")] = Stream(
+            np.asarray(residual), np.sqrt(residual * (1 - residual))
+        )
+        streams[stream_name(qubit, "reset_flips")] = Stream(
+            np.asarray(flips), np.sqrt(flips_var)
+        )
+    return streams
+
+
+def shot_time(models, qubits) -> float:
+    """Rough duration of one shot: thermalization plus readout (seconds)."""
+    return max(5 * models(q).T1 + models(q).readout_length for q in qubits)
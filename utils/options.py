@@ -15,3 +15,11 @@ class Options:
     simulate_duration: float = 100 * u.us
     state_discrimination: bool = False
     active_reset: bool = False
+    reset_rounds: int = 2  # measure-and-flip rounds of the active reset
+    reset_wait: int = 1 * u.us  # ns of resonator ring-down after each round
+    reset_strategy: str = "condition"  # flip with play(condition=...) or "if"
+    reset_metrics: bool = False  # stream residual population and flips per reset
+    early_stop_target: Optional[float] = None  # convergence score that halts the job
+    early_stop_min_avg: int = 50  # averages before convergence is checked
+    max_multiplexed: int = 8  # resonators read out together on one feedline
+    offline: bool = False  # run against the local transmon model (qpu.offline)